@@ -3,9 +3,10 @@ import { Avatar, AvatarFallback } from '@/components/ui/avatar';
 interface TypingIndicatorProps {
   llmName: string;
   brandColor?: string;
+  content?: string;
 }
 
-export function TypingIndicator({ llmName, brandColor }: TypingIndicatorProps) {
+export function TypingIndicator({ llmName, brandColor, content }: TypingIndicatorProps) {
   return (
     <div className="flex gap-3 mb-4">
       <Avatar 
@@ -27,11 +28,17 @@ export function TypingIndicator({ llmName, brandColor }: TypingIndicatorProps) {
 
       <div className="flex flex-col items-start">
         <span className="text-sm font-medium mb-1">{llmName}</span>
-        <div className="message-assistant px-4 py-3 flex items-center gap-1">
-          <span className="typing-dot" />
-          <span className="typing-dot" />
-          <span className="typing-dot" />
-        </div>
+        {content ? (
+          <div className="message-assistant p-4">
+            <div className="text-sm whitespace-pre-wrap">{content}</div>
+          </div>
+        ) : (
+          <div className="message-assistant px-4 py-3 flex items-center gap-1">
+            <span className="typing-dot" />
+            <span className="typing-dot" />
+            <span className="typing-dot" />
+          </div>
+        )}
       </div>
     </div>
   );
@@ -14,6 +14,7 @@ const PROVIDER_TYPES = [
   { value: 'kimi', label: 'Kimi Moonshot', defaultModel: 'moonshot-v1-8k', color: '#3b82f6' },
   { value: 'qwen', label: '通义千问', defaultModel: 'qwen-turbo', color: '#1677ff' },
   { value: 'zhipu', label: '智谱 GLM', defaultModel: 'glm-4', color: '#1a1a1a' },
+  { value: 'mock', label: 'Mock（离线测试）', defaultModel: 'mock', color: '#6b7280' },
 ];
 
 interface ProviderFormProps {
@@ -5,6 +5,7 @@ import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import { Slider } from '@/components/ui/slider';
+import { Switch } from '@/components/ui/switch';
 import { Badge } from '@/components/ui/badge';
 import { Check, Cpu, Settings2 } from 'lucide-react';
 import type { LLMProvider, SessionCreate } from '@/types';
@@ -32,6 +33,7 @@ export function CreateSessionModal({
     max_rounds: 5,
     temperature: 0.7,
     max_tokens: 2000,
+    round_mode: 'sequential',
   });
 
   const onlineProviders = providers.filter(p => p.status === 'online');
@@ -62,6 +64,7 @@ export function CreateSessionModal({
         max_rounds: 5,
         temperature: 0.7,
         max_tokens: 2000,
+        round_mode: 'sequential',
       });
     } catch (error) {
       console.error('Failed to create session:', error);
@@ -207,6 +210,21 @@ export function CreateSessionModal({
                   />
                 </div>
 
+                {/* Round Mode */}
+                <div className="flex items-center justify-between">
+                  <div>
+                    <Label>并行发言</Label>
+                    <p className="text-xs text-muted-foreground mt-1">每轮所有 AI 同时作答，耗时约等于最慢的模型</p>
+                  </div>
+                  <Switch
+                    checked={formData.round_mode === 'parallel'}
+                    onCheckedChange={(checked) => setFormData(prev => ({
+                      ...prev,
+                      round_mode: checked ? 'parallel' : 'sequential',
+                    }))}
+                  />
+                </div>
+
                 {/* Temperature */}
                 <div className="space-y-3">
                   <div className="flex justify-between">
@@ -0,0 +1,73 @@
+// Minimal MessagePack decoder for the compact WebSocket protocol.
+// Covers the types the server emits: nil, bool, ints, floats, str, bin, array and map.
+
+const textDecoder = new TextDecoder();
+
+export function decodeMsgpack(buffer: ArrayBuffer): any {
+  const view = new DataView(buffer);
+  const bytes = new Uint8Array(buffer);
+  let offset = 0;
+
+  const str = (length: number) => {
+    const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+    offset += length;
+    return value;
+  };
+  const bin = (length: number) => {
+    const value = bytes.slice(offset, offset + length);
+    offset += length;
+    return value;
+  };
+  const array = (length: number) => {
+    const value: any[] = [];
+    for (let i = 0; i < length; i++) value.push(read());
+    return value;
+  };
+  const map = (length: number) => {
+    const value: Record<string, any> = {};
+    for (let i = 0; i < length; i++) {
+      const key = read();
+      value[String(key)] = read();
+    }
+    return value;
+  };
+
+  const read = (): any => {
+    const type = bytes[offset++];
+    if (type <= 0x7f) return type;
+    if (type >= 0xe0) return type - 0x100;
+    if ((type & 0xe0) === 0xa0) return str(type & 0x1f);
+    if ((type & 0xf0) === 0x90) return array(type & 0x0f);
+    if ((type & 0xf0) === 0x80) return map(type & 0x0f);
+
+    let value: any;
+    switch (type) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return bin(bytes[offset++]);
+      case 0xc5: value = view.getUint16(offset); offset += 2; return bin(value);
+      case 0xc6: value = view.getUint32(offset); offset += 4; return bin(value);
+      case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+      case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+      case 0xcc: return bytes[offset++];
+      case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+      case 0xce: value = view.getUint32(offset); offset += 4; return value;
+      case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+      case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+      case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+      case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+      case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+      case 0xd9: return str(bytes[offset++]);
+      case 0xda: value = view.getUint16(offset); offset += 2; return str(value);
+      case 0xdb: value = view.getUint32(offset); offset += 4; return str(value);
+      case 0xdc: value = view.getUint16(offset); offset += 2; return array(value);
+      case 0xdd: value = view.getUint32(offset); offset += 4; return array(value);
+      case 0xde: value = view.getUint16(offset); offset += 2; return map(value);
+      case 0xdf: value = view.getUint32(offset); offset += 4; return map(value);
+      default: throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+    }
+  };
+
+  return read();
+}
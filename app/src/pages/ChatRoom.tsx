@@ -36,11 +36,13 @@ export function ChatRoom({ sessionId, onNavigate }: ChatRoomProps) {
   const [inputMessage, setInputMessage] = useState('');
   const [loading, setLoading] = useState(true);
   const [wsConnected, setWsConnected] = useState(false);
-  const [typingLLM, setTypingLLM] = useState<{ id: number; name: string } | null>(null);
+  const [typingLLMs, setTypingLLMs] = useState<{ id: number; name: string }[]>([]);
+  const [streamingContent, setStreamingContent] = useState<Record<number, string>>({});
   const [consensusData, setConsensusData] = useState({
     percentage: 0,
     currentRound: 0,
   });
+  const [reloadKey, setReloadKey] = useState(0);
 
   // Load session and messages
   useEffect(() => {
@@ -65,7 +67,7 @@ export function ChatRoom({ sessionId, onNavigate }: ChatRoomProps) {
     };
 
     loadData();
-  }, [sessionId]);
+  }, [sessionId, reloadKey]);
 
   // WebSocket connection
   useEffect(() => {
@@ -82,11 +84,27 @@ export function ChatRoom({ sessionId, onNavigate }: ChatRoomProps) {
         });
 
         wsService.on('llm_typing' as WSMessageType, (data) => {
-          setTypingLLM({ id: data.llm_id, name: data.llm_name });
+          setTypingLLMs(prev => [
+            ...prev.filter(llm => llm.id !== data.llm_id),
+            { id: data.llm_id, name: data.llm_name },
+          ]);
+          setStreamingContent(prev => ({ ...prev, [data.llm_id]: '' }));
+        });
+
+        wsService.on('llm_token_delta' as WSMessageType, (data) => {
+          setStreamingContent(prev => ({
+            ...prev,
+            [data.llm_id]: (prev[data.llm_id] || '') + data.delta,
+          }));
         });
 
-        wsService.on('llm_stopped_typing' as WSMessageType, () => {
-          setTypingLLM(null);
+        wsService.on('llm_stopped_typing' as WSMessageType, (data) => {
+          setTypingLLMs(prev => prev.filter(llm => llm.id !== data.llm_id));
+          setStreamingContent(prev => {
+            const next = { ...prev };
+            delete next[data.llm_id];
+            return next;
+          });
         });
 
         wsService.on('consensus_update' as WSMessageType, (data) => {
@@ -107,6 +125,13 @@ export function ChatRoom({ sessionId, onNavigate }: ChatRoomProps) {
           setSession(prev => prev ? { ...prev, is_completed: true } : null);
         });
 
+        wsService.on('resync' as WSMessageType, () => {
+          // Missed events are no longer replayable; refetch the session
+          setTypingLLMs([]);
+          setStreamingContent({});
+          setReloadKey(key => key + 1);
+        });
+
       } catch (error) {
         console.error('WebSocket connection failed:', error);
         setWsConnected(false);
@@ -123,7 +148,7 @@ export function ChatRoom({ sessionId, onNavigate }: ChatRoomProps) {
   // Auto scroll to bottom
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
-  }, [messages, typingLLM]);
+  }, [messages, typingLLMs, streamingContent]);
 
   const handleSendMessage = async () => {
     if (!inputMessage.trim()) return;
@@ -259,7 +284,7 @@ export function ChatRoom({ sessionId, onNavigate }: ChatRoomProps) {
                       {llm.display_name.charAt(0)}
                     </div>
                     <span className="text-sm truncate">{llm.display_name}</span>
-                    {typingLLM?.id === llm.id && (
+                    {typingLLMs.some(t => t.id === llm.id) && (
                       <span className="w-2 h-2 rounded-full bg-cyan-400 animate-pulse ml-auto" />
                     )}
                   </div>
@@ -330,12 +355,14 @@ export function ChatRoom({ sessionId, onNavigate }: ChatRoomProps) {
                 <MessageBubble key={message.id} message={message} />
               ))}
               
-              {typingLLM && (
+              {typingLLMs.map((typingLLM) => (
                 <TypingIndicator 
+                  key={typingLLM.id}
                   llmName={typingLLM.name}
                   brandColor={session.llms?.find(l => l.id === typingLLM.id)?.brand_color}
+                  content={streamingContent[typingLLM.id]}
                 />
-              )}
+              ))}
               
               <div ref={messagesEndRef} />
             </div>
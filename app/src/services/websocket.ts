@@ -1,4 +1,8 @@
 import type { WSMessage, WSMessageType } from '@/types';
+import { decodeMsgpack } from '@/lib/msgpack';
+
+// 'msgpack' asks the server for compact binary frames (smaller on slow links)
+const WS_ENCODING = import.meta.env.VITE_WS_ENCODING === 'msgpack' ? 'msgpack' : 'json';
 
 export class WebSocketService {
   private ws: WebSocket | null = null;
@@ -7,18 +11,33 @@ export class WebSocketService {
   private reconnectAttempts = 0;
   private maxReconnectAttempts = 5;
   private reconnectDelay = 1000;
+  // Sequence number of the last event received, sent on reconnect to replay missed events
+  private lastSeq: number | null = null;
+  // Participant metadata interned by the server in msgpack mode, by llm_id
+  private participants: Record<string, { name: string; brand_color: string }> = {};
 
   connect(sessionId: number): Promise<void> {
+    this.sessionId = sessionId;
+    this.lastSeq = null;
+    return this.open();
+  }
+
+  private open(): Promise<void> {
     return new Promise((resolve, reject) => {
-      this.sessionId = sessionId;
+      const sessionId = this.sessionId;
       // Construct WebSocket URL dynamically
       // Replace http/https with ws/wss
       const wsProtocol = window.location.protocol.replace('http', 'ws');
       const host = window.location.host;
-      const wsUrl = `${wsProtocol}//${host}/ws/sessions/${sessionId}`;
+      const params = new URLSearchParams();
+      if (this.lastSeq !== null) params.set('last_seq', String(this.lastSeq));
+      if (WS_ENCODING !== 'json') params.set('encoding', WS_ENCODING);
+      const query = params.toString() ? `?${params}` : '';
+      const wsUrl = `${wsProtocol}//${host}/ws/sessions/${sessionId}${query}`;
       
       try {
         this.ws = new WebSocket(wsUrl);
+        this.ws.binaryType = 'arraybuffer';
         
         this.ws.onopen = () => {
           console.log('WebSocket connected');
@@ -28,7 +47,9 @@ export class WebSocketService {
         
         this.ws.onmessage = (event) => {
           try {
-            const message: WSMessage = JSON.parse(event.data);
+            const message: WSMessage = event.data instanceof ArrayBuffer
+              ? this.expandCompact(decodeMsgpack(event.data))
+              : JSON.parse(event.data);
             this.handleMessage(message);
           } catch (error) {
             console.error('Failed to parse WebSocket message:', error);
@@ -73,7 +94,7 @@ export class WebSocketService {
     
     setTimeout(() => {
       if (this.sessionId) {
-        this.connect(this.sessionId).catch(() => {
+        this.open().catch(() => {
           // Reconnection failed, will try again if attempts remain
         });
       }
@@ -106,7 +127,30 @@ export class WebSocketService {
     };
   }
 
+  // Turn a compact frame ({t, d, s, ts}) back into the JSON message shape
+  private expandCompact(frame: Record<string, any>): WSMessage {
+    const data = frame.d ?? {};
+    if (frame.t === 'participants') {
+      this.participants = { ...this.participants, ...data.participants };
+    } else if (frame.t === 'new_message' && data.llm_id != null) {
+      if (data.llm_name) {
+        this.participants[data.llm_id] = { name: data.llm_name, brand_color: data.llm_brand_color };
+      } else if (this.participants[data.llm_id]) {
+        data.llm_name = this.participants[data.llm_id].name;
+        data.llm_brand_color = this.participants[data.llm_id].brand_color;
+      }
+    }
+    const timestamp = frame.ts !== undefined ? new Date(frame.ts).toISOString() : new Date().toISOString();
+    return { type: frame.t, data: { timestamp, ...data }, timestamp, seq: frame.s };
+  }
+
   private handleMessage(message: WSMessage) {
+    if (message.seq !== undefined) {
+      this.lastSeq = message.seq;
+    } else if (message.type === 'resync') {
+      // Missed events are gone; the handler refetches and we resume from here
+      this.lastSeq = message.data.seq;
+    }
     const handlers = this.messageHandlers.get(message.type);
     if (handlers) {
       handlers.forEach((handler) => handler(message.data));
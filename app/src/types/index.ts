@@ -49,6 +49,8 @@ export interface LLMProviderUpdate {
 }
 
 // Session Types
+export type RoundMode = 'sequential' | 'parallel';
+
 export interface Session {
   id: number;
   title: string;
@@ -58,6 +60,8 @@ export interface Session {
   current_round: number;
   temperature: number;
   max_tokens: number;
+  round_mode: RoundMode;
+  round_timeout_seconds?: number;
   is_active: boolean;
   is_completed: boolean;
   consensus_reached: boolean;
@@ -77,6 +81,8 @@ export interface SessionCreate {
   max_rounds?: number;
   temperature?: number;
   max_tokens?: number;
+  round_mode?: RoundMode;
+  round_timeout_seconds?: number;
 }
 
 export interface SessionUpdate {
@@ -102,6 +108,7 @@ export interface Message {
   thinking_content?: string;
   tokens_used?: number;
   response_time_ms?: number;
+  time_to_first_token_ms?: number;
   sentiment?: string;
   key_points?: string[];
   created_at: string;
@@ -133,15 +140,19 @@ export type WSMessageType =
   | 'new_message'
   | 'llm_typing'
   | 'llm_stopped_typing'
+  | 'llm_token_delta'
   | 'consensus_update'
   | 'round_update'
   | 'session_completed'
+  | 'resync'
+  | 'participants'
   | 'error';
 
 export interface WSMessage {
   type: WSMessageType;
   data: Record<string, any>;
   timestamp: string;
+  seq?: number;
 }
 
 // System Stats
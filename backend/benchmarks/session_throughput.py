@@ -0,0 +1,251 @@
+"""
+Session throughput benchmark - concurrent brainstorm sessions end to end
+
+Boots the FastAPI app in this process (uvicorn on a free local port, with
+its lifespan, against a fresh database file), registers mock providers, then
+creates N sessions through POST /api/sessions, attaches M WebSocket viewers
+to each and starts them all through /start. Reports:
+
+    sessions_per_s      Sessions completed per second of wall time
+    messages_per_s      LLM and system messages broadcast per second
+    events_per_s        WebSocket frames received per second, over all viewers
+    delivery_p50/p99_ms Event timestamp to viewer receipt
+    commit_p50/p99_ms   Database COMMIT duration
+    peak_rss_mb         Peak RSS of the process (server and viewers together)
+
+Results can be saved as a JSON baseline and later runs compared against it;
+a comparison exits with status 1 when a metric regressed by more than the
+tolerance. Compare runs with the same parameters on the same machine.
+
+Usage:
+    python benchmarks/session_throughput.py [--sessions 20] [--viewers 5] [--llms 3] [--rounds 2]
+        [--mock-options "ttft_ms=200&tokens_per_s=200"] [--save baselines/session_throughput.json]
+        [--compare baselines/session_throughput.json] [--tolerance 0.25] [--min-delta-ms 10]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metric -> True if higher is better
+METRICS = {
+    "sessions_per_s": True,
+    "messages_per_s": True,
+    "events_per_s": True,
+    "delivery_p50_ms": False,
+    "delivery_p99_ms": False,
+    "commit_p50_ms": False,
+    "commit_p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def timestamp_ms(value: str) -> float:
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp() * 1000
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def viewer(url: str, stats: dict, connected: asyncio.Event, completed: asyncio.Event, primary: bool):
+    import websockets
+
+    async with websockets.connect(url, max_size=None) as ws:
+        connected.set()
+        async for raw in ws:
+            received_ms = time.time() * 1000
+            message = json.loads(raw)
+            stats["events"] += 1
+            timestamp = message.get("timestamp") or message.get("data", {}).get("timestamp")
+            if timestamp:
+                stats["delivery_ms"].append(received_ms - timestamp_ms(timestamp))
+            if primary and message["type"] == "new_message":
+                stats["messages"] += 1
+            if message["type"] == "session_completed":
+                if primary:
+                    completed.set()
+                return
+
+async def run_benchmark(args) -> dict:
+    # Configure the app before importing it
+    db_path = os.path.join(tempfile.mkdtemp(prefix="synapsemind-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.setdefault("MAX_CONCURRENT_SESSIONS", str(args.sessions))
+    sys.path.insert(0, BACKEND_DIR)
+    # main serves the frontend build relative to the working directory
+    os.chdir(BACKEND_DIR)
+
+    import httpx
+    import uvicorn
+    import models
+    from main import app
+
+    # Time every COMMIT the app issues
+    commit_ms = []
+    dialect = models.engine.sync_engine.dialect
+    do_commit = dialect.do_commit
+    def timed_commit(dbapi_connection):
+        start = time.perf_counter()
+        do_commit(dbapi_connection)
+        commit_ms.append((time.perf_counter() - start) * 1000)
+    dialect.do_commit = timed_commit
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{port}"
+    stats = {"events": 0, "messages": 0, "delivery_ms": []}
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            llm_ids = []
+            for i in range(args.llms):
+                response = await client.post("/api/providers", json={
+                    "name": f"bench-mock-{i}",
+                    "display_name": f"Bench Mock {i}",
+                    "provider_type": "mock",
+                    "model_name": f"mock-{i}",
+                    "api_key": "bench",
+                    "api_base": f"mock://bench?seed={i}&{args.mock_options}",
+                    "config": {"max_concurrency": 0}
+                })
+                response.raise_for_status()
+                llm_ids.append(response.json()["id"])
+
+            session_ids = []
+            for i in range(args.sessions):
+                response = await client.post("/api/sessions", json={
+                    "title": f"Bench session {i}",
+                    "topic": "How should we scale the brainstorm engine?",
+                    "max_rounds": args.rounds,
+                    "round_mode": args.round_mode,
+                    "llm_ids": llm_ids
+                })
+                response.raise_for_status()
+                session_ids.append(response.json()["id"])
+
+            completions = []
+            viewer_tasks = []
+            for session_id in session_ids:
+                completed = asyncio.Event()
+                completions.append(completed)
+                for v in range(args.viewers):
+                    connected = asyncio.Event()
+                    viewer_tasks.append(asyncio.create_task(viewer(
+                        f"ws://127.0.0.1:{port}/ws/sessions/{session_id}",
+                        stats, connected, completed, primary=v == 0
+                    )))
+                    await connected.wait()
+
+            commit_ms.clear()
+            start = time.perf_counter()
+            for session_id in session_ids:
+                response = await client.post(f"/api/sessions/{session_id}/start")
+                response.raise_for_status()
+            await asyncio.wait_for(
+                asyncio.gather(*(completed.wait() for completed in completions)),
+                args.timeout
+            )
+            elapsed = time.perf_counter() - start
+            await asyncio.wait_for(asyncio.gather(*viewer_tasks, return_exceptions=True), 10)
+    finally:
+        server.should_exit = True
+        await server_task
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "sessions_per_s": round(args.sessions / elapsed, 3),
+        "messages_per_s": round(stats["messages"] / elapsed, 2),
+        "events_per_s": round(stats["events"] / elapsed, 1),
+        "delivery_p50_ms": round(percentile(stats["delivery_ms"], 0.50), 2),
+        "delivery_p99_ms": round(percentile(stats["delivery_ms"], 0.99), 2),
+        "commit_p50_ms": round(percentile(commit_ms, 0.50), 2),
+        "commit_p99_ms": round(percentile(commit_ms, 0.99), 2),
+        "commits": len(commit_ms),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> bool:
+    """Print each metric against the baseline; return False if any regressed"""
+    ok = True
+    print(f"\n{'metric':18} {'baseline':>10} {'current':>10} {'change':>8}")
+    for metric, higher_is_better in METRICS.items():
+        before, after = baseline["results"][metric], results[metric]
+        change = (after - before) / before if before else 0.0
+        regressed = (-change if higher_is_better else change) > tolerance
+        # Sub-millisecond latencies swing by large factors from run to run
+        if metric.endswith("_ms") and after - before < min_delta_ms:
+            regressed = False
+        ok = ok and not regressed
+        print(f"{metric:18} {before:>10} {after:>10} {change:>+7.0%}{'  REGRESSED' if regressed else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--viewers", type=int, default=5, help="WebSocket viewers per session")
+    parser.add_argument("--llms", type=int, default=3, help="Mock providers per session")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--round-mode", default="sequential", choices=["sequential", "parallel"])
+    parser.add_argument("--mock-options", default="ttft_ms=200&tokens_per_s=200&response_tokens=120",
+                        help="MockConfig query string shared by the mock providers")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--save", help="Write the results to this baseline file")
+    parser.add_argument("--compare", help="Compare against this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=10.0,
+                        help="Latency increases smaller than this never count as regressions")
+    args = parser.parse_args()
+    # The run changes directory; resolve the baseline paths first
+    save = os.path.abspath(args.save) if args.save else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    params = {
+        "sessions": args.sessions, "viewers": args.viewers, "llms": args.llms,
+        "rounds": args.rounds, "round_mode": args.round_mode, "mock_options": args.mock_options,
+    }
+    print(f"Running {args.sessions} sessions x {args.llms} LLMs x {args.rounds} rounds, "
+          f"{args.viewers} viewers each...")
+    results = asyncio.run(run_benchmark(args))
+    for metric, value in results.items():
+        print(f"  {metric:18} {value}")
+
+    if save:
+        os.makedirs(os.path.dirname(save), exist_ok=True)
+        with open(save, "w") as f:
+            json.dump({"benchmark": "session_throughput", "params": params, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {save}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline["params"] != params:
+            print(f"Warning: baseline was recorded with different parameters: {baseline['params']}")
+        if not compare(results, baseline, args.tolerance, args.min_delta_ms):
+            print(f"\nRegression beyond {args.tolerance:.0%} of the baseline")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
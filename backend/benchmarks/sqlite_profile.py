@@ -0,0 +1,94 @@
+"""
+SQLite profile benchmark - concurrent read/write throughput with and without the DB profile
+
+Runs writer tasks (one Message insert + commit each, like unbatched session
+writes and health-check updates) alongside reader tasks (the message list
+query the API serves) against a fresh database file, first with SQLAlchemy's
+defaults and then with the profile from models.create_db_engine.
+
+Usage:
+    python benchmarks/sqlite_profile.py [--writers 8] [--readers 16] [--seconds 10]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Base, Message, MessageRole, Session, create_db_engine
+
+async def run_profile(apply_profile: bool, writers: int, readers: int, seconds: float) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="synapsemind-bench-"), "bench.db")
+    engine = create_db_engine(f"sqlite+aiosqlite:///{path}", apply_profile=apply_profile)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_maker() as db:
+        db.add(Session(id=1, title="bench", topic="bench"))
+        await db.commit()
+
+    stats = {"writes": 0, "reads": 0, "locked": 0, "write_ms": []}
+    deadline = time.monotonic() + seconds
+
+    async def writer():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session_maker() as db:
+                    db.add(Message(session_id=1, role=MessageRole.ASSISTANT, content="x" * 500))
+                    await db.commit()
+                stats["writes"] += 1
+                stats["write_ms"].append((time.perf_counter() - start) * 1000)
+            except OperationalError:
+                stats["locked"] += 1
+
+    async def reader():
+        while time.monotonic() < deadline:
+            try:
+                async with session_maker() as db:
+                    result = await db.execute(
+                        select(Message).where(Message.session_id == 1).order_by(Message.id.desc()).limit(50)
+                    )
+                    result.scalars().all()
+                stats["reads"] += 1
+            except OperationalError:
+                stats["locked"] += 1
+
+    await asyncio.gather(*([writer() for _ in range(writers)] + [reader() for _ in range(readers)]))
+    await engine.dispose()
+
+    write_ms = sorted(stats["write_ms"]) or [0.0]
+    return {
+        "writes_per_s": stats["writes"] / seconds,
+        "reads_per_s": stats["reads"] / seconds,
+        "locked_errors": stats["locked"],
+        "write_p50_ms": write_ms[len(write_ms) // 2],
+        "write_p99_ms": write_ms[int(len(write_ms) * 0.99)],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'writes/s':>10}{'reads/s':>10}{'locked':>8}{'write p50':>11}{'write p99':>11}")
+    for label, apply_profile in (("default", False), ("tuned", True)):
+        result = asyncio.run(run_profile(apply_profile, args.writers, args.readers, args.seconds))
+        print(
+            f"{label:<10}{result['writes_per_s']:>10.0f}{result['reads_per_s']:>10.0f}{result['locked_errors']:>8}"
+            f"{result['write_p50_ms']:>9.1f}ms{result['write_p99_ms']:>9.1f}ms"
+        )
+
+if __name__ == "__main__":
+    main()
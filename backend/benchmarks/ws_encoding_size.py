@@ -0,0 +1,121 @@
+"""
+WebSocket encoding size comparison - bytes per session for JSON vs MessagePack frames
+
+Replays a synthetic brainstorm session (typing, streamed deltas, messages,
+consensus and round updates) through ConnectionManager with one JSON and one
+msgpack viewer, and reports wire bytes with and without permessage-deflate
+(raw deflate with context takeover, as browsers negotiate it by default).
+
+Usage:
+    python benchmarks/ws_encoding_size.py [--rounds 3] [--llms 4] [--reply-chars 600]
+"""
+import os
+import sys
+import zlib
+import asyncio
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websocket_manager
+from websocket_manager import ConnectionManager
+
+SAMPLE_TEXT = (
+    "我认为这个方案的关键在于分阶段推进：先用最小可行产品验证核心假设，"
+    "then iterate on the feedback loop with real users before scaling. "
+)
+
+class MeasuringSocket:
+    """Stand-in WebSocket that records frame sizes"""
+
+    def __init__(self):
+        self.frames = 0
+        self.raw_bytes = 0
+        self.deflated_bytes = 0
+        self._deflate = zlib.compressobj(wbits=-15)
+
+    async def accept(self):
+        pass
+
+    async def _record(self, payload: bytes):
+        self.frames += 1
+        self.raw_bytes += len(payload)
+        # permessage-deflate: sync flush per message, trailing 00 00 ff ff dropped
+        compressed = self._deflate.compress(payload) + self._deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.deflated_bytes += len(compressed) - 4
+
+    async def send_text(self, text: str):
+        await self._record(text.encode())
+
+    async def send_bytes(self, data: bytes):
+        await self._record(data)
+
+    async def close(self, code: int = 1000, reason: str = None):
+        pass
+
+async def run_session(rounds: int, llms: int, reply_chars: int, chunk_chars: int):
+    websocket_manager.manager = ConnectionManager(max_queue=100000)
+    manager = websocket_manager.manager
+    session_id = 1
+
+    viewers = {"json": MeasuringSocket(), "msgpack": MeasuringSocket()}
+    for encoding, socket in viewers.items():
+        await manager.connect(socket, session_id, encoding=encoding)
+
+    reply = (SAMPLE_TEXT * (reply_chars // len(SAMPLE_TEXT) + 1))[:reply_chars]
+    message_id = 0
+    for current_round in range(1, rounds + 1):
+        await websocket_manager.notify_round_update(session_id, {
+            "current_round": current_round, "max_rounds": rounds, "status": "started"
+        })
+        for llm_id in range(1, llms + 1):
+            await websocket_manager.notify_llm_typing(session_id, llm_id, f"Model {llm_id}")
+            for start in range(0, len(reply), chunk_chars):
+                await websocket_manager.notify_llm_token_delta(session_id, llm_id, reply[start:start + chunk_chars])
+            await websocket_manager.notify_llm_stopped_typing(session_id, llm_id)
+            message_id += 1
+            await websocket_manager.notify_new_message(session_id, {
+                "id": message_id,
+                "session_id": session_id,
+                "llm_id": llm_id,
+                "llm_name": f"Model {llm_id}",
+                "llm_brand_color": "#D97757",
+                "role": "assistant",
+                "content": reply,
+                "thinking_content": None,
+                "tokens_used": 420,
+                "response_time_ms": 5123.4,
+                "time_to_first_token_ms": 612.8,
+                "created_at": datetime.utcnow().isoformat()
+            })
+            await websocket_manager.notify_consensus_update(session_id, {
+                "consensus_percentage": 42.5, "current_round": current_round, "total_messages": message_id
+            })
+            # Let the writers drain, as network latency would between turns
+            await asyncio.sleep(0)
+    await websocket_manager.notify_session_completed(session_id, {
+        "summary": reply, "total_rounds": rounds, "total_messages": message_id, "consensus_percentage": 80.0
+    })
+    await asyncio.sleep(0.1)
+    return viewers
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--llms", type=int, default=4)
+    parser.add_argument("--reply-chars", type=int, default=600)
+    parser.add_argument("--chunk-chars", type=int, default=8, help="Characters per streamed delta")
+    args = parser.parse_args()
+
+    viewers = asyncio.run(run_session(args.rounds, args.llms, args.reply_chars, args.chunk_chars))
+    baseline = viewers["json"].raw_bytes
+    print(f"{'encoding':<10}{'frames':>8}{'raw bytes':>12}{'deflated':>12}{'vs json raw':>14}")
+    for encoding, socket in viewers.items():
+        print(
+            f"{encoding:<10}{socket.frames:>8}{socket.raw_bytes:>12}{socket.deflated_bytes:>12}"
+            f"{socket.raw_bytes / baseline:>9.0%} / {socket.deflated_bytes / baseline:.0%}"
+        )
+
+if __name__ == "__main__":
+    main()
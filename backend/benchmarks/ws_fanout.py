@@ -0,0 +1,317 @@
+"""
+WebSocket fan-out benchmark - ConnectionManager with thousands of viewers
+
+Connects simulated sockets to a ConnectionManager (in-process broadcast
+backend) and drives broadcast_to_session through the notify_* helpers with a
+stream of typing, token delta, message, consensus and round events, like a
+session turn. A fraction of the sockets can be slow (every send takes
+--slow-ms) or dead (every send fails, or hangs until the send timeout).
+
+Reports connect cost, encode cost per event, publish cost per event (encode,
+queueing a frame on every connection, and the sends that run when the
+broadcast yields), frames/s actually sent, send latency percentiles (delivery
+to the manager until the socket's send) and memory per connection
+(tracemalloc).
+
+--soak SECONDS instead churns viewers (connecting, leaving, dying) while
+events flow, samples the manager's bookkeeping and memory, and after all
+viewers are gone checks that active_connections, user_info, writers and
+asyncio tasks are back to where they started. Exits with status 1 on a leak.
+
+Usage:
+    python benchmarks/ws_fanout.py [--sessions 4] [--viewers 1000] [--events 500]
+        [--slow-fraction 0.05] [--dead-fraction 0.05] [--slow-ms 20] [--send-timeout 1]
+    python benchmarks/ws_fanout.py --soak 60 [--viewers 200]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websocket_manager
+from websocket_manager import ConnectionManager, encode_message
+
+REPLY = "Let's prototype first, measure the results and iterate on what works. " * 8
+
+class SimulatedSocket:
+    """Stand-in WebSocket; "slow" sockets take slow_ms per send, "dead" ones fail"""
+
+    def __init__(self, kind: str = "fast", slow_ms: float = 0.0, hang: bool = False, record: bool = True):
+        self.kind = kind
+        self.slow_ms = slow_ms
+        self.hang = hang
+        self.record = record
+        self.frames = 0
+        self.closed = False
+        # (seq, perf_counter at send)
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.kind == "dead":
+            if self.hang:
+                await asyncio.Event().wait()
+            raise ConnectionResetError("simulated dead socket")
+        if self.kind == "slow":
+            await asyncio.sleep(self.slow_ms / 1000)
+        self.frames += 1
+        if self.record and text.startswith('{"seq":'):
+            self.received.append((int(text[7:text.index(",")]), time.perf_counter()))
+
+    async def send_bytes(self, data: bytes):
+        await self.send_text("")
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.closed = True
+
+def make_sockets(count: int, args, rng: random.Random, record: bool = True):
+    sockets = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < args.dead_fraction:
+            sockets.append(SimulatedSocket("dead", hang=rng.random() < 0.5))
+        elif roll < args.dead_fraction + args.slow_fraction:
+            sockets.append(SimulatedSocket("slow", slow_ms=args.slow_ms, record=record))
+        else:
+            sockets.append(SimulatedSocket(record=record))
+    return sockets
+
+async def turn(session_id: int, llm_id: int, message_id: int, deltas: int):
+    """One speaker's turn through the notify_* helpers"""
+    await websocket_manager.notify_llm_typing(session_id, llm_id, f"Model {llm_id}")
+    for i in range(deltas):
+        await websocket_manager.notify_llm_token_delta(session_id, llm_id, REPLY[i * 8:i * 8 + 8])
+    await websocket_manager.notify_llm_stopped_typing(session_id, llm_id)
+    await websocket_manager.notify_new_message(session_id, {
+        "id": message_id, "session_id": session_id, "llm_id": llm_id,
+        "llm_name": f"Model {llm_id}", "llm_brand_color": "#D97757", "role": "assistant",
+        "content": REPLY, "tokens_used": 420, "response_time_ms": 5123.4,
+        "created_at": datetime.utcnow().isoformat()
+    })
+    await websocket_manager.notify_consensus_update(session_id, {
+        "consensus_percentage": 42.5, "current_round": 1, "total_messages": message_id
+    })
+    return deltas + 4
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def drain(manager: ConnectionManager, timeout: float):
+    """Wait until every remaining writer's queue is empty"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not any(writer._queue for writer in manager.writers.values()):
+            return
+        await asyncio.sleep(0.01)
+
+async def run_benchmark(args):
+    rng = random.Random(args.seed)
+    manager = websocket_manager.manager = ConnectionManager(send_timeout=args.send_timeout)
+    # Stamp each event as the backend hands it over for delivery
+    published = {}  # (session_id, seq) -> time
+    deliver = manager.deliver
+    def timed_deliver(session_id, seq, coalesce_key, body):
+        published[(session_id, seq)] = time.perf_counter()
+        deliver(session_id, seq, coalesce_key, body)
+    manager.deliver = timed_deliver
+    await manager.start()
+
+    # Memory per connection, on a separate manager so tracemalloc doesn't skew timings
+    sample = min(args.viewers, 1000)
+    memory_manager = ConnectionManager(send_timeout=args.send_timeout)
+    sockets = [SimulatedSocket(record=False) for _ in range(sample)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for socket in sockets:
+        await memory_manager.connect(socket, 0)
+    await drain(memory_manager, 30)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    bytes_per_connection = sum(stat.size_diff for stat in after.compare_to(before, "filename")) / sample
+    for socket in sockets:
+        memory_manager.disconnect(socket)
+
+    sessions = {
+        session_id: make_sockets(args.viewers, args, rng)
+        for session_id in range(1, args.sessions + 1)
+    }
+    start = time.perf_counter()
+    for session_id, sockets in sessions.items():
+        for socket in sockets:
+            await manager.connect(socket, session_id)
+    connect_s = time.perf_counter() - start
+    await drain(manager, args.send_timeout * 2 + 5)
+
+    # Encode cost alone, for the mix of events a turn produces
+    payload = {"type": "llm_token_delta", "data": {"llm_id": 1, "delta": REPLY[:8]},
+               "timestamp": datetime.utcnow().isoformat()}
+    encode_start = time.perf_counter()
+    for _ in range(10000):
+        encode_message(payload)
+    encode_us = (time.perf_counter() - encode_start) / 10000 * 1e6
+
+    for sockets in sessions.values():
+        for socket in sockets:
+            socket.frames = 0
+            socket.received.clear()
+    published.clear()
+    events = 0
+    message_id = 0
+    publish_s = 0.0
+    start = time.perf_counter()
+    while events < args.events:
+        for session_id in sessions:
+            message_id += 1
+            turn_start = time.perf_counter()
+            events += await turn(session_id, message_id % 3 + 1, message_id, args.deltas)
+            publish_s += time.perf_counter() - turn_start
+    await drain(manager, args.send_timeout * 2 + 5)
+    elapsed = time.perf_counter() - start
+
+    latencies = []
+    fast_latencies = []
+    frames = 0
+    for session_id, sockets in sessions.items():
+        for socket in sockets:
+            frames += socket.frames
+            for seq, sent_at in socket.received:
+                if (session_id, seq) in published:
+                    latency = (sent_at - published[(session_id, seq)]) * 1000
+                    latencies.append(latency)
+                    if socket.kind == "fast":
+                        fast_latencies.append(latency)
+
+    viewers = args.sessions * args.viewers
+    print(f"{viewers} viewers in {args.sessions} sessions "
+          f"({args.slow_fraction:.0%} slow, {args.dead_fraction:.0%} dead), {events} events")
+    print(f"  connect              {connect_s / viewers * 1e6:10.1f} us/connection")
+    print(f"  encode               {encode_us:10.1f} us/event")
+    # Includes the writers' sends that run when broadcast_to_session yields
+    print(f"  publish + fan-out    {publish_s / events * 1e6:10.1f} us/event ({args.viewers} viewers each)")
+    print(f"  frames sent          {frames:10d} ({frames / elapsed:,.0f}/s)")
+    print(f"  send latency p50     {percentile(latencies, 0.50):10.2f} ms")
+    print(f"  send latency p99     {percentile(latencies, 0.99):10.2f} ms")
+    print(f"  send latency max     {percentile(latencies, 1.0):10.2f} ms")
+    print(f"  fast sockets p99     {percentile(fast_latencies, 0.99):10.2f} ms")
+    print(f"  memory               {bytes_per_connection:10.0f} bytes/connection")
+    print(f"  still connected      {sum(len(c) for c in manager.active_connections.values()):10d} "
+          f"(evicted {viewers - len(manager.user_info)})")
+
+    for sockets in sessions.values():
+        for socket in sockets:
+            manager.disconnect(socket)
+    await manager.stop()
+
+def bookkeeping(manager: ConnectionManager) -> dict:
+    return {
+        "active_connections": sum(len(c) for c in manager.active_connections.values()),
+        "sessions": len(manager.active_connections),
+        "user_info": len(manager.user_info),
+        "writers": len(manager.writers),
+        "tasks": len(asyncio.all_tasks()),
+    }
+
+async def run_soak(args) -> bool:
+    rng = random.Random(args.seed)
+    manager = websocket_manager.manager = ConnectionManager(send_timeout=args.send_timeout)
+    await manager.start()
+    await asyncio.sleep(0)
+    baseline = bookkeeping(manager)
+    tracemalloc.start()
+
+    # Live viewers as (session_id, socket)
+    viewers = []
+    samples = []
+    message_id = 0
+    deadline = time.monotonic() + args.soak
+    next_sample = time.monotonic()
+    while time.monotonic() < deadline:
+        # Churn: new viewers arrive, some leave normally
+        for socket in make_sockets(rng.randint(0, args.viewers // 10), args, rng, record=False):
+            session_id = rng.randint(1, args.sessions)
+            await manager.connect(socket, session_id)
+            viewers.append((session_id, socket))
+        while len(viewers) > args.viewers:
+            _, socket = viewers.pop(rng.randrange(len(viewers)))
+            manager.disconnect(socket)
+
+        for session_id in range(1, args.sessions + 1):
+            message_id += 1
+            await turn(session_id, message_id % 3 + 1, message_id, args.deltas)
+        await asyncio.sleep(0.01)
+
+        if time.monotonic() >= next_sample:
+            next_sample += args.sample_interval
+            stats = bookkeeping(manager)
+            # Evicted viewers leave on their own; forget the ones the manager dropped
+            viewers = [(session_id, socket) for session_id, socket in viewers if socket in manager.user_info]
+            stats["viewers"] = len(viewers)
+            stats["memory_kb"] = tracemalloc.get_traced_memory()[0] // 1024
+            samples.append(stats)
+            print("  " + "  ".join(f"{key}={value}" for key, value in stats.items()))
+
+    for _, socket in viewers:
+        manager.disconnect(socket)
+    # Give cancelled writers and background closes time to finish
+    await asyncio.sleep(args.send_timeout + 0.5)
+    final = bookkeeping(manager)
+    tracemalloc.stop()
+    await manager.stop()
+
+    ok = True
+    print("\nAfter all viewers left:")
+    for key, value in final.items():
+        leaked = value > baseline[key]
+        ok = ok and not leaked
+        print(f"  {key:20} {value:6} (started at {baseline[key]}){'  LEAK' if leaked else ''}")
+
+    # Memory should plateau (event logs and queues are bounded) rather than
+    # grow with time; the first sample is taken before viewers ramp up
+    samples = samples[1:]
+    half = len(samples) // 2
+    if half >= 2:
+        first = sum(s["memory_kb"] for s in samples[:half]) / half
+        second = sum(s["memory_kb"] for s in samples[half:]) / (len(samples) - half)
+        growth = (second - first) / first if first else 0.0
+        grew = growth > args.max_memory_growth
+        ok = ok and not grew
+        print(f"  memory growth        {growth:+.0%} between halves of the run{'  LEAK' if grew else ''}")
+    print("\nNo leaks" if ok else "\nLeak detected")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--viewers", type=int, default=1000, help="Viewers per session (soak: in total)")
+    parser.add_argument("--events", type=int, default=500, help="Events to broadcast in total")
+    parser.add_argument("--deltas", type=int, default=20, help="Token deltas per turn")
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--dead-fraction", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=20.0, help="Duration of each send to a slow socket")
+    parser.add_argument("--send-timeout", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--soak", type=float, help="Run the leak soak test for this many seconds")
+    parser.add_argument("--sample-interval", type=float, default=5.0)
+    parser.add_argument("--max-memory-growth", type=float, default=0.25,
+                        help="Soak: allowed memory growth between the first and second half")
+    args = parser.parse_args()
+
+    if args.soak:
+        if not asyncio.run(run_soak(args)):
+            sys.exit(1)
+    else:
+        asyncio.run(run_benchmark(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,40 @@
 """
 Brainstorm engine - orchestrate multi-LLM discussions
 """
+import time
 import asyncio
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 
-from models import Session, Message, LLMProvider, ConsensusPoint, SessionLLM
+from models import Session, Message, LLMProvider, ConsensusPoint, SessionLLM, RoundMode
 from schemas import MessageCreate, MessageRole
-from llm_providers import create_provider
+from llm_providers import provider_registry, LLMResponse
+from context_builder import context_builder
+from rate_limiter import rate_limiter
+from resilience import resilience
+from provider_metrics import provider_metrics
+from metrics import db_commit_seconds, provider_instruments, rounds_in_flight
+from tracing import tracer
+from message_sink import message_sink
+from session_scheduler import SessionRun, session_scheduler
+from session_registry import session_registry
 from websocket_manager import (
     notify_new_message, notify_llm_typing, notify_llm_stopped_typing,
-    notify_consensus_update, notify_round_update, notify_session_completed
+    notify_llm_token_delta, notify_consensus_update, notify_round_update, notify_session_completed
 )
 
+# Bound once; finalizing is the engine's own write transaction, the rest go through message_sink
+_finalize_commit_seconds = db_commit_seconds.labels("session_finalize")
+
 class BrainstormEngine:
     """Engine to manage multi-LLM brainstorming sessions"""
     
     def __init__(self, db: AsyncSession):
         self.db = db
-        self.active_sessions: Dict[int, dict] = {}  # session_id -> session state
+        self.active_sessions = session_registry  # session_id -> session state, shared process-wide
+        self.run: Optional[SessionRun] = None  # Scheduler handle of the session being driven
     
     async def initialize_session(self, session_id: int) -> dict:
         """Initialize a brainstorming session"""
@@ -48,7 +62,8 @@ class BrainstormEngine:
                     "model_name": llm.model_name,
                     "api_key": llm.api_key,
                     "api_base": llm.api_base,
-                    "brand_color": llm.brand_color
+                    "brand_color": llm.brand_color,
+                    "config": llm.config or {}
                 })
         
         # Initialize session state
@@ -60,16 +75,24 @@ class BrainstormEngine:
             "max_rounds": session.max_rounds,
             "temperature": session.temperature,
             "max_tokens": session.max_tokens,
+            "round_mode": session.round_mode or RoundMode.SEQUENTIAL.value,
+            "round_timeout_seconds": session.round_timeout_seconds,
             "messages": [],  # Discussion history
             "consensus_points": [],
             "is_running": False
         }
         
-        self.active_sessions[session_id] = session_state
-        return session_state
+        # Another engine may have registered the session in the meantime
+        return self.active_sessions.setdefault(session_id, session_state)
     
-    async def start_brainstorm(self, session_id: int) -> bool:
-        """Start the brainstorming process"""
+    async def start_brainstorm(self, session_id: int, run: Optional[SessionRun] = None) -> bool:
+        """Start the brainstorming process and drive it to completion
+        
+        Args:
+            session_id: Session to run
+            run: Scheduler handle used for cancellation and pause/resume
+        """
+        self.run = run
         if session_id not in self.active_sessions:
             await self.initialize_session(session_id)
         
@@ -92,26 +115,53 @@ class BrainstormEngine:
 现在，让我们开始讨论！"""
         
         # Save system message
-        system_msg = Message(
-            session_id=session_id,
-            role=MessageRole.SYSTEM,
-            content=intro_message
-        )
-        self.db.add(system_msg)
-        await self.db.commit()
+        system_msg = await message_sink.add_message(session_id, MessageRole.SYSTEM, intro_message)
         
         await notify_new_message(session_id, {
-            "id": system_msg.id,
+            "id": system_msg["id"],
             "role": "system",
             "content": intro_message,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": system_msg["created_at"].isoformat()
         })
         
-        # Start the first round
-        await self._run_round(session_id)
+        await self._run_rounds(session_id)
         
         return True
     
+    async def _checkpoint(self, session_id: int) -> bool:
+        """Block while the session is paused; return False once it should stop"""
+        if self.run and not await self.run.checkpoint():
+            self.active_sessions[session_id]["is_running"] = False
+        return self.active_sessions[session_id]["is_running"]
+    
+    async def _run_rounds(self, session_id: int):
+        """Run rounds until max_rounds is reached or the session is stopped"""
+        session_state = self.active_sessions[session_id]
+        
+        while session_state["current_round"] < session_state["max_rounds"]:
+            if not await self._checkpoint(session_id):
+                break
+            
+            with tracer.start_trace(
+                "round", session_id,
+                round=session_state["current_round"] + 1, mode=session_state["round_mode"]
+            ):
+                rounds_in_flight.inc()
+                try:
+                    await self._run_round(session_id)
+                finally:
+                    rounds_in_flight.dec()
+                # Left to the sink's periodic flush if it fails now
+                with tracer.span("db_flush"):
+                    await message_sink.flush_quietly()
+                
+                if session_state["current_round"] < session_state["max_rounds"] and session_state["is_running"]:
+                    # Add a small delay before next round
+                    with tracer.span("sleep"):
+                        await asyncio.sleep(2)
+        
+        await self._finalize_session(session_id)
+    
     async def _run_round(self, session_id: int):
         """Run one round of discussion"""
         session_state = self.active_sessions[session_id]
@@ -120,85 +170,188 @@ class BrainstormEngine:
         current_round = session_state["current_round"]
         
         # Notify round update
-        await notify_round_update(session_id, {
-            "current_round": current_round,
-            "max_rounds": session_state["max_rounds"],
-            "status": "started"
-        })
+        with tracer.span("broadcast", event="round_update"):
+            await notify_round_update(session_id, {
+                "current_round": current_round,
+                "max_rounds": session_state["max_rounds"],
+                "status": "started"
+            })
         
-        # Each LLM takes turns speaking
-        for llm_config in session_state["llms"]:
-            if not session_state["is_running"]:
-                break
-            
-            await self._llm_speak(session_id, llm_config)
-            
-            # Small delay between speakers
-            await asyncio.sleep(1)
-        
-        # Check if we should continue
-        if current_round < session_state["max_rounds"] and session_state["is_running"]:
-            # Add a small delay before next round
-            await asyncio.sleep(2)
-            await self._run_round(session_id)
+        if session_state["round_mode"] == RoundMode.PARALLEL.value:
+            # Everyone answers the same snapshot of the discussion at once
+            await self._run_parallel_turns(session_id)
         else:
-            await self._finalize_session(session_id)
+            # Each LLM takes turns speaking
+            for llm_config in session_state["llms"]:
+                if not await self._checkpoint(session_id):
+                    break
+                
+                await self._llm_speak(session_id, llm_config)
+                
+                # Small delay between speakers
+                with tracer.span("sleep"):
+                    await asyncio.sleep(1)
     
-    async def _llm_speak(self, session_id: int, llm_config: dict):
-        """Have an LLM generate a response"""
+    async def _run_parallel_turns(self, session_id: int):
+        """Have every LLM answer the current round concurrently
+        
+        Responses are persisted and broadcast in speaking order once the
+        round completes or its deadline passes; late responses are cancelled.
+        """
         session_state = self.active_sessions[session_id]
+        llms = list(session_state["llms"])
+        if not llms:
+            return
+        
+        # Build every context before anyone answers so all see the same snapshot
+        with tracer.span("build_context", llms=len(llms)):
+            contexts = [self._build_context(session_state, llm_config) for llm_config in llms]
         
-        # Notify that LLM is typing
-        await notify_llm_typing(session_id, llm_config["id"], llm_config["name"])
+        with tracer.span("broadcast", event="llm_typing"):
+            for llm_config in llms:
+                await notify_llm_typing(session_id, llm_config["id"], llm_config["name"])
         
+        tasks = [
+            asyncio.create_task(self._generate(session_id, llm_config, messages))
+            for llm_config, messages in zip(llms, contexts)
+        ]
+        pending = set(tasks)
         try:
-            # Build conversation context
-            messages = self._build_context(session_state, llm_config)
-            
-            # Create provider and generate response
-            provider = create_provider(
-                llm_config["provider_type"],
-                llm_config["api_key"],
-                llm_config["model_name"],
-                llm_config.get("api_base")
-            )
+            _, pending = await asyncio.wait(tasks, timeout=session_state["round_timeout_seconds"])
+        finally:
+            # Late responses, or every call if the session itself is being cancelled
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        for llm_config, task in zip(llms, tasks):
+            if task in pending:
+                provider_metrics.record_failure(llm_config["id"])
+                provider_instruments(llm_config["id"], llm_config["provider_type"]).errors.inc()
+                await self._record_error(
+                    session_id, llm_config,
+                    TimeoutError(f"no response within {session_state['round_timeout_seconds']}s round deadline")
+                )
+            elif task.exception() is not None:
+                await self._record_error(session_id, llm_config, task.exception())
+            else:
+                await self._record_response(session_id, llm_config, task.result())
+    
+    async def _llm_speak(self, session_id: int, llm_config: dict):
+        """Have an LLM generate a response"""
+        session_state = self.active_sessions[session_id]
+        
+        with tracer.span("llm_speak", llm_id=llm_config["id"], llm_name=llm_config["name"]):
+            # Notify that LLM is typing
+            with tracer.span("broadcast", event="llm_typing"):
+                await notify_llm_typing(session_id, llm_config["id"], llm_config["name"])
             
-            response = await provider.generate_response(
-                messages,
-                temperature=session_state["temperature"],
-                max_tokens=session_state["max_tokens"]
+            try:
+                # Build conversation context
+                with tracer.span("build_context") as span:
+                    messages = self._build_context(session_state, llm_config)
+                    span.set("messages", len(messages))
+                
+                response = await self._generate(session_id, llm_config, messages)
+                await self._record_response(session_id, llm_config, response)
+                
+            except Exception as e:
+                await self._record_error(session_id, llm_config, e)
+    
+    async def _generate(self, session_id: int, llm_config: dict, messages: List[Dict[str, str]]) -> LLMResponse:
+        """Stream a response from an LLM, forwarding deltas to viewers as they arrive"""
+        session_state = self.active_sessions[session_id]
+        
+        instruments = provider_instruments(llm_config["id"], llm_config["provider_type"])
+        
+        # Hold the shared provider for the whole stream, with retries and the provider's circuit
+        # breaker; every attempt queues for its rate limits, reserving prompt + completion tokens
+        async with provider_registry.lease(
+            llm_config["provider_type"],
+            llm_config["api_key"],
+            llm_config["model_name"],
+            llm_config.get("api_base")
+        ) as llm_provider:
+            provider = resilience.wrap(
+                llm_config["id"],
+                llm_provider,
+                llm_config.get("config"),
+                limiter=rate_limiter.get(llm_config["id"], llm_config.get("config"))
             )
             
-            if response.error:
-                content = f"[Error generating response: {response.error}]"
-            else:
-                content = response.content
-            
-            # Save message to database
-            message = Message(
-                session_id=session_id,
+            with tracer.span(
+                "provider_call", llm_id=llm_config["id"], provider_type=llm_config["provider_type"],
+                model=llm_config["model_name"]
+            ) as span:
+                response = None
+                try:
+                    async for chunk in provider.stream_response(
+                        messages,
+                        temperature=session_state["temperature"],
+                        max_tokens=session_state["max_tokens"]
+                    ):
+                        if chunk.done:
+                            response = chunk.response
+                        elif chunk.delta:
+                            await notify_llm_token_delta(session_id, llm_config["id"], chunk.delta)
+                    
+                    if response is None:
+                        raise RuntimeError("Provider stream ended without a final response")
+                except Exception:
+                    provider_metrics.record_failure(llm_config["id"])
+                    instruments.errors.inc()
+                    raise
+                
+                provider_metrics.record(llm_config["id"], response)
+                if response.error:
+                    instruments.errors.inc()
+                else:
+                    instruments.response_seconds.observe(response.response_time_ms / 1000)
+                    if response.time_to_first_token_ms is not None:
+                        instruments.first_token_seconds.observe(response.time_to_first_token_ms / 1000)
+                if response.tokens_used:
+                    instruments.tokens.inc(response.tokens_used)
+                if response.error:
+                    span.set("error", response.error)
+                span.set("queue_wait_ms", response.queue_wait_ms)
+                span.set("time_to_first_token_ms", response.time_to_first_token_ms)
+                span.set("tokens_used", response.tokens_used)
+        return response
+    
+    async def _record_response(self, session_id: int, llm_config: dict, response: LLMResponse):
+        """Persist an LLM response and broadcast it"""
+        session_state = self.active_sessions[session_id]
+        
+        if response.error:
+            content = f"[Error generating response: {response.error}]"
+        else:
+            content = response.content
+        
+        # Queue message for the database; it has its ID already (written by the round's db_flush)
+        with tracer.span("db_enqueue"):
+            message = await message_sink.add_message(
+                session_id,
+                MessageRole.ASSISTANT,
+                content,
                 llm_id=llm_config["id"],
-                role=MessageRole.ASSISTANT,
-                content=content,
                 thinking_content=response.thinking_content,
                 tokens_used=response.tokens_used,
-                response_time_ms=response.response_time_ms
+                response_time_ms=response.response_time_ms,
+                time_to_first_token_ms=response.time_to_first_token_ms
             )
-            self.db.add(message)
-            await self.db.commit()
-            await self.db.refresh(message)
-            
-            # Update session state
-            session_state["messages"].append({
-                "role": "assistant",
-                "content": content,
-                "llm_name": llm_config["name"]
-            })
-            
-            # Notify clients
+        
+        # Update session state
+        session_state["messages"].append({
+            "role": "assistant",
+            "content": content,
+            "llm_name": llm_config["name"]
+        })
+        
+        # Notify clients
+        with tracer.span("broadcast", event="new_message"):
             await notify_llm_stopped_typing(session_id, llm_config["id"])
             await notify_new_message(session_id, {
-                "id": message.id,
+                "id": message["id"],
                 "session_id": session_id,
                 "llm_id": llm_config["id"],
                 "llm_name": llm_config["name"],
@@ -208,28 +361,26 @@ class BrainstormEngine:
                 "thinking_content": response.thinking_content,
                 "tokens_used": response.tokens_used,
                 "response_time_ms": response.response_time_ms,
-                "created_at": message.created_at.isoformat()
+                "time_to_first_token_ms": response.time_to_first_token_ms,
+                "created_at": message["created_at"].isoformat()
             })
             
             # Update consensus
             await self._update_consensus(session_id)
-            
-        except Exception as e:
-            await notify_llm_stopped_typing(session_id, llm_config["id"])
-            # Send error message
-            error_msg = Message(
-                session_id=session_id,
-                llm_id=llm_config["id"],
-                role=MessageRole.SYSTEM,
-                content=f"[{llm_config['name']} encountered an error: {str(e)}]"
-            )
-            self.db.add(error_msg)
-            await self.db.commit()
+    
+    async def _record_error(self, session_id: int, llm_config: dict, error: BaseException):
+        """Record that an LLM failed to take its turn"""
+        await notify_llm_stopped_typing(session_id, llm_config["id"])
+        # Send error message
+        await message_sink.add_message(
+            session_id,
+            MessageRole.SYSTEM,
+            f"[{llm_config['name']} encountered an error: {str(error)}]",
+            llm_id=llm_config["id"]
+        )
     
     def _build_context(self, session_state: dict, current_llm: dict) -> List[Dict[str, str]]:
-        """Build conversation context for an LLM"""
-        messages = []
-        
+        """Build conversation context for an LLM within its token budget"""
         # System prompt
         system_prompt = f"""You are {current_llm['name']}, participating in a brainstorming session with other AI assistants.
 
@@ -247,19 +398,13 @@ Other participants: {', '.join([llm['name'] for llm in session_state['llms'] if
 
 Current round: {session_state['current_round']} of {session_state['max_rounds']}"""
         
-        messages.append({"role": "system", "content": system_prompt})
-        
-        # Add previous messages
-        for msg in session_state["messages"][-10:]:  # Last 10 messages for context
-            if msg["role"] == "assistant":
-                messages.append({
-                    "role": "assistant",
-                    "content": f"[{msg.get('llm_name', 'AI')}]: {msg['content']}"
-                })
-            else:
-                messages.append(msg)
-        
-        return messages
+        # Recent messages verbatim, older ones folded into a running summary
+        return context_builder.build(
+            session_state,
+            system_prompt,
+            current_llm["model_name"],
+            current_llm.get("config")
+        )
     
     async def _update_consensus(self, session_id: int):
         """Update consensus tracking"""
@@ -287,13 +432,9 @@ Current round: {session_state['current_round']} of {session_state['max_rounds']}
         # Generate summary
         summary = await self._generate_summary(session_id)
         
-        # Save summary as system message
-        summary_msg = Message(
-            session_id=session_id,
-            role=MessageRole.SYSTEM,
-            content=summary
-        )
-        self.db.add(summary_msg)
+        # Save summary as system message, and everything still queued with it
+        await message_sink.add_message(session_id, MessageRole.SYSTEM, summary)
+        await message_sink.flush_quietly()
         
         # Update session
         result = await self.db.execute(
@@ -305,7 +446,9 @@ Current round: {session_state['current_round']} of {session_state['max_rounds']}
         session.consensus_percentage = 80.0  # Placeholder
         session.completed_at = datetime.utcnow()
         
+        start = time.perf_counter()
         await self.db.commit()
+        _finalize_commit_seconds.observe(time.perf_counter() - start)
         
         # Notify clients
         await notify_session_completed(session_id, {
@@ -316,8 +459,7 @@ Current round: {session_state['current_round']} of {session_state['max_rounds']}
         })
         
         # Clean up session state
-        if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
+        self.active_sessions.remove(session_id)
     
     async def _generate_summary(self, session_id: int) -> str:
         """Generate a summary of the discussion"""
@@ -349,19 +491,16 @@ Current round: {session_state['current_round']} of {session_state['max_rounds']}
         
         return summary
     
-    async def add_user_message(self, session_id: int, content: str) -> Message:
-        """Add a user message to the session"""
+    async def add_user_message(self, session_id: int, content: str) -> dict:
+        """Add a user message to the session
+        
+        Returns:
+            The queued message row (see MessageSink.add_message)
+        """
         session_state = self.active_sessions.get(session_id)
         
-        # Save to database
-        message = Message(
-            session_id=session_id,
-            role=MessageRole.USER,
-            content=content
-        )
-        self.db.add(message)
-        await self.db.commit()
-        await self.db.refresh(message)
+        # Queue for the database
+        message = await message_sink.add_message(session_id, MessageRole.USER, content)
         
         # Update session state
         if session_state:
@@ -372,17 +511,30 @@ Current round: {session_state['current_round']} of {session_state['max_rounds']}
         
         # Notify clients
         await notify_new_message(session_id, {
-            "id": message.id,
+            "id": message["id"],
             "session_id": session_id,
             "role": "user",
             "content": content,
-            "created_at": message.created_at.isoformat()
+            "created_at": message["created_at"].isoformat()
         })
         
         return message
     
-    async def stop_session(self, session_id: int):
-        """Stop an active session"""
+    async def stop_session(self, session_id: int) -> bool:
+        """Stop an active session
+        
+        A session driven by the scheduler stops within its current turn and
+        finalizes itself; an orphaned session state is finalized here.
+        
+        Returns:
+            True if there was an active session to stop
+        """
+        self.active_sessions.stop(session_id)
+        if session_scheduler.cancel(session_id):
+            return True
+        
         if session_id in self.active_sessions:
-            self.active_sessions[session_id]["is_running"] = False
             await self._finalize_session(session_id)
+            return True
+        
+        return False
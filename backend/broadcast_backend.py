@@ -0,0 +1,177 @@
+"""
+Broadcast backends - carry WebSocket events between API worker processes
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# deliver(session_id, seq, coalesce_key, body) hands an event to local connections;
+# seq is None for ephemeral events, which are neither numbered nor replayed
+DeliverCallback = Callable[[int, Optional[int], Optional[Hashable], str], None]
+
+class BroadcastBackend(ABC):
+    """Assigns each session event its sequence number and delivers it to every worker"""
+
+    def __init__(self):
+        self.deliver: Optional[DeliverCallback] = None
+        # Called when delivery may have missed events (e.g. a dropped subscription)
+        self.on_reset: Optional[Callable[[], None]] = None
+
+    async def start(self, deliver: DeliverCallback, on_reset: Optional[Callable[[], None]] = None):
+        self.deliver = deliver
+        self.on_reset = on_reset
+
+    @abstractmethod
+    async def publish(self, session_id: int, body: str, coalesce_key: Optional[Hashable] = None):
+        pass
+
+    @abstractmethod
+    async def publish_ephemeral(self, session_id: int, body: str):
+        """Deliver an event without a sequence number (e.g. a streamed token)"""
+        pass
+
+    async def stop(self):
+        pass
+
+class InProcessBroadcastBackend(BroadcastBackend):
+    """Single-worker backend: events are delivered directly in this process"""
+
+    def __init__(self):
+        super().__init__()
+        self._seqs: Dict[int, int] = {}
+
+    async def publish(self, session_id: int, body: str, coalesce_key: Optional[Hashable] = None):
+        # Start from the clock (in ms) so numbers keep increasing across restarts
+        seq = self._seqs.get(session_id) or int(time.time() * 1000)
+        seq += 1
+        self._seqs[session_id] = seq
+        self.deliver(session_id, seq, coalesce_key, body)
+
+    async def publish_ephemeral(self, session_id: int, body: str):
+        self.deliver(session_id, None, None, body)
+
+# Numbers and publishes an event atomically, so every worker sees the same order
+_PUBLISH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+local seq = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PUBLISH', KEYS[2], seq .. '\\n' .. ARGV[1])
+return seq
+"""
+
+class RedisBroadcastBackend(BroadcastBackend):
+    """Redis pub/sub backend: any worker can publish, every worker delivers
+
+    Each worker subscribes to all sessions' channels, so its replay log stays
+    complete no matter which worker a client reconnects to.
+    """
+
+    def __init__(self, url: str, prefix: str = "synapsemind", seq_ttl: int = 86400, client=None,
+                 subscribe_timeout: float = 10.0):
+        """
+        Initialize Redis broadcast backend
+
+        Args:
+            url: Redis connection URL
+            prefix: Key and channel prefix
+            seq_ttl: Seconds a session's sequence counter survives without events
+            client: Existing redis.asyncio client to use instead of connecting to url
+            subscribe_timeout: Seconds start() waits for the subscription before giving up
+        """
+        super().__init__()
+        if client is None:
+            import redis.asyncio as aioredis
+            client = aioredis.from_url(url)
+        self.redis = client
+        self.prefix = prefix
+        self.seq_ttl = seq_ttl
+        self.subscribe_timeout = subscribe_timeout
+        self._publish = self.redis.register_script(_PUBLISH_SCRIPT)
+        self._subscribed = asyncio.Event()
+        self._last_error: Optional[Exception] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def _channel(self, session_id) -> str:
+        return f"{self.prefix}:ws:{session_id}"
+
+    async def start(self, deliver: DeliverCallback, on_reset: Optional[Callable[[], None]] = None):
+        await super().start(deliver, on_reset)
+        self.task = asyncio.create_task(self._listen())
+        # Don't publish before we can hear our own events
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), self.subscribe_timeout)
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise ConnectionError(
+                f"Could not subscribe to Redis within {self.subscribe_timeout:g}s"
+                + (f": {self._last_error}" if self._last_error else "")
+            ) from self._last_error
+
+    async def publish(self, session_id: int, body: str, coalesce_key: Optional[Hashable] = None):
+        key = json.dumps(coalesce_key) if coalesce_key is not None else ""
+        await self._publish(
+            keys=[f"{self.prefix}:seq:{session_id}", self._channel(session_id)],
+            args=[f"{key}\n{body}", int(time.time() * 1000), self.seq_ttl]
+        )
+
+    async def publish_ephemeral(self, session_id: int, body: str):
+        # Same channel, so it stays in order with numbered events; an empty seq marks it
+        await self.redis.publish(self._channel(session_id), f"\n\n{body}")
+
+    async def _listen(self):
+        channel_prefix = self._channel("")
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.psubscribe(self._channel("*"))
+                    self._subscribed.set()
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+                        channel = message["channel"].decode()
+                        seq, key, body = message["data"].decode().split("\n", 2)
+                        coalesce_key = json.loads(key) if key else None
+                        if isinstance(coalesce_key, list):
+                            coalesce_key = tuple(coalesce_key)
+                        self.deliver(
+                            int(channel[len(channel_prefix):]), int(seq) if seq else None, coalesce_key, body
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis broadcast subscription failed: {str(e)}")
+                self._last_error = e
+                # Events published meanwhile are lost to this worker
+                if self.on_reset:
+                    self.on_reset()
+                await asyncio.sleep(1)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.redis.aclose()
+
+def create_broadcast_backend() -> BroadcastBackend:
+    """Backend selected by BROADCAST_BACKEND ("inprocess" or "redis", using REDIS_URL)"""
+    backend = os.getenv("BROADCAST_BACKEND", "inprocess").lower()
+    if backend == "redis":
+        return RedisBroadcastBackend(
+            os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            subscribe_timeout=float(os.getenv("REDIS_SUBSCRIBE_TIMEOUT", "10"))
+        )
+    if backend != "inprocess":
+        raise ValueError(f"Unknown broadcast backend: {backend}")
+    return InProcessBroadcastBackend()
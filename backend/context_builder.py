@@ -0,0 +1,188 @@
+"""
+Context builder - fit discussion history into a per-model token budget
+"""
+import os
+import re
+from typing import Dict, List, Optional
+
+# Context window (tokens) per model, matched by longest name prefix
+MODEL_CONTEXT_WINDOWS = {
+    "claude-3": 200000,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "gemini-1.5": 1000000,
+    "gemini-pro": 30720,
+    "deepseek": 32768,
+    "moonshot-v1-8k": 8192,
+    "moonshot-v1-32k": 32768,
+    "moonshot-v1-128k": 131072,
+    "qwen-turbo": 8192,
+    "qwen-plus": 32768,
+    "qwen-max": 8192,
+    "glm-4": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_SENTENCE_END_RE = re.compile(r"(?<=[。！？!?.])\s*|\n+")
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: ~1 token per CJK character, ~4 characters per token otherwise"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def get_context_window(model_name: str, config: Optional[dict] = None) -> int:
+    """Context window for a model; ``config["context_window"]`` overrides the table"""
+    if config and config.get("context_window"):
+        return int(config["context_window"])
+
+    model_name = (model_name or "").lower()
+    best = None
+    for prefix in MODEL_CONTEXT_WINDOWS:
+        if model_name.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_CONTEXT_WINDOWS[best] if best else DEFAULT_CONTEXT_WINDOW
+
+def _format_message(msg: dict) -> Dict[str, str]:
+    if msg["role"] == "assistant":
+        return {
+            "role": "assistant",
+            "content": f"[{msg.get('llm_name', 'AI')}]: {msg['content']}"
+        }
+    return {"role": msg["role"], "content": msg["content"]}
+
+def _digest(content: str, max_chars: int) -> str:
+    """First sentence of a message, shortened to max_chars"""
+    for sentence in _SENTENCE_END_RE.split(content.strip()):
+        sentence = sentence.strip()
+        if sentence:
+            break
+    else:
+        sentence = ""
+    if len(sentence) > max_chars:
+        sentence = sentence[:max_chars - 1] + "…"
+    return sentence
+
+class ContextBuilder:
+    """Builds token-budgeted prompts with a rolling summary of older turns
+
+    Recent messages are kept verbatim for as far back as the budget allows.
+    Messages that fall out of that window are folded into a running summary
+    cached on the session state (``session_state["context_summaries"]``), which
+    is only extended when new turns fall out, never recomputed from scratch.
+    Each prompt size keeps its own summary, so a small-window model doesn't
+    cut the verbatim history of larger ones.
+    """
+
+    def __init__(self, prompt_budget: int = 6000, summary_share: float = 0.25,
+                 reserve_tokens: int = 256, digest_chars: int = 160, min_latest_chars: int = 200):
+        """
+        Initialize context builder
+
+        Args:
+            prompt_budget: Upper bound on prompt tokens per turn, regardless of
+                how large the model's context window is
+            summary_share: Fraction of the history budget the summary may use
+            reserve_tokens: Safety margin for message framing and estimate error
+            digest_chars: Maximum length of a single summarised point
+            min_latest_chars: Characters of the latest message kept even when
+                the budget has no room for it
+        """
+        self.prompt_budget = prompt_budget
+        self.summary_share = summary_share
+        self.reserve_tokens = reserve_tokens
+        self.digest_chars = digest_chars
+        self.min_latest_chars = min_latest_chars
+
+    def _prompt_cap(self, model_name: str, max_tokens: int, config: Optional[dict]) -> int:
+        """Prompt tokens a model gets, system prompt included"""
+        window_budget = get_context_window(model_name, config) - max_tokens - self.reserve_tokens
+        return min(self.prompt_budget, window_budget)
+
+    def build(self, session_state: dict, system_prompt: str, model_name: str,
+              config: Optional[dict] = None) -> List[Dict[str, str]]:
+        """Build the message list for one turn"""
+        cap = self._prompt_cap(model_name, session_state["max_tokens"], config)
+        # Tokens left for summary and history once the system prompt is accounted for
+        budget = max(cap - estimate_tokens(system_prompt), 0)
+        # Keyed by the cap rather than the budget, which moves with the system prompt
+        summaries = session_state.setdefault("context_summaries", {})
+        summary = summaries.setdefault(cap, {"upto": 0, "points": {}, "tokens": 0})
+        history = session_state["messages"]
+
+        # Walk back from the newest message while it still fits verbatim
+        verbatim_budget = budget - min(summary["tokens"], int(budget * self.summary_share))
+        start = self._verbatim_start(history, verbatim_budget)
+
+        # Fold turns that fell out of the window into the running summary
+        if start > summary["upto"]:
+            self._extend_summary(summary, history[summary["upto"]:start], int(budget * self.summary_share))
+            summary["upto"] = start
+        start = max(start, summary["upto"])
+
+        messages = []
+        if summary["points"]:
+            system_prompt += "\n\nSummary of earlier discussion:\n" + self._render(summary)
+        messages.append({"role": "system", "content": system_prompt})
+
+        recent = [_format_message(msg) for msg in history[start:]]
+        if not recent and history:
+            # Even the latest message alone is over budget; keep a truncated copy,
+            # never an empty one (providers reject empty messages)
+            latest = _format_message(history[-1])
+            latest["content"] = latest["content"][:max(budget * 2, self.min_latest_chars)]
+            recent = [latest]
+        messages.extend(recent)
+        return messages
+
+    def _verbatim_start(self, history: List[dict], budget: int) -> int:
+        """Index of the oldest message that still fits verbatim within budget"""
+        used = 0
+        start = len(history)
+        for index in range(len(history) - 1, -1, -1):
+            msg = history[index]
+            tokens = msg.get("tokens")
+            if tokens is None:
+                tokens = msg["tokens"] = estimate_tokens(_format_message(msg)["content"]) + 4
+            if used + tokens > budget:
+                break
+            used += tokens
+            start = index
+        return start
+
+    def _extend_summary(self, summary: dict, messages: List[dict], budget: int):
+        points: Dict[str, List[str]] = summary["points"]
+        for msg in messages:
+            if msg["role"] == "system":
+                continue
+            speaker = msg.get("llm_name", "User") if msg["role"] == "assistant" else "User"
+            digest = _digest(msg["content"], self.digest_chars)
+            if digest:
+                points.setdefault(speaker, []).append(digest)
+
+        # Over budget: drop the oldest point of whoever has the most, so every
+        # speaker stays represented
+        summary["tokens"] = estimate_tokens(self._render(summary))
+        while summary["tokens"] > budget and any(len(p) > 1 for p in points.values()):
+            speaker = max(points, key=lambda name: len(points[name]))
+            points[speaker].pop(0)
+            summary["tokens"] = estimate_tokens(self._render(summary))
+
+    @staticmethod
+    def _render(summary: dict) -> str:
+        lines = []
+        for speaker, points in summary["points"].items():
+            lines.append(f"- {speaker}: " + " / ".join(points))
+        return "\n".join(lines)
+
+# Global context builder instance
+context_builder = ContextBuilder(
+    prompt_budget=int(os.getenv("CONTEXT_PROMPT_BUDGET", "6000"))
+)
@@ -1,16 +1,21 @@
 """
 LLM Health Checker - Background task to periodically check LLM connectivity
 """
+import time
 import asyncio
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models import LLMProvider, LLMProviderStatus, async_session_maker
-from llm_providers import create_provider
+from llm_providers import provider_registry
+from rate_limiter import rate_limiter
+from resilience import RetryPolicy, resilience
+from provider_metrics import provider_metrics
+from metrics import health_check_seconds
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,16 +24,60 @@ logger = logging.getLogger(__name__)
 class LLMHealthChecker:
     """Background task to check LLM provider health"""
     
-    def __init__(self, check_interval: int = 300):
+    def __init__(
+        self,
+        check_interval: int = 300,
+        min_interval: int = 60,
+        max_interval: int = 1800,
+        tick_interval: int = 15,
+        max_concurrent_checks: int = 5
+    ):
         """
         Initialize health checker
         
         Args:
-            check_interval: Interval between checks in seconds (default: 300s = 5 minutes)
+            check_interval: Initial interval between checks of a provider in seconds (default: 300s = 5 minutes)
+            min_interval: Interval used while a provider is in ERROR
+            max_interval: Longest interval a stable ONLINE provider backs off to
+            tick_interval: How often the loop looks for providers that are due
+            max_concurrent_checks: Probes allowed to run at the same time
         """
         self.check_interval = check_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tick_interval = tick_interval
+        self.max_concurrent_checks = max_concurrent_checks
         self.is_running = False
         self.task: Optional[asyncio.Task] = None
+        
+        # Adaptive per-provider schedule: provider_id -> interval / next due time (monotonic)
+        self._intervals: Dict[int, float] = {}
+        self._next_due: Dict[int, float] = {}
+        # Check duration by outcome
+        self._check_seconds = {
+            True: health_check_seconds.labels("online"),
+            False: health_check_seconds.labels("offline")
+        }
+    
+    def _reschedule(self, provider_id: int, status: LLMProviderStatus):
+        """Back off on stable providers, tighten on failing ones"""
+        interval = self._intervals.get(provider_id, self.check_interval)
+        if status == LLMProviderStatus.ONLINE:
+            interval = min(interval * 2, self.max_interval)
+        elif status == LLMProviderStatus.ERROR:
+            interval = self.min_interval
+        else:
+            interval = self.max_interval
+        self._intervals[provider_id] = interval
+        self._next_due[provider_id] = time.monotonic() + interval
+    
+    def _is_due(self, provider_id: int) -> bool:
+        return time.monotonic() >= self._next_due.get(provider_id, 0)
+    
+    def reset_schedule(self, provider_id: int):
+        """Check a provider on the next tick (e.g. after its config changed)"""
+        self._intervals.pop(provider_id, None)
+        self._next_due.pop(provider_id, None)
     
     async def check_provider_health(self, provider: LLMProvider, db: AsyncSession) -> bool:
         """
@@ -49,17 +98,37 @@ class LLMHealthChecker:
                 logger.info(f"Provider {provider.display_name} marked as OFFLINE (no API key)")
             return False
         
+        # Real traffic answered recently and hasn't failed since: that is a
+        # better health signal than a probe, so don't spend one
+        if provider_metrics.served_recently(provider.id, self.check_interval):
+            old_status = provider.status
+            provider.status = LLMProviderStatus.ONLINE
+            provider.last_check_at = datetime.utcnow()
+            await db.commit()
+            
+            if old_status != LLMProviderStatus.ONLINE:
+                logger.info(f"✓ Provider {provider.display_name} is now ONLINE (serving traffic)")
+            
+            return True
+        
         try:
-            # Create provider instance
-            llm_provider = create_provider(
+            # Probe, queueing behind session traffic on the same provider. The
+            # cheap probe (e.g. a model-list call) avoids a billable completion
+            # unless config["health_probe"] asks for one.
+            use_completion = (provider.config or {}).get("health_probe") == "completion"
+            # Freshly loaded, so this also picks up limits changed through another worker
+            rate_limiter.update(provider.id, provider.config)
+            async with provider_registry.lease(
                 provider.provider_type,
                 provider.api_key,
                 provider.model_name,
                 provider.api_base
-            )
-            
-            # Test connection
-            success, quota_info, response_time_ms = await llm_provider.test_connection()
+            ) as llm_provider:
+                async with rate_limiter.acquire(provider.id, provider.config, estimated_tokens=20):
+                    if use_completion:
+                        success, quota_info, response_time_ms = await llm_provider.test_connection()
+                    else:
+                        success, quota_info, response_time_ms = await llm_provider.probe()
             
             if success:
                 # Update to ONLINE status
@@ -67,7 +136,12 @@ class LLMHealthChecker:
                 provider.status = LLMProviderStatus.ONLINE
                 provider.last_check_at = datetime.utcnow()
                 provider.last_used_at = datetime.utcnow()  # Update last online time
-                provider.avg_response_time = response_time_ms
+                # Latency from real traffic (flushed by provider_metrics) beats a probe sample
+                if not provider_metrics.has_data(provider.id):
+                    provider.avg_response_time = response_time_ms
+                
+                # A passing probe closes an open circuit breaker
+                resilience.breaker(provider.id, RetryPolicy.from_config(provider.config)).record_success()
                 
                 # Update quota info if available
                 if quota_info:
@@ -105,51 +179,73 @@ class LLMHealthChecker:
             
             return False
     
-    async def check_all_providers(self):
-        """Check health of all enabled providers"""
-        async with async_session_maker() as db:
-            try:
+    async def _check_one(self, provider_id: int, semaphore: asyncio.Semaphore) -> bool:
+        """Check one provider in its own DB session (sessions can't be shared across tasks)"""
+        async with semaphore:
+            async with async_session_maker() as db:
+                provider = await db.get(LLMProvider, provider_id)
+                if not provider or not provider.is_enabled:
+                    return False
+                start = time.perf_counter()
+                is_online = await self.check_provider_health(provider, db)
+                self._check_seconds[is_online].observe(time.perf_counter() - start)
+                self._reschedule(provider_id, provider.status)
+                return is_online
+    
+    async def check_all_providers(self, only_due: bool = False):
+        """
+        Check health of enabled providers concurrently
+        
+        Args:
+            only_due: Only check providers whose adaptive interval has elapsed
+        """
+        try:
+            async with async_session_maker() as db:
                 # Get all enabled providers
                 result = await db.execute(
-                    select(LLMProvider).where(LLMProvider.is_enabled == True)
+                    select(LLMProvider.id).where(LLMProvider.is_enabled == True)
                 )
-                providers = result.scalars().all()
-                
-                if not providers:
-                    logger.debug("No enabled providers to check")
-                    return
-                
-                logger.info(f"Checking health of {len(providers)} providers...")
-                
-                # Check each provider
-                online_count = 0
-                for provider in providers:
-                    is_online = await self.check_provider_health(provider, db)
-                    if is_online:
-                        online_count += 1
-                    
-                    # Small delay between checks to avoid rate limiting
-                    await asyncio.sleep(1)
-                
-                logger.info(f"Health check complete: {online_count}/{len(providers)} providers online")
-                
-            except Exception as e:
-                logger.error(f"Error during health check: {str(e)}")
+                provider_ids = list(result.scalars().all())
+            
+            if only_due:
+                provider_ids = [provider_id for provider_id in provider_ids if self._is_due(provider_id)]
+            
+            if not provider_ids:
+                logger.debug("No enabled providers to check")
+                return
+            
+            logger.info(f"Checking health of {len(provider_ids)} providers...")
+            
+            # Probe concurrently, bounded so we don't burst every API at once
+            semaphore = asyncio.Semaphore(self.max_concurrent_checks)
+            results = await asyncio.gather(
+                *(self._check_one(provider_id, semaphore) for provider_id in provider_ids),
+                return_exceptions=True
+            )
+            online_count = sum(1 for result in results if result is True)
+            
+            logger.info(f"Health check complete: {online_count}/{len(provider_ids)} providers online")
+            
+        except Exception as e:
+            logger.error(f"Error during health check: {str(e)}")
     
     async def run(self):
         """Run the health checker loop"""
         self.is_running = True
-        logger.info(f"LLM Health Checker started (interval: {self.check_interval}s)")
+        logger.info(
+            f"LLM Health Checker started (interval: {self.check_interval}s, "
+            f"adaptive {self.min_interval}-{self.max_interval}s)"
+        )
         
         # Initial check after 10 seconds
         await asyncio.sleep(10)
         await self.check_all_providers()
         
-        # Periodic checks
+        # Periodic checks of whichever providers are due
         while self.is_running:
             try:
-                await asyncio.sleep(self.check_interval)
-                await self.check_all_providers()
+                await asyncio.sleep(self.tick_interval)
+                await self.check_all_providers(only_due=True)
             except asyncio.CancelledError:
                 logger.info("Health checker cancelled")
                 break
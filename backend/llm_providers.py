@@ -3,13 +3,34 @@ LLM Provider management and API integration
 """
 import os
 import time
+import random
+import asyncio
+import hashlib
 import httpx
-from typing import Optional, Dict, Any, List
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qsl, urlsplit
+from typing import Optional, Dict, Any, List, AsyncIterator
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 import anthropic
 import openai
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
+
+from context_builder import estimate_tokens
+
+# Keep-alive pool settings for the HTTP clients shared through the provider registry
+HTTP_POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120")),
+)
+HTTP_TIMEOUT = httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT", "600")), connect=10.0)
+
+def _make_http_client() -> httpx.AsyncClient:
+    """Create an HTTP client with a keep-alive connection pool"""
+    return httpx.AsyncClient(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
 
 @dataclass
 class LLMResponse:
@@ -17,7 +38,22 @@ class LLMResponse:
     thinking_content: Optional[str] = None
     tokens_used: int = 0
     response_time_ms: float = 0.0
+    time_to_first_token_ms: Optional[float] = None
+    queue_wait_ms: float = 0.0  # Time spent waiting on the provider's rate limiter
     error: Optional[str] = None
+    error_status: Optional[int] = None  # HTTP/gRPC status of the failure, if known
+    error_type: Optional[str] = None  # Exception class name of the failure
+
+@dataclass
+class LLMStreamChunk:
+    """A piece of a streamed completion.
+
+    Intermediate chunks carry a text ``delta``; the last chunk has ``done`` set
+    and carries the aggregated ``response`` (full content, usage and timings).
+    """
+    delta: str = ""
+    done: bool = False
+    response: Optional[LLMResponse] = None
 
 @dataclass
 class QuotaInfo:
@@ -25,6 +61,24 @@ class QuotaInfo:
     used: Optional[float] = None
     remaining: Optional[float] = None
 
+def _estimated_usage(messages: List[Dict[str, str]], content: str) -> int:
+    """Prompt plus completion tokens, for streams that end without reporting usage"""
+    return sum(estimate_tokens(m["content"]) for m in messages) + estimate_tokens(content)
+
+def _elapsed_ms(start_time: float, end_time: Optional[float]) -> Optional[float]:
+    """Milliseconds between two time.time() stamps, None if the end never happened"""
+    if end_time is None:
+        return None
+    return (end_time - start_time) * 1000
+
+def _error_status(error: Exception) -> Optional[int]:
+    """HTTP status code carried by an SDK exception, if any"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # google.api_core exceptions expose the HTTP status as .code
+        status = getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
 class BaseLLMProvider(ABC):
     """Base class for LLM providers"""
     
@@ -42,17 +96,46 @@ class BaseLLMProvider(ABC):
     ) -> LLMResponse:
         pass
     
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[LLMStreamChunk]:
+        """Stream a response as text deltas, finishing with a ``done`` chunk.
+
+        Providers without native streaming fall back to a single delta.
+        """
+        response = await self.generate_response(messages, temperature, max_tokens)
+        if response.content:
+            yield LLMStreamChunk(delta=response.content)
+        if response.time_to_first_token_ms is None:
+            response.time_to_first_token_ms = response.response_time_ms
+        yield LLMStreamChunk(done=True, response=response)
+    
     @abstractmethod
     async def test_connection(self) -> tuple[bool, Optional[QuotaInfo], float]:
         """Test connection and return (success, quota_info, response_time_ms)"""
         pass
+    
+    async def probe(self) -> tuple[bool, Optional[QuotaInfo], float]:
+        """Cheap health probe; providers without a free endpoint fall back to test_connection"""
+        return await self.test_connection()
+    
+    async def aclose(self):
+        """Release the underlying client and its connection pool"""
+        pass
 
 class ClaudeProvider(BaseLLMProvider):
     """Anthropic Claude provider"""
     
     def __init__(self, api_key: str, model_name: str = "claude-3-sonnet-20240229", api_base: Optional[str] = None):
         super().__init__(api_key, model_name, api_base)
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+        # Retries are handled by the resilience layer, not the SDK
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, http_client=_make_http_client(), max_retries=0)
+    
+    async def aclose(self):
+        await self.client.close()
     
     async def generate_response(
         self, 
@@ -63,18 +146,7 @@ class ClaudeProvider(BaseLLMProvider):
         start_time = time.time()
         
         try:
-            # Convert messages to Claude format
-            system_msg = ""
-            claude_messages = []
-            
-            for msg in messages:
-                if msg.get("role") == "system":
-                    system_msg = msg.get("content", "")
-                else:
-                    claude_messages.append({
-                        "role": msg.get("role"),
-                        "content": msg.get("content", "")
-                    })
+            system_msg, claude_messages = self._convert_messages(messages)
             
             response = await self.client.messages.create(
                 model=self.model_name,
@@ -96,9 +168,82 @@ class ClaudeProvider(BaseLLMProvider):
             return LLMResponse(
                 content="",
                 error=str(e),
+                error_status=_error_status(e),
+                error_type=type(e).__name__,
                 response_time_ms=(time.time() - start_time) * 1000
             )
     
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[LLMStreamChunk]:
+        start_time = time.time()
+        first_token_time = None
+        content_parts = []
+        input_tokens = 0
+        output_tokens = 0
+        
+        try:
+            system_msg, claude_messages = self._convert_messages(messages)
+            
+            stream = await self.client.messages.create(
+                model=self.model_name,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=system_msg,
+                messages=claude_messages,
+                stream=True
+            )
+            
+            async for event in stream:
+                if event.type == "message_start":
+                    input_tokens = event.message.usage.input_tokens
+                elif event.type == "content_block_delta":
+                    delta = getattr(event.delta, "text", "")
+                    if delta:
+                        if first_token_time is None:
+                            first_token_time = time.time()
+                        content_parts.append(delta)
+                        yield LLMStreamChunk(delta=delta)
+                elif event.type == "message_delta":
+                    output_tokens = event.usage.output_tokens
+            
+            yield LLMStreamChunk(done=True, response=LLMResponse(
+                content="".join(content_parts),
+                tokens_used=input_tokens + output_tokens,
+                response_time_ms=(time.time() - start_time) * 1000,
+                time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+            ))
+            
+        except Exception as e:
+            yield LLMStreamChunk(done=True, response=LLMResponse(
+                content="".join(content_parts),
+                error=str(e),
+                error_status=_error_status(e),
+                error_type=type(e).__name__,
+                response_time_ms=(time.time() - start_time) * 1000,
+                time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+            ))
+    
+    @staticmethod
+    def _convert_messages(messages: List[Dict[str, str]]) -> tuple[str, List[Dict[str, str]]]:
+        """Split out the system prompt and convert the rest to Claude format"""
+        system_msg = ""
+        claude_messages = []
+        
+        for msg in messages:
+            if msg.get("role") == "system":
+                system_msg = msg.get("content", "")
+            else:
+                claude_messages.append({
+                    "role": msg.get("role"),
+                    "content": msg.get("content", "")
+                })
+        
+        return system_msg, claude_messages
+    
     async def test_connection(self) -> tuple[bool, Optional[QuotaInfo], float]:
         start_time = time.time()
         try:
@@ -116,13 +261,20 @@ class ClaudeProvider(BaseLLMProvider):
 class OpenAIProvider(BaseLLMProvider):
     """OpenAI GPT provider"""
     
+    # Whether the API serves GET /models, used as a free health probe
+    supports_model_list = True
+    
     def __init__(self, api_key: str, model_name: str = "gpt-4", api_base: Optional[str] = None):
         super().__init__(api_key, model_name, api_base)
         # If api_base is None, let OpenAI client use its default (which may be proxied)
+        # Retries are handled by the resilience layer, not the SDK
         if api_base:
-            self.client = openai.AsyncOpenAI(api_key=api_key, base_url=api_base)
+            self.client = openai.AsyncOpenAI(api_key=api_key, base_url=api_base, http_client=_make_http_client(), max_retries=0)
         else:
-            self.client = openai.AsyncOpenAI(api_key=api_key)
+            self.client = openai.AsyncOpenAI(api_key=api_key, http_client=_make_http_client(), max_retries=0)
+    
+    async def aclose(self):
+        await self.client.close()
     
     async def generate_response(
         self, 
@@ -152,28 +304,105 @@ class OpenAIProvider(BaseLLMProvider):
             return LLMResponse(
                 content="",
                 error=str(e),
+                error_status=_error_status(e),
+                error_type=type(e).__name__,
                 response_time_ms=(time.time() - start_time) * 1000
             )
     
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[LLMStreamChunk]:
+        start_time = time.time()
+        first_token_time = None
+        content_parts = []
+        tokens_used = 0
+        
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            
+            async for chunk in stream:
+                # Some OpenAI-compatible APIs report usage on the final chunk; OpenAI
+                # itself only does when asked, which this SDK version can't do
+                usage = getattr(chunk, "usage", None)
+                if usage:
+                    # SDK versions that don't model the field leave it a plain dict
+                    tokens_used = usage["total_tokens"] if isinstance(usage, dict) else usage.total_tokens
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    content_parts.append(delta)
+                    yield LLMStreamChunk(delta=delta)
+            
+            content = "".join(content_parts)
+            yield LLMStreamChunk(done=True, response=LLMResponse(
+                content=content,
+                tokens_used=tokens_used or _estimated_usage(messages, content),
+                response_time_ms=(time.time() - start_time) * 1000,
+                time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+            ))
+            
+        except Exception as e:
+            yield LLMStreamChunk(done=True, response=LLMResponse(
+                content="".join(content_parts),
+                error=str(e),
+                error_status=_error_status(e),
+                error_type=type(e).__name__,
+                response_time_ms=(time.time() - start_time) * 1000,
+                time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+            ))
+    
     async def test_connection(self) -> tuple[bool, Optional[QuotaInfo], float]:
         start_time = time.time()
         try:
             # Just test with a simple request
-            await self.generate_response([{"role": "user", "content": "Hi"}], max_tokens=10)
+            response = await self.generate_response([{"role": "user", "content": "Hi"}], max_tokens=10)
             response_time = (time.time() - start_time) * 1000
-            return True, None, response_time
+            return response.error is None, None, response_time
                     
         except Exception as e:
             response_time = (time.time() - start_time) * 1000
             return False, None, response_time
+    
+    async def probe(self) -> tuple[bool, Optional[QuotaInfo], float]:
+        if not self.supports_model_list:
+            return await self.test_connection()
+        
+        start_time = time.time()
+        try:
+            # Listing models is free and still exercises auth and connectivity
+            await self.client.models.list()
+            return True, None, (time.time() - start_time) * 1000
+        except Exception as e:
+            return False, None, (time.time() - start_time) * 1000
 
 class GeminiProvider(BaseLLMProvider):
     """Google Gemini provider"""
     
     def __init__(self, api_key: str, model_name: str = "gemini-pro", api_base: Optional[str] = None):
         super().__init__(api_key, model_name, api_base)
-        genai.configure(api_key=api_key)
+        # Give the model its own client instead of calling the process-global
+        # genai.configure(), which would switch the key for every Gemini provider
+        self._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
         self.model = genai.GenerativeModel(model_name)
+        self.model._async_client = self._async_client
+        self._model_client: Optional[glm.ModelServiceAsyncClient] = None
+    
+    async def aclose(self):
+        await self._async_client.transport.close()
+        if self._model_client:
+            await self._model_client.transport.close()
     
     async def generate_response(
         self, 
@@ -184,8 +413,7 @@ class GeminiProvider(BaseLLMProvider):
         start_time = time.time()
         
         try:
-            # Convert to Gemini format (simple prompt for now)
-            prompt = "\n".join([f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages])
+            prompt = self._build_prompt(messages)
             
             response = await self.model.generate_content_async(
                 prompt,
@@ -207,9 +435,66 @@ class GeminiProvider(BaseLLMProvider):
             return LLMResponse(
                 content="",
                 error=str(e),
+                error_status=_error_status(e),
+                error_type=type(e).__name__,
                 response_time_ms=(time.time() - start_time) * 1000
             )
     
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[LLMStreamChunk]:
+        start_time = time.time()
+        first_token_time = None
+        content_parts = []
+        tokens_used = 0
+        
+        try:
+            response = await self.model.generate_content_async(
+                self._build_prompt(messages),
+                generation_config=genai.types.GenerationConfig(
+                    temperature=temperature,
+                    max_output_tokens=max_tokens
+                ),
+                stream=True
+            )
+            
+            async for chunk in response:
+                delta = chunk.text
+                if delta:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    content_parts.append(delta)
+                    yield LLMStreamChunk(delta=delta)
+                usage = getattr(chunk, "usage_metadata", None)
+                if usage:
+                    tokens_used = usage.total_token_count
+            
+            content = "".join(content_parts)
+            yield LLMStreamChunk(done=True, response=LLMResponse(
+                content=content,
+                tokens_used=tokens_used or _estimated_usage(messages, content),
+                response_time_ms=(time.time() - start_time) * 1000,
+                time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+            ))
+            
+        except Exception as e:
+            yield LLMStreamChunk(done=True, response=LLMResponse(
+                content="".join(content_parts),
+                error=str(e),
+                error_status=_error_status(e),
+                error_type=type(e).__name__,
+                response_time_ms=(time.time() - start_time) * 1000,
+                time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+            ))
+    
+    @staticmethod
+    def _build_prompt(messages: List[Dict[str, str]]) -> str:
+        """Convert to Gemini format (simple prompt for now)"""
+        return "\n".join([f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages])
+    
     async def test_connection(self) -> tuple[bool, Optional[QuotaInfo], float]:
         start_time = time.time()
         try:
@@ -219,6 +504,18 @@ class GeminiProvider(BaseLLMProvider):
         except Exception as e:
             response_time = (time.time() - start_time) * 1000
             return False, None, response_time
+    
+    async def probe(self) -> tuple[bool, Optional[QuotaInfo], float]:
+        start_time = time.time()
+        try:
+            # Model metadata lookup is free and still exercises auth and connectivity
+            if self._model_client is None:
+                self._model_client = glm.ModelServiceAsyncClient(client_options={"api_key": self.api_key})
+            name = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+            await self._model_client.get_model(name=name)
+            return True, None, (time.time() - start_time) * 1000
+        except Exception as e:
+            return False, None, (time.time() - start_time) * 1000
 
 class DeepSeekProvider(OpenAIProvider):
     """DeepSeek provider (OpenAI compatible)"""
@@ -237,6 +534,8 @@ class KimiProvider(OpenAIProvider):
 class QwenProvider(OpenAIProvider):
     """Alibaba Qwen provider (OpenAI compatible)"""
     
+    supports_model_list = False
+    
     def __init__(self, api_key: str, model_name: str = "qwen-turbo", api_base: Optional[str] = None):
         api_base = api_base or "https://dashscope.aliyuncs.com/compatible-mode/v1"
         super().__init__(api_key, model_name, api_base)
@@ -244,10 +543,164 @@ class QwenProvider(OpenAIProvider):
 class ZhipuProvider(OpenAIProvider):
     """Zhipu GLM provider (OpenAI compatible)"""
     
+    supports_model_list = False
+    
     def __init__(self, api_key: str, model_name: str = "glm-4", api_base: Optional[str] = None):
         api_base = api_base or "https://open.bigmodel.cn/api/paas/v4"
         super().__init__(api_key, model_name, api_base)
 
+@dataclass
+class MockConfig:
+    """Behaviour of the mock provider, read from the query string of its api_base
+    
+    e.g. mock://local?ttft_ms=400&ttft_sigma=0.5&tokens_per_s=60&failure_rate=0.05
+    """
+    ttft_ms: float = 300.0  # Median time to first token
+    ttft_sigma: float = 0.3  # Log-normal spread of the time to first token (0 = fixed)
+    tokens_per_s: float = 50.0  # Generation speed after the first token (0 = instant)
+    response_tokens: int = 120  # Mean response length in tokens (words)
+    chunk_tokens: int = 3  # Tokens per streamed chunk
+    failure_rate: float = 0.0  # Fraction of calls that fail
+    failure_status: int = 500  # HTTP status reported for injected failures
+    midstream_failure_rate: float = 0.0  # Fraction of calls that fail halfway through the stream
+    stall_rate: float = 0.0  # Fraction of calls that stall before answering
+    stall_ms: float = 30000.0  # How long a stalled call takes to start
+    seed: int = 0  # Same seed + same conversation = same response and timings
+    
+    @classmethod
+    def from_url(cls, url: Optional[str]) -> "MockConfig":
+        config = cls()
+        if not url:
+            return config
+        for name, value in parse_qsl(urlsplit(url).query):
+            if name not in cls.__dataclass_fields__:
+                raise ValueError(f"Unknown mock provider option: {name}")
+            setattr(config, name, type(getattr(config, name))(value))
+        return config
+
+# Words the mock provider builds responses from
+_MOCK_WORDS = (
+    "we should consider the tradeoffs between latency and cost before we agree on a plan "
+    "I agree with the previous point but the data suggests a different approach may scale better "
+    "another option is to prototype first measure the results and iterate on what works"
+).split()
+
+class MockProvider(BaseLLMProvider):
+    """Offline provider with configurable latency, streaming and failures
+    
+    Needs no network or API key (any non-empty key passes the health checker)
+    and is deterministic: the response text, timings and injected failures
+    depend only on the seed and the conversation, so benchmark runs can be
+    compared. Configure it through api_base, see MockConfig.
+    """
+    
+    def __init__(self, api_key: str, model_name: str = "mock", api_base: Optional[str] = None):
+        super().__init__(api_key, model_name, api_base)
+        self.config = MockConfig.from_url(api_base)
+    
+    def _rng(self, messages: List[Dict[str, str]]) -> random.Random:
+        digest = hashlib.sha256(repr((self.config.seed, self.model_name, messages)).encode()).digest()
+        return random.Random(digest)
+    
+    def _plan(self, messages: List[Dict[str, str]], max_tokens: int):
+        """Decide a call's outcome up front: (ttft seconds, words, failure)"""
+        config = self.config
+        rng = self._rng(messages)
+        ttft = config.ttft_ms / 1000
+        if config.ttft_sigma > 0:
+            ttft *= rng.lognormvariate(0, config.ttft_sigma)
+        if rng.random() < config.stall_rate:
+            ttft += config.stall_ms / 1000
+        
+        length = max(1, min(max_tokens, int(rng.gauss(config.response_tokens, config.response_tokens / 4))))
+        words = [f"[{self.model_name}]"] + [rng.choice(_MOCK_WORDS) for _ in range(length - 1)]
+        
+        failure = None
+        roll = rng.random()
+        if roll < config.failure_rate:
+            failure = "start"
+        elif roll < config.failure_rate + config.midstream_failure_rate:
+            failure = "midstream"
+        return ttft, words, failure
+    
+    def _error(self, start_time: float, content: str = "", first_token_time: Optional[float] = None) -> LLMResponse:
+        return LLMResponse(
+            content=content,
+            error=f"Mock provider failure (HTTP {self.config.failure_status})",
+            error_status=self.config.failure_status,
+            error_type="MockProviderError",
+            response_time_ms=(time.time() - start_time) * 1000,
+            time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+        )
+    
+    async def generate_response(
+        self, 
+        messages: List[Dict[str, str]], 
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> LLMResponse:
+        start_time = time.time()
+        ttft, words, failure = self._plan(messages, max_tokens)
+        await asyncio.sleep(ttft)
+        if failure == "start":
+            return self._error(start_time)
+        generated = len(words) // 2 if failure == "midstream" else len(words)
+        if self.config.tokens_per_s > 0:
+            await asyncio.sleep(generated / self.config.tokens_per_s)
+        if failure == "midstream":
+            return self._error(start_time)
+        return LLMResponse(
+            content=" ".join(words),
+            tokens_used=len(words) + sum(len(m["content"].split()) for m in messages),
+            response_time_ms=(time.time() - start_time) * 1000,
+            time_to_first_token_ms=ttft * 1000
+        )
+    
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[LLMStreamChunk]:
+        start_time = time.time()
+        first_token_time = None
+        content_parts = []
+        ttft, words, failure = self._plan(messages, max_tokens)
+        
+        await asyncio.sleep(ttft)
+        if failure == "start":
+            yield LLMStreamChunk(done=True, response=self._error(start_time))
+            return
+        
+        chunk_size = max(1, self.config.chunk_tokens)
+        fail_at = len(words) // 2 if failure == "midstream" else None
+        for i in range(0, len(words), chunk_size):
+            if fail_at is not None and i >= fail_at:
+                yield LLMStreamChunk(done=True, response=self._error(start_time, "".join(content_parts), first_token_time))
+                return
+            if i and self.config.tokens_per_s > 0:
+                await asyncio.sleep(chunk_size / self.config.tokens_per_s)
+            if first_token_time is None:
+                first_token_time = time.time()
+            delta = (" " if i else "") + " ".join(words[i:i + chunk_size])
+            content_parts.append(delta)
+            yield LLMStreamChunk(delta=delta)
+        
+        yield LLMStreamChunk(done=True, response=LLMResponse(
+            content="".join(content_parts),
+            tokens_used=len(words) + sum(len(m["content"].split()) for m in messages),
+            response_time_ms=(time.time() - start_time) * 1000,
+            time_to_first_token_ms=_elapsed_ms(start_time, first_token_time)
+        ))
+    
+    async def test_connection(self) -> tuple[bool, Optional[QuotaInfo], float]:
+        start_time = time.time()
+        response = await self.generate_response([{"role": "user", "content": "Hi"}], max_tokens=10)
+        return response.error is None, None, (time.time() - start_time) * 1000
+    
+    async def probe(self) -> tuple[bool, Optional[QuotaInfo], float]:
+        return True, None, 0.0
+
 # Provider factory
 PROVIDER_MAP = {
     "claude": ClaudeProvider,
@@ -257,6 +710,7 @@ PROVIDER_MAP = {
     "kimi": KimiProvider,
     "qwen": QwenProvider,
     "zhipu": ZhipuProvider,
+    "mock": MockProvider,
 }
 
 def create_provider(provider_type: str, api_key: str, model_name: str, api_base: Optional[str] = None) -> BaseLLMProvider:
@@ -267,6 +721,87 @@ def create_provider(provider_type: str, api_key: str, model_name: str, api_base:
     
     return provider_class(api_key, model_name, api_base)
 
+class ProviderRegistry:
+    """Process-wide cache of provider instances and their long-lived clients
+    
+    Providers are keyed by (provider_type, api key hash, model, api_base), so a
+    session turn, a health check and a manual test against the same config all
+    reuse one client and its keep-alive connection pool.
+    
+    Callers hold a provider through ``lease()``. A provider invalidated while
+    leased is closed when its last lease ends, and its key is retired: callers
+    still working from the old config (a running session's snapshot) get a
+    one-off client instead of re-pooling it. Only the most recent
+    ``max_retired`` keys are remembered.
+    """
+    
+    def __init__(self, max_retired: int = 256):
+        self._providers: Dict[tuple, BaseLLMProvider] = {}
+        # Open leases per provider instance, pooled or not
+        self._leases: Dict[int, int] = {}
+        # Retired keys, oldest first; the API key is only kept as its hash
+        self._retired: "OrderedDict[tuple, None]" = OrderedDict()
+        self.max_retired = max_retired
+    
+    @staticmethod
+    def _key(provider_type: str, api_key: str, model_name: str, api_base: Optional[str]) -> tuple:
+        api_key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()
+        return (provider_type.lower(), api_key_hash, model_name, api_base or None)
+    
+    @asynccontextmanager
+    async def lease(self, provider_type: str, api_key: str, model_name: str,
+                    api_base: Optional[str] = None) -> AsyncIterator[BaseLLMProvider]:
+        """Hold the shared provider for a config (created on first use) for the block"""
+        key = self._key(provider_type, api_key, model_name, api_base)
+        provider = self._providers.get(key)
+        if provider is None:
+            provider = create_provider(provider_type, api_key, model_name, api_base)
+            if key not in self._retired:
+                self._providers[key] = provider
+        self._leases[id(provider)] = self._leases.get(id(provider), 0) + 1
+        try:
+            yield provider
+        finally:
+            remaining = self._leases.pop(id(provider)) - 1
+            if remaining:
+                self._leases[id(provider)] = remaining
+            elif self._providers.get(key) is not provider:
+                await _close_quietly(provider)
+    
+    def reinstate(self, provider_type: str, api_key: str, model_name: str, api_base: Optional[str] = None):
+        """Let a config be pooled again (it was just saved, so callers using it are current)"""
+        self._retired.pop(self._key(provider_type, api_key, model_name, api_base), None)
+    
+    async def invalidate(self, provider_type: str, api_key: str, model_name: str, api_base: Optional[str] = None):
+        """Retire the provider for a config (after it was updated or deleted)
+        
+        Its client is closed now if unused, otherwise when the last lease ends.
+        """
+        key = self._key(provider_type, api_key, model_name, api_base)
+        self._retired[key] = None
+        self._retired.move_to_end(key)
+        while len(self._retired) > self.max_retired:
+            self._retired.popitem(last=False)
+        provider = self._providers.pop(key, None)
+        if provider is not None and id(provider) not in self._leases:
+            await _close_quietly(provider)
+    
+    async def close_all(self):
+        """Close every pooled client (on application shutdown)"""
+        providers = list(self._providers.values())
+        self._providers.clear()
+        for provider in providers:
+            await _close_quietly(provider)
+
+async def _close_quietly(provider: BaseLLMProvider):
+    try:
+        await provider.aclose()
+    except Exception:
+        pass
+
+# Global provider registry instance
+provider_registry = ProviderRegistry()
+
 # Default providers configuration
 DEFAULT_PROVIDERS = [
     {
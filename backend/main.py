@@ -7,12 +7,12 @@ from datetime import datetime
 from typing import List, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, tuple_
 
 from models import (
     init_db, get_db, async_session_maker, LLMProvider, Session, Message, 
@@ -24,10 +24,19 @@ from schemas import (
     MessageCreate, MessageResponse, ConsensusPointCreate, ConsensusPointResponse,
     TestConnectionResponse, SystemStats, WSMessageType
 )
-from llm_providers import create_provider, DEFAULT_PROVIDERS
-from websocket_manager import ConnectionManager, manager, send_error
+from llm_providers import provider_registry, DEFAULT_PROVIDERS
+from websocket_manager import ConnectionManager, manager, send_error, ENCODINGS
 from brainstorm_engine import BrainstormEngine
 from health_checker import health_checker
+from session_scheduler import session_scheduler, SessionRun
+from rate_limiter import rate_limiter
+from resilience import resilience
+from provider_metrics import provider_metrics
+from message_sink import message_sink
+from pagination import encode_cursor, decode_cursor
+from system_stats import system_stats
+import metrics
+from tracing import tracer
 
 # Lifespan context manager
 @asynccontextmanager
@@ -56,16 +65,34 @@ async def lifespan(app: FastAPI):
             await db.commit()
             print("Initialized default LLM providers")
     
+    # Start receiving WebSocket events from other workers
+    await manager.start()
+    
+    # Start batched message writes
+    message_sink.start()
+    
     # Start health checker background task
     health_checker.start()
     print("LLM Health Checker started")
+    provider_metrics.start()
+    tracer.start()
     
     yield
     
     # Shutdown
     print("Shutting down...")
+    await session_scheduler.shutdown()
+    print("Running sessions stopped")
+    await message_sink.stop()
+    print("Pending messages written")
     await health_checker.stop()
     print("LLM Health Checker stopped")
+    await provider_metrics.stop()
+    print("Provider metrics flushed")
+    await tracer.stop()
+    await manager.stop()
+    await provider_registry.close_all()
+    print("LLM provider clients closed")
 
 # Create FastAPI app
 app = FastAPI(
@@ -82,6 +109,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # ============== LLM Provider Endpoints ==============
@@ -121,6 +149,16 @@ async def get_providers(db: AsyncSession = Depends(get_db)):
     
     return response_data
 
+@app.get("/api/providers/rate-limits")
+async def get_rate_limits():
+    """Get rate limiter state and queue-wait stats per provider"""
+    return rate_limiter.stats()
+
+@app.get("/api/providers/metrics")
+async def get_provider_metrics():
+    """Get rolling latency and success metrics per provider from real traffic"""
+    return provider_metrics.snapshot_all()
+
 @app.get("/api/providers/{provider_id}", response_model=LLMProviderResponse)
 async def get_provider(provider_id: int, db: AsyncSession = Depends(get_db)):
     """Get a specific LLM provider"""
@@ -184,6 +222,8 @@ async def create_provider_config(
     await db.commit()
     await db.refresh(provider)
     
+    provider_registry.reinstate(provider.provider_type, provider.api_key, provider.model_name, provider.api_base)
+    
     return provider
 
 @app.put("/api/providers/{provider_id}", response_model=LLMProviderResponse)
@@ -199,6 +239,9 @@ async def update_provider(
     if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
     
+    # Remember the old client config so its pooled client can be dropped
+    old_config = (provider.provider_type, provider.api_key, provider.model_name, provider.api_base)
+    
     # Update fields
     update_data = provider_data.dict(exclude_unset=True)
     for field, value in update_data.items():
@@ -208,6 +251,14 @@ async def update_provider(
     await db.commit()
     await db.refresh(provider)
     
+    await provider_registry.invalidate(*old_config)
+    provider_registry.reinstate(provider.provider_type, provider.api_key, provider.model_name, provider.api_base)
+    rate_limiter.update(provider_id, provider.config)
+    health_checker.reset_schedule(provider_id)
+    if provider.provider_type != old_config[0]:
+        # Its series are labelled with the old type
+        metrics.remove_provider(provider_id)
+    
     return provider
 
 @app.delete("/api/providers/{provider_id}")
@@ -219,9 +270,18 @@ async def delete_provider(provider_id: int, db: AsyncSession = Depends(get_db)):
     if not provider:
         raise HTTPException(status_code=404, detail="Provider not found")
     
+    old_config = (provider.provider_type, provider.api_key, provider.model_name, provider.api_base)
+    
     await db.delete(provider)
     await db.commit()
     
+    await provider_registry.invalidate(*old_config)
+    rate_limiter.remove(provider_id)
+    resilience.remove(provider_id)
+    provider_metrics.remove(provider_id)
+    metrics.remove_provider(provider_id)
+    health_checker.reset_schedule(provider_id)
+    
     return {"message": "Provider deleted successfully"}
 
 @app.get("/api/providers/{provider_id}/apikey")
@@ -255,15 +315,15 @@ async def test_provider_connection(provider_id: int, db: AsyncSession = Depends(
     await db.commit()
     
     try:
-        # Create provider and test connection
-        llm_provider = create_provider(
+        # Test the connection on the shared provider
+        async with provider_registry.lease(
             provider.provider_type,
             provider.api_key,
             provider.model_name,
             provider.api_base
-        )
-        
-        success, quota_info, response_time_ms = await llm_provider.test_connection()
+        ) as llm_provider:
+            async with rate_limiter.acquire(provider.id, provider.config, estimated_tokens=20):
+                success, quota_info, response_time_ms = await llm_provider.test_connection()
         
         if success:
             provider.status = LLMProviderStatus.ONLINE
@@ -308,23 +368,42 @@ async def test_provider_connection(provider_id: int, db: AsyncSession = Depends(
 
 # ============== Session Endpoints ==============
 
+def _parse_cursor(after: str):
+    try:
+        return decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/sessions", response_model=List[SessionResponse])
 async def get_sessions(
+    response: Response,
     skip: int = 0, 
     limit: int = 100,
+    after: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all brainstorming sessions"""
+    """Get all brainstorming sessions, newest first
+    
+    Pass the X-Next-Cursor header of a full page as ``after`` to get the next
+    page; unlike ``skip``, its cost doesn't grow with the page depth.
+    """
     from sqlalchemy.orm import selectinload
     
-    result = await db.execute(
+    query = (
         select(Session)
         .options(selectinload(Session.llms))
-        .order_by(Session.created_at.desc())
-        .offset(skip)
+        .order_by(Session.created_at.desc(), Session.id.desc())
         .limit(limit)
     )
+    if after:
+        query = query.where(tuple_(Session.created_at, Session.id) < tuple_(*_parse_cursor(after)))
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
     sessions = result.scalars().all()
+    
+    if len(sessions) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(sessions[-1].created_at, sessions[-1].id)
     return sessions
 
 @app.get("/api/sessions/{session_id}", response_model=SessionDetailResponse)
@@ -332,6 +411,9 @@ async def get_session(session_id: int, db: AsyncSession = Depends(get_db)):
     """Get a specific session with messages"""
     from sqlalchemy.orm import selectinload
     
+    # Include messages still queued in the write-behind sink, if they can be written
+    await message_sink.flush_quietly()
+    
     result = await db.execute(
         select(Session)
         .where(Session.id == session_id)
@@ -369,7 +451,9 @@ async def create_session(
         topic=session_data.topic,
         max_rounds=session_data.max_rounds,
         temperature=session_data.temperature,
-        max_tokens=session_data.max_tokens
+        max_tokens=session_data.max_tokens,
+        round_mode=session_data.round_mode.value,
+        round_timeout_seconds=session_data.round_timeout_seconds
     )
     
     db.add(session)
@@ -434,19 +518,33 @@ async def delete_session(session_id: int, db: AsyncSession = Depends(get_db)):
 @app.get("/api/sessions/{session_id}/messages", response_model=List[MessageResponse])
 async def get_messages(
     session_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get messages for a session"""
-    result = await db.execute(
+    """Get messages for a session, oldest first
+    
+    Pass the X-Next-Cursor header of a full page as ``after`` to get the next
+    page; unlike ``skip``, its cost doesn't grow with the page depth.
+    """
+    await message_sink.flush_quietly()
+    query = (
         select(Message)
         .where(Message.session_id == session_id)
-        .order_by(Message.created_at)
-        .offset(skip)
+        .order_by(Message.created_at, Message.id)
         .limit(limit)
     )
+    if after:
+        query = query.where(tuple_(Message.created_at, Message.id) > tuple_(*_parse_cursor(after)))
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
     messages = result.scalars().all()
+    
+    if len(messages) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(messages[-1].created_at, messages[-1].id)
     return messages
 
 # ============== Brainstorm Control Endpoints ==============
@@ -466,23 +564,52 @@ async def start_brainstorm(
     if session.is_completed:
         raise HTTPException(status_code=400, detail="Session already completed")
     
-    # Start the brainstorm in background with a new DB session
-    async def run_brainstorm():
-        from models import async_session_maker
+    # Run the brainstorm in the scheduler with a new DB session
+    async def run_brainstorm(run: SessionRun):
         async with async_session_maker() as new_db:
-            try:
-                engine = BrainstormEngine(new_db)
-                await engine.start_brainstorm(session_id)
-            except Exception as e:
-                print(f"Brainstorm error: {e}")
-                import traceback
-                traceback.print_exc()
+            engine = BrainstormEngine(new_db)
+            await engine.start_brainstorm(session_id, run)
     
-    # Run in background task
-    import asyncio
-    asyncio.create_task(run_brainstorm())
+    try:
+        run = session_scheduler.start(session_id, run_brainstorm)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    return {"message": "Brainstorm session started", "session_id": session_id}
+    return {"message": "Brainstorm session started", "session_id": session_id, "state": run.state}
+
+@app.get("/api/sessions/{session_id}/run")
+async def get_brainstorm_run(session_id: int):
+    """Get the scheduler state of a running brainstorming session"""
+    run = session_scheduler.get(session_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Session is not running")
+    
+    return run.to_dict()
+
+@app.get("/api/sessions/{session_id}/trace")
+async def get_session_trace(session_id: int, rounds: int = Query(5, ge=1, le=100)):
+    """Get span waterfalls for the last rounds traced in this process (see tracing)"""
+    return {
+        "session_id": session_id,
+        "sample_rate": tracer.sample_rate,
+        "rounds": [trace.waterfall() for trace in tracer.recent(session_id, rounds)]
+    }
+
+@app.post("/api/sessions/{session_id}/pause")
+async def pause_brainstorm(session_id: int):
+    """Pause a running brainstorming session before its next turn"""
+    if not session_scheduler.pause(session_id):
+        raise HTTPException(status_code=404, detail="Session is not running")
+    
+    return {"message": "Brainstorm session paused", "session_id": session_id}
+
+@app.post("/api/sessions/{session_id}/resume")
+async def resume_brainstorm(session_id: int):
+    """Resume a paused brainstorming session"""
+    if not session_scheduler.resume(session_id):
+        raise HTTPException(status_code=404, detail="Session is not running")
+    
+    return {"message": "Brainstorm session resumed", "session_id": session_id}
 
 @app.post("/api/sessions/{session_id}/stop")
 async def stop_brainstorm(
@@ -491,19 +618,33 @@ async def stop_brainstorm(
 ):
     """Stop an active brainstorming session"""
     engine = BrainstormEngine(db)
-    await engine.stop_session(session_id)
+    if not await engine.stop_session(session_id):
+        return {"message": "Brainstorm session is not running", "session_id": session_id}
     
     return {"message": "Brainstorm session stopped", "session_id": session_id}
 
 # ============== WebSocket Endpoint ==============
 
 @app.websocket("/ws/sessions/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: int):
-    """WebSocket endpoint for real-time session updates"""
+async def websocket_endpoint(
+    websocket: WebSocket,
+    session_id: int,
+    last_seq: Optional[int] = None,
+    encoding: str = "json"
+):
+    """WebSocket endpoint for real-time session updates
+    
+    Reconnecting clients pass the seq of the last event they received as
+    ``last_seq`` to have missed events replayed. ``encoding=msgpack`` selects
+    compact binary frames instead of JSON.
+    """
     print(f"WebSocket connection attempt for session {session_id}")
     print(f"WebSocket headers: {websocket.headers}")
+    if encoding not in ENCODINGS:
+        await websocket.close(code=1008, reason=f"Unsupported encoding: {encoding}")
+        return
     try:
-        await manager.connect(websocket, session_id)
+        await manager.connect(websocket, session_id, last_seq, encoding)
         print(f"WebSocket connected successfully for session {session_id}")
     except Exception as e:
         print(f"WebSocket connection failed: {e}")
@@ -520,27 +661,10 @@ async def websocket_endpoint(websocket: WebSocket, session_id: int):
                 # Handle user message
                 content = message_data.get("content", "")
                 if content:
+                    # Queued in the message sink and broadcast by the engine
                     async with async_session_maker() as db:
-                        try:
-                            engine = BrainstormEngine(db)
-                            message = await engine.add_user_message(session_id, content)
-                            await db.commit()
-                            
-                            # Broadcast new message to all connected clients
-                            await manager.broadcast_to_session(session_id, {
-                                "type": WSMessageType.NEW_MESSAGE,
-                                "data": {
-                                    "id": message.id,
-                                    "role": message.role,
-                                    "content": message.content,
-                                    "llm_id": message.llm_id,
-                                    "created_at": message.created_at.isoformat()
-                                }
-                            })
-                        except Exception as e:
-                            await db.rollback()
-                            print(f"Error adding user message: {e}")
-                            raise
+                        engine = BrainstormEngine(db)
+                        await engine.add_user_message(session_id, content)
             
             elif message_type == WSMessageType.START_BRAINSTORM:
                 # Start brainstorm
@@ -562,38 +686,16 @@ async def websocket_endpoint(websocket: WebSocket, session_id: int):
 # ============== Stats Endpoints ==============
 
 @app.get("/api/stats", response_model=SystemStats)
-async def get_system_stats(db: AsyncSession = Depends(get_db)):
-    """Get system statistics"""
-    # Count sessions
-    session_result = await db.execute(select(func.count(Session.id)))
-    total_sessions = session_result.scalar()
-    
-    active_result = await db.execute(
-        select(func.count(Session.id)).where(Session.is_active == True)
-    )
-    active_sessions = active_result.scalar()
-    
-    # Count messages
-    message_result = await db.execute(select(func.count(Message.id)))
-    total_messages = message_result.scalar()
-    
-    # Count LLMs
-    llm_result = await db.execute(select(func.count(LLMProvider.id)))
-    total_llms = llm_result.scalar()
-    
-    online_result = await db.execute(
-        select(func.count(LLMProvider.id))
-        .where(LLMProvider.status == LLMProviderStatus.ONLINE)
-    )
-    online_llms = online_result.scalar()
-    
-    return SystemStats(
-        total_sessions=total_sessions,
-        active_sessions=active_sessions,
-        total_messages=total_messages,
-        total_llms=total_llms,
-        online_llms=online_llms
-    )
+async def get_system_stats():
+    """Get system statistics (cached for a few seconds, see system_stats)"""
+    return SystemStats(**await system_stats.get())
+
+# ============== Metrics ==============
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint (see metrics)"""
+    return Response(content=metrics.registry.expose(), media_type=metrics.CONTENT_TYPE)
 
 # ============== Health Check ==============
 
@@ -622,6 +724,7 @@ if __name__ == "__main__":
         port=8000,
         ws_ping_interval=20,  # WebSocket ping interval in seconds
         ws_ping_timeout=20,   # WebSocket ping timeout in seconds
+        ws_per_message_deflate=True,  # Negotiate permessage-deflate compression
         timeout_keep_alive=300,  # Keep-alive timeout
         log_level="info"
     )
@@ -0,0 +1,283 @@
+"""
+Message sink - write-behind batching of Message inserts and SessionLLM counters
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import DataError, IntegrityError
+
+from models import IdBlock, Message, MessageRole, SessionLLM, SystemCounter, async_session_maker
+from system_stats import MESSAGES_COUNTER, system_stats
+from metrics import db_commit_seconds, messages_dead_lettered
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Errors a row will hit however often it is retried
+PERMANENT_ERRORS = (IntegrityError, DataError)
+
+class IdAllocator:
+    """Hands out primary keys from blocks reserved in id_blocks
+
+    Rows get their ID before they are written, so they can be broadcast
+    immediately. Reserving a block is a single atomic UPDATE, which keeps IDs
+    unique across worker processes sharing the database.
+    """
+
+    def __init__(self, model, block_size: int = 1000):
+        self.model = model
+        self.name = model.__tablename__
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        if self._next >= self._end:
+            async with self._lock:
+                if self._next >= self._end:
+                    self._next, self._end = await self._reserve()
+        value = self._next
+        self._next += 1
+        return value
+
+    async def _reserve(self) -> Tuple[int, int]:
+        async with async_session_maker() as db:
+            result = await db.execute(
+                update(IdBlock)
+                .where(IdBlock.name == self.name)
+                .values(next_id=IdBlock.next_id + self.block_size)
+                .returning(IdBlock.next_id)
+            )
+            end = result.scalar_one_or_none()
+            if end is not None:
+                await db.commit()
+                return end - self.block_size, end
+
+            # First block: start above any rows written before the sink existed
+            max_id = (await db.execute(select(func.max(self.model.id)))).scalar() or 0
+            end = max_id + 1 + self.block_size
+            db.add(IdBlock(name=self.name, next_id=end))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Another worker created the row first; reserve from it
+                await db.rollback()
+                return await self._reserve()
+            return max_id + 1, end
+
+class MessageSink:
+    """Write-behind buffer for messages
+
+    Messages are assigned an ID and timestamp immediately and written in
+    batches, together with the per-session LLM counters and the system
+    message count they affect, in one transaction per flush. Flushes happen
+    every flush_interval seconds, when max_batch rows are pending, and when
+    a caller asks (round end, reads, shutdown).
+
+    A failed batch is requeued and retried, up to max_attempts times (at
+    once for a constraint or data error). It is then written one row at a
+    time, so a row that can't be written (e.g. its session was deleted) is
+    logged and set aside in dead_letters instead of blocking every later
+    flush. Only constraint and data errors dead-letter a row; on any other
+    error the database is taken to be unavailable and the rest of the batch
+    waits for the next flush.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, max_batch: int = 500, id_block_size: int = 1000,
+                 max_attempts: int = 3):
+        """
+        Initialize message sink
+
+        Args:
+            flush_interval: Longest time a message stays unwritten
+            max_batch: Pending rows that trigger an early flush
+            id_block_size: Message IDs reserved per database round-trip
+            max_attempts: Failed batch writes before the batch is written row by row
+        """
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.ids = IdAllocator(Message, id_block_size)
+        self._commit_seconds = db_commit_seconds.labels("message_flush")
+        self._pending: List[dict] = []
+        # (session_id, llm_id) -> [message_count, total_tokens] increments
+        self._counters: Dict[Tuple[int, int], List[int]] = {}
+        self._failed_attempts = 0
+        # Rows that could not be written, most recent last
+        self.dead_letters: Deque[dict] = deque(maxlen=1000)
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def add_message(
+        self,
+        session_id: int,
+        role: MessageRole,
+        content: str,
+        llm_id: Optional[int] = None,
+        thinking_content: Optional[str] = None,
+        tokens_used: Optional[int] = None,
+        response_time_ms: Optional[float] = None,
+        time_to_first_token_ms: Optional[float] = None
+    ) -> dict:
+        """
+        Queue a message for writing
+
+        Returns:
+            The row as it will be inserted, including its id and created_at
+        """
+        row = {
+            "id": await self.ids.next_id(),
+            "session_id": session_id,
+            "llm_id": llm_id,
+            "role": role,
+            "content": content,
+            "thinking_content": thinking_content,
+            "tokens_used": tokens_used,
+            "response_time_ms": response_time_ms,
+            "time_to_first_token_ms": time_to_first_token_ms,
+            "sentiment": None,
+            "key_points": [],
+            "created_at": datetime.utcnow()
+        }
+        self._pending.append(row)
+
+        if role == MessageRole.ASSISTANT and llm_id is not None:
+            counters = self._counters.setdefault((session_id, llm_id), [0, 0])
+            counters[0] += 1
+            counters[1] += tokens_used or 0
+
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+        return row
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self):
+        """Write everything queued so far in one transaction"""
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            counters, self._counters = self._counters, {}
+            if not rows and not counters:
+                return
+
+            try:
+                await self._write(rows, counters)
+            except Exception as e:
+                self._failed_attempts += 1
+                if not isinstance(e, PERMANENT_ERRORS) and self._failed_attempts < self.max_attempts:
+                    # Ahead of anything added meanwhile, then let the caller know
+                    self._requeue(rows, counters)
+                    raise
+                logger.warning(f"Writing {len(rows)} messages failed ({e}); writing them one at a time")
+                await self._write_separately(rows, counters)
+            self._failed_attempts = 0
+
+    async def flush_quietly(self) -> bool:
+        """Flush, logging a failure instead of raising; for callers that can go on with what is committed"""
+        try:
+            await self.flush()
+            return True
+        except Exception as e:
+            logger.error(f"Error flushing messages: {str(e)}")
+            return False
+
+    async def _write(self, rows: List[dict], counters: Dict[Tuple[int, int], List[int]]):
+        async with async_session_maker() as db:
+            if rows:
+                await db.execute(insert(Message), rows)
+                await db.execute(
+                    update(SystemCounter)
+                    .where(SystemCounter.name == MESSAGES_COUNTER)
+                    .values(value=SystemCounter.value + len(rows))
+                )
+            for (session_id, llm_id), (message_count, total_tokens) in counters.items():
+                await db.execute(
+                    update(SessionLLM)
+                    .where(SessionLLM.session_id == session_id, SessionLLM.llm_id == llm_id)
+                    .values(
+                        message_count=func.coalesce(SessionLLM.message_count, 0) + message_count,
+                        total_tokens=func.coalesce(SessionLLM.total_tokens, 0) + total_tokens
+                    )
+                )
+            start = time.perf_counter()
+            with tracer.span("db_commit", rows=len(rows)):
+                await db.commit()
+            self._commit_seconds.observe(time.perf_counter() - start)
+        if rows:
+            system_stats.invalidate()
+
+    async def _write_separately(self, rows: List[dict], counters: Dict[Tuple[int, int], List[int]]):
+        """Write a batch that failed as a whole one row per transaction, dead-lettering unwritable rows"""
+        for index, row in enumerate(rows):
+            try:
+                await self._write([row], {})
+            except Exception as e:
+                if not isinstance(e, PERMANENT_ERRORS):
+                    # A lock or lost connection, not this row: keep it and the rest for the next flush
+                    self._requeue(rows[index:], counters)
+                    raise
+                self.dead_letters.append(row)
+                messages_dead_lettered.inc()
+                logger.error(
+                    f"Dropped message {row['id']} of session {row['session_id']} that can't be written: {str(e)}"
+                )
+        # UPDATEs only, which don't fail on a deleted session's rows
+        try:
+            await self._write([], counters)
+        except Exception:
+            self._requeue([], counters)
+            raise
+
+    def _requeue(self, rows: List[dict], counters: Dict[Tuple[int, int], List[int]]):
+        self._pending[:0] = rows
+        for key, (message_count, total_tokens) in counters.items():
+            pending = self._counters.setdefault(key, [0, 0])
+            pending[0] += message_count
+            pending[1] += total_tokens
+
+    async def run(self):
+        """Flush periodically, or early when a batch fills up"""
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error flushing messages: {str(e)}")
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self):
+        """Start the periodic flush as a background task"""
+        if not self.task:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the periodic flush and write out what is left"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+# Global message sink instance
+message_sink = MessageSink(
+    flush_interval=float(os.getenv("MESSAGE_FLUSH_INTERVAL", "0.5"))
+)
@@ -0,0 +1,302 @@
+"""
+Metrics - in-process counters, gauges and histograms served at GET /metrics
+
+Exposed in the Prometheus text format (version 0.0.4). Recording is cheap
+enough to stay on in production: a labelled metric is bound to its label
+values once (``labels()``) and the child kept, so the hot path is an
+attribute update or a bisect into a fixed bucket list, with no lookups or
+allocation. Updates aren't locked; everything that records runs on the
+event loop thread.
+"""
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# The response adds "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Seconds; spans a fast DB commit up to a slow LLM response
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class MetricsRegistry:
+    """Metrics that are rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric") -> "_Metric":
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self) -> str:
+        """All metrics in the Prometheus text format"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            metric.collect(lines)
+        return "\n".join(lines) + "\n"
+
+# Global metrics registry
+registry = MetricsRegistry()
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        # Buckets are "less than or equal", which is what bisect_left finds
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+class _Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # Unlabelled metrics record straight into their single child
+        self._default = None if self.labelnames else self.labels()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """
+        Child for one combination of label values
+
+        Bind children once (per provider, per operation, ...) and keep them;
+        building the key here is what the hot path should avoid.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        """Stop exporting a label combination (e.g. a deleted provider)"""
+        self._children.pop(tuple(str(value) for value in values), None)
+
+    @abstractmethod
+    def _new_child(self):
+        pass
+
+    def collect(self, lines: List[str]):
+        for key, child in self._children.items():
+            lines.append(f"{self.name}{self._format_labels(key)} {_format_value(child.value)}")
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter(_Metric):
+    """Monotonically increasing total; name it with a _total suffix"""
+
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down
+
+    A gauge can instead be read at scrape time from ``callback``, which
+    returns the value, or for a labelled gauge a dict of label value tuples
+    to values. That suits numbers other components already keep, like
+    connection counts, which then cost nothing between scrapes.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = registry,
+                 callback: Optional[Callable[[], object]] = None):
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def collect(self, lines: List[str]):
+        if self.callback is None:
+            super().collect(lines)
+            return
+        values = self.callback()
+        if not self.labelnames:
+            values = {(): values}
+        for key, value in values.items():
+            key = tuple(str(part) for part in key)
+            lines.append(f"{self.name}{self._format_labels(key)} {_format_value(value)}")
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[MetricsRegistry] = registry,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(float(bound) for bound in buckets if bound != math.inf))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def collect(self, lines: List[str]):
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (math.inf,), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+            labels = self._format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+# Application metrics
+
+llm_response_seconds = Histogram(
+    "synapsemind_llm_response_seconds",
+    "Time from request to the last token of an LLM response",
+    ["provider_id", "provider_type"]
+)
+llm_first_token_seconds = Histogram(
+    "synapsemind_llm_time_to_first_token_seconds",
+    "Time from request to the first token of an LLM response",
+    ["provider_id", "provider_type"]
+)
+llm_tokens = Counter(
+    "synapsemind_llm_tokens_total",
+    "Tokens used by LLM responses (prompt and completion)",
+    ["provider_id", "provider_type"]
+)
+llm_errors = Counter(
+    "synapsemind_llm_errors_total",
+    "LLM requests that failed or missed the round deadline",
+    ["provider_id", "provider_type"]
+)
+db_commit_seconds = Histogram(
+    "synapsemind_db_commit_seconds",
+    "Duration of engine write transactions",
+    ["operation"]
+)
+messages_dead_lettered = Counter(
+    "synapsemind_messages_dead_lettered_total",
+    "Messages the message sink gave up writing"
+)
+ws_fanout_seconds = Histogram(
+    "synapsemind_ws_fanout_seconds",
+    "Time to queue one event on every local connection of its session",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+)
+ws_evictions = Counter(
+    "synapsemind_ws_evictions_total",
+    "WebSocket connections dropped for falling behind"
+)
+rounds_in_flight = Gauge(
+    "synapsemind_rounds_in_flight",
+    "Discussion rounds currently running"
+)
+health_check_seconds = Histogram(
+    "synapsemind_health_check_seconds",
+    "Duration of provider health checks",
+    ["result"]
+)
+
+class ProviderInstruments:
+    """One provider's LLM metric children, bound once"""
+
+    __slots__ = ("response_seconds", "first_token_seconds", "tokens", "errors")
+
+    def __init__(self, provider_id: int, provider_type: str):
+        self.response_seconds = llm_response_seconds.labels(provider_id, provider_type)
+        self.first_token_seconds = llm_first_token_seconds.labels(provider_id, provider_type)
+        self.tokens = llm_tokens.labels(provider_id, provider_type)
+        self.errors = llm_errors.labels(provider_id, provider_type)
+
+_providers: Dict[int, ProviderInstruments] = {}
+
+def provider_instruments(provider_id: int, provider_type: str) -> ProviderInstruments:
+    """Bound LLM metrics for a provider"""
+    instruments = _providers.get(provider_id)
+    if instruments is None:
+        instruments = _providers[provider_id] = ProviderInstruments(provider_id, provider_type)
+    return instruments
+
+def remove_provider(provider_id: int):
+    """Stop exporting a deleted provider's series"""
+    if _providers.pop(provider_id, None) is None:
+        return
+    for family in (llm_response_seconds, llm_first_token_seconds, llm_tokens, llm_errors):
+        for key in [key for key in family._children if key[0] == str(provider_id)]:
+            family.remove(*key)
@@ -0,0 +1,144 @@
+"""
+Versioned schema migrations
+
+Each migration is a module in this package named vNNNN_<description>.py with
+an upgrade(conn) function that receives a synchronous SQLAlchemy connection.
+Migrations run in version order, each in its own transaction, and are
+recorded in the schema_migrations table. Set transactional = False in a
+module whose operations can't run inside a transaction (PostgreSQL CREATE
+INDEX CONCURRENTLY); it then runs in autocommit mode there.
+
+Run pending migrations with run_migrations() (done at startup) or from the
+backend directory with:
+
+    python -m migrations [upgrade|status]
+"""
+import re
+import logging
+import pkgutil
+import importlib
+from datetime import datetime
+from types import ModuleType
+from typing import List, Optional, Set
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateTable
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Held while migrating on PostgreSQL so only one worker migrates at a time
+_ADVISORY_LOCK_ID = 0x53594E41
+
+_MODULE_PATTERN = re.compile(r"^v(\d{4})_\w+$")
+
+def load_migrations() -> List[ModuleType]:
+    """All migration modules, in version order"""
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _MODULE_PATTERN.match(info.name)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{info.name}")
+        module.version = int(match.group(1))
+        migrations.append(module)
+    migrations.sort(key=lambda module: module.version)
+    return migrations
+
+async def applied_versions(engine: AsyncEngine) -> Set[int]:
+    """Versions recorded in schema_migrations"""
+    async with engine.begin() as conn:
+        # IF NOT EXISTS: workers starting together may both get here first
+        await conn.execute(CreateTable(schema_migrations, if_not_exists=True))
+        result = await conn.execute(select(schema_migrations.c.version))
+        return set(result.scalars())
+
+async def run_migrations(engine: Optional[AsyncEngine] = None) -> List[int]:
+    """
+    Apply pending migrations
+
+    Args:
+        engine: Engine to migrate (defaults to the application's)
+
+    Returns:
+        Versions applied by this call
+    """
+    if engine is None:
+        from models import engine
+
+    lock = None
+    if engine.dialect.name == "postgresql":
+        lock = await engine.connect()
+        await lock.exec_driver_sql(f"SELECT pg_advisory_lock({_ADVISORY_LOCK_ID})")
+
+    try:
+        applied = await applied_versions(engine)
+        newly_applied = []
+        for migration in load_migrations():
+            if migration.version in applied:
+                continue
+            logger.info(f"Applying migration {migration.__name__}")
+            if await _apply(engine, migration):
+                newly_applied.append(migration.version)
+        return newly_applied
+    finally:
+        if lock is not None:
+            await lock.exec_driver_sql(f"SELECT pg_advisory_unlock({_ADVISORY_LOCK_ID})")
+            await lock.close()
+
+async def _apply(engine: AsyncEngine, migration: ModuleType) -> bool:
+    sqlite = engine.dialect.name == "sqlite"
+    # transactional = False is for PostgreSQL; on SQLite it buys nothing
+    transactional = getattr(migration, "transactional", True) or sqlite
+    async with engine.connect() as conn:
+        if sqlite or not transactional:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not transactional:
+            await conn.run_sync(migration.upgrade)
+            return await _record(conn, migration)
+
+        # pysqlite doesn't open a transaction for DDL by itself; BEGIN
+        # IMMEDIATE does, and takes the write lock up front so workers
+        # starting together migrate one at a time
+        if sqlite:
+            await conn.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            await conn.begin()
+        try:
+            await conn.run_sync(migration.upgrade)
+            applied = await _record(conn, migration)
+        except Exception:
+            if sqlite:
+                await conn.exec_driver_sql("ROLLBACK")
+            else:
+                await conn.rollback()
+            raise
+        if sqlite:
+            await conn.exec_driver_sql("COMMIT")
+        else:
+            await conn.commit()
+        return applied
+
+async def _record(conn, migration: ModuleType) -> bool:
+    # Under the SQLite write lock or the PostgreSQL advisory lock, so this
+    # can't race another worker
+    recorded = await conn.execute(
+        select(schema_migrations.c.version).where(schema_migrations.c.version == migration.version)
+    )
+    if recorded.first():
+        logger.info(f"Migration {migration.__name__} was applied by another worker")
+        return False
+    await conn.execute(schema_migrations.insert().values(
+        version=migration.version,
+        name=migration.__name__.rsplit(".", 1)[-1],
+        applied_at=datetime.utcnow()
+    ))
+    return True
@@ -0,0 +1,35 @@
+"""
+Migration CLI
+
+Usage (from the backend directory, using DATABASE_URL):
+    python -m migrations [upgrade]   Apply pending migrations
+    python -m migrations status      List migrations and whether they are applied
+"""
+import sys
+import asyncio
+import logging
+
+from migrations import applied_versions, load_migrations, run_migrations
+
+async def main(command: str) -> int:
+    from models import engine
+
+    try:
+        if command == "upgrade":
+            applied = await run_migrations(engine)
+            print(f"Applied {len(applied)} migration(s)" if applied else "Database is up to date")
+        elif command == "status":
+            applied = await applied_versions(engine)
+            for migration in load_migrations():
+                state = "applied" if migration.version in applied else "pending"
+                print(f"{state:8} {migration.__name__.rsplit('.', 1)[-1]}")
+        else:
+            print(__doc__)
+            return 2
+    finally:
+        await engine.dispose()
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "upgrade")))
@@ -0,0 +1,114 @@
+"""
+Schema operations for migrations
+
+Every operation checks the live schema first, so re-running a migration that
+was interrupted (or applied by hand) is a no-op. They take the synchronous
+connection a migration's upgrade() receives.
+"""
+from typing import List
+
+from sqlalchemy import Column, MetaData, Table, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+def has_table(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(col["name"] == column for col in inspect(conn).get_columns(table))
+
+def has_index(conn: Connection, table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspect(conn).get_indexes(table))
+
+def create_table(conn: Connection, table: Table):
+    """Create a table (and its indexes) unless it exists"""
+    table.create(conn, checkfirst=True)
+
+def add_column(conn: Connection, table: str, column: Column):
+    """
+    Add a column unless it exists
+
+    SQLite can only ALTER TABLE ADD COLUMN when the column is nullable or has
+    a constant default and isn't a key; anything else is done by rebuilding
+    the table with the column added.
+    """
+    if has_column(conn, table, column.name):
+        return
+
+    if conn.dialect.name == "sqlite" and not _sqlite_can_add(column):
+        target = _reflect(conn, table)
+        target.append_column(column)
+        rebuild_table(conn, target)
+        return
+
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {_quote(conn, table)} ADD COLUMN {ddl}"))
+
+def _sqlite_can_add(column: Column) -> bool:
+    if column.primary_key or column.unique:
+        return False
+    if column.server_default is None:
+        return column.nullable
+    return True
+
+def create_index(conn: Connection, name: str, table: str, columns: List[str], unique: bool = False):
+    """
+    Create an index unless it exists
+
+    On PostgreSQL the index is built CONCURRENTLY so writes aren't blocked,
+    which requires the migration to run outside a transaction (transactional
+    = False). A concurrent build that failed leaves an invalid index behind;
+    it is dropped and rebuilt.
+    """
+    columns_sql = ", ".join(_quote(conn, column) for column in columns)
+    unique_sql = "UNIQUE " if unique else ""
+
+    if conn.dialect.name == "postgresql":
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {_quote(conn, name)}"))
+        conn.execute(text(
+            f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {_quote(conn, name)} "
+            f"ON {_quote(conn, table)} ({columns_sql})"
+        ))
+        return
+
+    if has_index(conn, table, name):
+        return
+    conn.execute(text(f"CREATE {unique_sql}INDEX {_quote(conn, name)} ON {_quote(conn, table)} ({columns_sql})"))
+
+def rebuild_table(conn: Connection, target: Table):
+    """
+    Rebuild a SQLite table into a new definition (batch mode)
+
+    Creates the new table alongside the old one, copies the rows of columns
+    the two share, then swaps them and recreates the indexes, all inside the
+    migration's transaction, so readers see either the old table or the new
+    one. Foreign keys are not enforced on our connections, so dropping the
+    old table doesn't cascade.
+    """
+    name = target.name
+    temp_name = f"_{name}_rebuild"
+    existing = {col["name"] for col in inspect(conn).get_columns(name)}
+    shared = ", ".join(_quote(conn, col.name) for col in target.columns if col.name in existing)
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {_quote(conn, temp_name)}"))
+    create_sql = str(CreateTable(target).compile(dialect=conn.dialect)).strip()
+    prefix = f"CREATE TABLE {_quote(conn, name)}"
+    conn.execute(text(f"CREATE TABLE {_quote(conn, temp_name)}" + create_sql[len(prefix):]))
+    conn.execute(text(
+        f"INSERT INTO {_quote(conn, temp_name)} ({shared}) SELECT {shared} FROM {_quote(conn, name)}"
+    ))
+    conn.execute(text(f"DROP TABLE {_quote(conn, name)}"))
+    conn.execute(text(f"ALTER TABLE {_quote(conn, temp_name)} RENAME TO {_quote(conn, name)}"))
+    for index in target.indexes:
+        conn.execute(CreateIndex(index))
+
+def _reflect(conn: Connection, table: str) -> Table:
+    return Table(table, MetaData(), autoload_with=conn)
+
+def _quote(conn: Connection, name: str) -> str:
+    return conn.dialect.identifier_preparer.quote(name)
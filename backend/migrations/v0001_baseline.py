@@ -0,0 +1,11 @@
+"""Tables of the original schema (databases created by init_db already have them)"""
+from sqlalchemy.engine import Connection
+
+from models import Base
+from migrations.ops import create_table
+
+TABLES = ["llm_providers", "sessions", "session_llms", "messages", "consensus_points"]
+
+def upgrade(conn: Connection):
+    for name in TABLES:
+        create_table(conn, Base.metadata.tables[name])
@@ -0,0 +1,8 @@
+"""Last time a provider was used in a session (was add_last_used_at.py)"""
+from sqlalchemy import Column, DateTime
+from sqlalchemy.engine import Connection
+
+from migrations.ops import add_column
+
+def upgrade(conn: Connection):
+    add_column(conn, "llm_providers", Column("last_used_at", DateTime, nullable=True))
@@ -0,0 +1,8 @@
+"""Streaming latency per message"""
+from sqlalchemy import Column, Float
+from sqlalchemy.engine import Connection
+
+from migrations.ops import add_column
+
+def upgrade(conn: Connection):
+    add_column(conn, "messages", Column("time_to_first_token_ms", Float, nullable=True))
@@ -0,0 +1,9 @@
+"""Sequential/parallel rounds and the parallel round deadline"""
+from sqlalchemy import Column, Float, String
+from sqlalchemy.engine import Connection
+
+from migrations.ops import add_column
+
+def upgrade(conn: Connection):
+    add_column(conn, "sessions", Column("round_mode", String(20), server_default="sequential"))
+    add_column(conn, "sessions", Column("round_timeout_seconds", Float, nullable=True))
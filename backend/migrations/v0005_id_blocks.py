@@ -0,0 +1,8 @@
+"""ID blocks reserved by the message sink"""
+from sqlalchemy.engine import Connection
+
+from models import Base
+from migrations.ops import create_table
+
+def upgrade(conn: Connection):
+    create_table(conn, Base.metadata.tables["id_blocks"])
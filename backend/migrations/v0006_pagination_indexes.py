@@ -0,0 +1,11 @@
+"""Composite indexes used by keyset pagination"""
+from sqlalchemy.engine import Connection
+
+from migrations.ops import create_index
+
+# Build concurrently on PostgreSQL so writes continue meanwhile
+transactional = False
+
+def upgrade(conn: Connection):
+    create_index(conn, "ix_messages_session_id_created_at_id", "messages", ["session_id", "created_at", "id"])
+    create_index(conn, "ix_sessions_created_at_id", "sessions", ["created_at", "id"])
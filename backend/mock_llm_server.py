@@ -0,0 +1,134 @@
+"""
+Mock LLM server - a local OpenAI-compatible endpoint for load testing
+
+Serves /v1/models and /v1/chat/completions (plain and streamed) from a
+MockProvider, so any OpenAI-compatible provider type can be pointed at it
+through api_base, and the real SDK, HTTP pool and rate limiting are
+exercised without network access or API keys.
+
+Usage:
+    python mock_llm_server.py [--port 8100] [--options "ttft_ms=200&tokens_per_s=80&failure_rate=0.02"]
+
+then configure a provider (e.g. type "openai") with api_base
+http://127.0.0.1:8100/v1 and any API key. --options takes the same query
+string as a "mock" provider's api_base (see llm_providers.MockConfig).
+"""
+import json
+import time
+import uuid
+import argparse
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from llm_providers import MockProvider
+
+def create_app(options: str = "") -> FastAPI:
+    """Create the stub server app; options is a MockConfig query string"""
+    app = FastAPI(title="Mock LLM server")
+    providers: Dict[str, MockProvider] = {}
+    
+    def provider_for(model: str) -> MockProvider:
+        # One provider per model name, so different models answer differently
+        if model not in providers:
+            providers[model] = MockProvider("", model, f"mock://local?{options}")
+        return providers[model]
+    
+    def error_response(provider: MockProvider, message: str) -> JSONResponse:
+        return JSONResponse(
+            status_code=provider.config.failure_status,
+            content={"error": {"message": message, "type": "mock_error", "code": None}}
+        )
+    
+    @app.get("/v1/models")
+    async def list_models():
+        models = list(providers) or ["mock"]
+        return {"object": "list", "data": [{"id": model, "object": "model", "owned_by": "mock"} for model in models]}
+    
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "mock")
+        provider = provider_for(model)
+        messages = [{"role": m["role"], "content": m.get("content") or ""} for m in body["messages"]]
+        max_tokens = body.get("max_tokens") or 2000
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        
+        if not body.get("stream"):
+            response = await provider.generate_response(messages, body.get("temperature", 0.7), max_tokens)
+            if response.error:
+                return error_response(provider, response.error)
+            completion_tokens = len(response.content.split())
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": response.content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": response.tokens_used - completion_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": response.tokens_used
+                }
+            }
+        
+        stream = provider.stream_response(messages, body.get("temperature", 0.7), max_tokens)
+        first = await stream.__anext__()
+        # A failure before the first token is an HTTP error, like the real APIs
+        if first.done and first.response.error:
+            return error_response(provider, first.response.error)
+        
+        def frame(delta: Optional[dict], finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if usage:
+                chunk["usage"] = usage
+            return f"data: {json.dumps(chunk)}\n\n"
+        
+        async def events():
+            chunk = first
+            yield frame({"role": "assistant", "content": ""})
+            while True:
+                if chunk.done:
+                    response = chunk.response
+                    if response.error:
+                        # Midstream failure, reported the way the APIs do inside a stream
+                        yield f"data: {json.dumps({'error': {'message': response.error, 'type': 'mock_error', 'code': None}})}\n\n"
+                        return
+                    completion_tokens = len(response.content.split())
+                    yield frame({}, "stop")
+                    yield frame(None, usage={
+                        "prompt_tokens": response.tokens_used - completion_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": response.tokens_used
+                    })
+                    yield "data: [DONE]\n\n"
+                    return
+                yield frame({"content": chunk.delta})
+                chunk = await stream.__anext__()
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+    
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--options", default="", help="MockConfig query string, e.g. ttft_ms=200&tokens_per_s=80")
+    args = parser.parse_args()
+    
+    uvicorn.run(create_app(args.options), host=args.host, port=args.port)
@@ -1,15 +1,17 @@
 """
 Database models for SynapseMind
 """
+import os
 from datetime import datetime
 from enum import Enum as PyEnum
 from typing import Optional, List
 from sqlalchemy import (
     Column, Integer, String, Float, Boolean, DateTime, 
-    Text, ForeignKey, Enum, JSON, create_engine
+    Text, ForeignKey, Enum, JSON, Index, create_engine, event
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
 Base = declarative_base()
@@ -25,6 +27,10 @@ class MessageRole(str, PyEnum):
     ASSISTANT = "assistant"
     SYSTEM = "system"
 
+class RoundMode(str, PyEnum):
+    SEQUENTIAL = "sequential"  # LLMs speak one after another
+    PARALLEL = "parallel"  # LLMs answer the same round snapshot concurrently
+
 class LLMProvider(Base):
     """LLM Provider configuration and status"""
     __tablename__ = "llm_providers"
@@ -81,6 +87,8 @@ class Session(Base):
     current_round = Column(Integer, default=0)
     temperature = Column(Float, default=0.7)
     max_tokens = Column(Integer, default=2000)
+    round_mode = Column(String(20), default=RoundMode.SEQUENTIAL.value)
+    round_timeout_seconds = Column(Float, nullable=True)  # Per-round deadline (parallel mode)
     
     # Session status
     is_active = Column(Boolean, default=True)
@@ -96,6 +104,11 @@ class Session(Base):
     # Relationships
     llms = relationship("LLMProvider", secondary="session_llms", back_populates="sessions")
     messages = relationship("Message", back_populates="session", order_by="Message.created_at")
+    
+    __table_args__ = (
+        # Keyset pagination of the session list, newest first
+        Index("ix_sessions_created_at_id", "created_at", "id"),
+    )
 
 class SessionLLM(Base):
     """Many-to-many relationship between Session and LLMProvider"""
@@ -127,6 +140,7 @@ class Message(Base):
     thinking_content = Column(Text, nullable=True)  # Chain of thought
     tokens_used = Column(Integer, nullable=True)
     response_time_ms = Column(Float, nullable=True)
+    time_to_first_token_ms = Column(Float, nullable=True)
     
     # Consensus tracking
     sentiment = Column(String(20), nullable=True)  # positive, negative, neutral
@@ -138,6 +152,11 @@ class Message(Base):
     # Relationships
     session = relationship("Session", back_populates="messages")
     llm = relationship("LLMProvider", back_populates="messages")
+    
+    __table_args__ = (
+        # A session's messages in order, for keyset pagination
+        Index("ix_messages_session_id_created_at_id", "session_id", "created_at", "id"),
+    )
 
 class ConsensusPoint(Base):
     """Track consensus points during discussion"""
@@ -157,16 +176,83 @@ class ConsensusPoint(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     resolved_at = Column(DateTime, nullable=True)
 
+class IdBlock(Base):
+    """High-water mark for IDs handed out in blocks (e.g. by the message sink)"""
+    __tablename__ = "id_blocks"
+    
+    name = Column(String(50), primary_key=True)  # Table the IDs are for
+    next_id = Column(Integer, nullable=False)  # First ID not yet reserved
+
+class SystemCounter(Base):
+    """Running total kept up to date on write, so reading it doesn't scan a table"""
+    __tablename__ = "system_counters"
+    
+    name = Column(String(50), primary_key=True)  # e.g. "messages"
+    value = Column(Integer, nullable=False, default=0)
+
 # Database setup
-DATABASE_URL = "sqlite+aiosqlite:///./synapsemind.db"
+# Default to a file next to this module so the DB doesn't depend on the CWD
+DEFAULT_DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synapsemind.db")
+DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite+aiosqlite:///{DEFAULT_DATABASE_PATH}")
+
+# SQLite profile, applied to every new connection. WAL lets API reads run
+# alongside the health checker's and sessions' writes; busy_timeout makes a
+# writer wait for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),  # Negative = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+# Connection pool sizing (ignored for in-memory SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+def create_db_engine(url: str = DATABASE_URL, apply_profile: bool = True):
+    """
+    Create the async engine for a database URL
+    
+    Args:
+        url: SQLAlchemy database URL
+        apply_profile: Apply SQLITE_PRAGMAS and pool sizing (False gives
+            SQLAlchemy's defaults, e.g. for benchmarking)
+    """
+    if not apply_profile:
+        return create_async_engine(url, echo=False)
+    
+    options = {"echo": False}
+    if ":memory:" not in url:
+        # aiosqlite defaults to NullPool, paying for a new connection (and
+        # thread) per checkout; keep a sized pool of them instead
+        options.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT
+        )
+    db_engine = create_async_engine(url, **options)
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return db_engine
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_db_engine()
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 async def init_db():
-    """Initialize database tables"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Bring the database schema up to date by applying pending migrations"""
+    # Imported here: migrations import the models
+    from migrations import run_migrations
+    await run_migrations(engine)
 
 async def get_db():
     """Dependency to get database session"""
@@ -0,0 +1,258 @@
+"""
+Provider metrics - rolling latency/success stats from real traffic, flushed to the DB in batches
+"""
+import math
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+
+from models import LLMProvider, async_session_maker
+from llm_providers import LLMResponse
+
+logger = logging.getLogger(__name__)
+
+class LatencyHistogram:
+    """Sparse log-scale histogram; bucket bounds grow by 10%, so percentiles are within ~5%"""
+
+    GROWTH = 1.1
+    _LOG_GROWTH = math.log(GROWTH)
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+
+    @classmethod
+    def bucket(cls, value_ms: float) -> int:
+        return int(math.log(max(value_ms, 1.0)) / cls._LOG_GROWTH)
+
+    @classmethod
+    def bucket_value(cls, bucket: int) -> float:
+        """Midpoint of a bucket"""
+        return cls.GROWTH ** (bucket + 0.5)
+
+    def record(self, value_ms: float):
+        bucket = self.bucket(value_ms)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+
+    def merge(self, other: "LatencyHistogram"):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = self.total * percentile / 100
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return self.bucket_value(bucket)
+        return self.bucket_value(max(self.counts))
+
+class _Slice:
+    """Outcomes of one time slice of the rolling window"""
+
+    __slots__ = ("started_at", "successes", "failures", "latency", "first_token")
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.successes = 0
+        self.failures = 0
+        self.latency = LatencyHistogram()
+        self.first_token = LatencyHistogram()
+
+class ProviderStats:
+    """Rolling window of outcomes for one provider"""
+
+    def __init__(self, window_seconds: float, slice_seconds: float, ewma_alpha: float):
+        self.window_seconds = window_seconds
+        self.slice_seconds = slice_seconds
+        self.ewma_alpha = ewma_alpha
+        self.slices: List[_Slice] = []
+        self.ewma_latency_ms: Optional[float] = None
+        self.ewma_queue_wait_ms: Optional[float] = None
+        self.last_success_at: Optional[float] = None  # monotonic
+        self.last_failure_at: Optional[float] = None  # monotonic
+        self.last_used_at: Optional[datetime] = None
+        self.dirty = False
+
+    def _current_slice(self) -> _Slice:
+        now = time.monotonic()
+        if not self.slices or now - self.slices[-1].started_at >= self.slice_seconds:
+            self.slices.append(_Slice(now))
+        # Drop slices that fell out of the window
+        while now - self.slices[0].started_at >= self.window_seconds:
+            self.slices.pop(0)
+        return self.slices[-1]
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return self.ewma_alpha * value + (1 - self.ewma_alpha) * current
+
+    def record(self, response: Optional[LLMResponse]):
+        current = self._current_slice()
+        self.last_used_at = datetime.utcnow()
+        self.dirty = True
+
+        if response is None or response.error:
+            current.failures += 1
+            self.last_failure_at = time.monotonic()
+            return
+
+        current.successes += 1
+        self.last_success_at = time.monotonic()
+        current.latency.record(response.response_time_ms)
+        self.ewma_latency_ms = self._ewma(self.ewma_latency_ms, response.response_time_ms)
+        if response.time_to_first_token_ms is not None:
+            current.first_token.record(response.time_to_first_token_ms)
+        self.ewma_queue_wait_ms = self._ewma(self.ewma_queue_wait_ms, response.queue_wait_ms)
+
+    def snapshot(self) -> dict:
+        self._current_slice()
+        latency = LatencyHistogram()
+        first_token = LatencyHistogram()
+        successes = failures = 0
+        for window_slice in self.slices:
+            successes += window_slice.successes
+            failures += window_slice.failures
+            latency.merge(window_slice.latency)
+            first_token.merge(window_slice.first_token)
+
+        total = successes + failures
+        return {
+            "requests": total,
+            "successes": successes,
+            "failures": failures,
+            "success_rate": 100.0 * successes / total if total else None,
+            "ewma_latency_ms": self.ewma_latency_ms,
+            "p50_latency_ms": latency.percentile(50),
+            "p95_latency_ms": latency.percentile(95),
+            "p99_latency_ms": latency.percentile(99),
+            "p50_first_token_ms": first_token.percentile(50),
+            "p95_first_token_ms": first_token.percentile(95),
+            "ewma_queue_wait_ms": self.ewma_queue_wait_ms,
+            "last_used_at": self.last_used_at.isoformat() if self.last_used_at else None
+        }
+
+class ProviderMetrics:
+    """Per-provider rolling metrics fed by every generate call in BrainstormEngine"""
+
+    def __init__(self, window_seconds: float = 900, slice_seconds: float = 60,
+                 ewma_alpha: float = 0.2, flush_interval: float = 30):
+        """
+        Initialize provider metrics
+
+        Args:
+            window_seconds: Length of the rolling window for rates and percentiles
+            slice_seconds: Granularity at which old outcomes leave the window
+            ewma_alpha: Weight of the newest sample in the latency EWMA
+            flush_interval: Seconds between batched writes to llm_providers
+        """
+        self.window_seconds = window_seconds
+        self.slice_seconds = slice_seconds
+        self.ewma_alpha = ewma_alpha
+        self.flush_interval = flush_interval
+        self._stats: Dict[int, ProviderStats] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def _get(self, provider_id: int) -> ProviderStats:
+        stats = self._stats.get(provider_id)
+        if stats is None:
+            stats = ProviderStats(self.window_seconds, self.slice_seconds, self.ewma_alpha)
+            self._stats[provider_id] = stats
+        return stats
+
+    def record(self, provider_id: int, response: LLMResponse):
+        """Record the outcome of a real request"""
+        self._get(provider_id).record(response)
+
+    def record_failure(self, provider_id: int):
+        """Record a request that failed without a response (exception, deadline)"""
+        self._get(provider_id).record(None)
+
+    def served_recently(self, provider_id: int, within_seconds: float) -> bool:
+        """Whether the provider answered real traffic successfully within the last N seconds,
+        with no failure since"""
+        stats = self._stats.get(provider_id)
+        if not stats or stats.last_success_at is None:
+            return False
+        if stats.last_failure_at is not None and stats.last_failure_at > stats.last_success_at:
+            return False
+        return time.monotonic() - stats.last_success_at <= within_seconds
+
+    def has_data(self, provider_id: int) -> bool:
+        stats = self._stats.get(provider_id)
+        return bool(stats and stats.ewma_latency_ms is not None)
+
+    def snapshot(self, provider_id: int) -> Optional[dict]:
+        stats = self._stats.get(provider_id)
+        return stats.snapshot() if stats else None
+
+    def snapshot_all(self) -> Dict[int, dict]:
+        return {provider_id: stats.snapshot() for provider_id, stats in self._stats.items()}
+
+    def remove(self, provider_id: int):
+        self._stats.pop(provider_id, None)
+
+    async def flush(self):
+        """Write avg_response_time, success_rate and last_used_at for providers with new data"""
+        dirty = [(provider_id, stats) for provider_id, stats in self._stats.items() if stats.dirty]
+        if not dirty:
+            return
+
+        # Cleared up front so updates made while the write is in flight mark the stats again,
+        # and restored if the write doesn't commit
+        for _, stats in dirty:
+            stats.dirty = False
+        try:
+            async with async_session_maker() as db:
+                for provider_id, stats in dirty:
+                    snapshot = stats.snapshot()
+                    values = {"last_used_at": stats.last_used_at}
+                    if stats.ewma_latency_ms is not None:
+                        values["avg_response_time"] = stats.ewma_latency_ms
+                    if snapshot["success_rate"] is not None:
+                        values["success_rate"] = snapshot["success_rate"]
+                    await db.execute(update(LLMProvider).where(LLMProvider.id == provider_id).values(**values))
+                await db.commit()
+        except BaseException:
+            for _, stats in dirty:
+                stats.dirty = True
+            raise
+
+    async def run(self):
+        """Periodically flush metrics to the database"""
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error flushing provider metrics: {str(e)}")
+
+    def start(self):
+        """Start the periodic flush as a background task"""
+        if not self.task:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the periodic flush and write out what is left"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+# Global provider metrics instance
+provider_metrics = ProviderMetrics()
@@ -0,0 +1,235 @@
+"""
+Per-provider rate limiting - token buckets and an in-flight cap per LLMProvider
+"""
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+# Defaults when LLMProvider.config doesn't set a limit (0 = unlimited)
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("PROVIDER_REQUESTS_PER_MINUTE", "0"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("PROVIDER_TOKENS_PER_MINUTE", "0"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("PROVIDER_MAX_IN_FLIGHT", "8"))
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``per_minute / 60`` per second
+
+    The bucket may go into debt when actual usage exceeds what was reserved;
+    later callers then wait for the debt to be paid back.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def resize(self, per_minute: int):
+        """Change the limit, keeping what has been used (and any debt)"""
+        self._refill()
+        self.tokens = min(float(per_minute), self.tokens + per_minute - self.capacity)
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until ``amount`` can be consumed"""
+        self._refill()
+        # A request bigger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class RateLimitPermit:
+    """Grant to make one request; reports how long the caller queued"""
+
+    def __init__(self, limiter: "ProviderLimiter", reserved_tokens: int, wait_ms: float):
+        self.limiter = limiter
+        self.reserved_tokens = reserved_tokens
+        self.wait_ms = wait_ms
+        self.used_tokens: Optional[int] = None
+
+    def record_usage(self, tokens_used: int):
+        """Settle the token reservation against what the request actually used"""
+        self.used_tokens = tokens_used
+
+class ProviderLimiter:
+    """Requests/min, tokens/min and max in-flight limits for one provider
+
+    Waiters are served first come, first served: the queue lock is held while
+    a waiter sleeps for capacity, so later callers can't overtake it. Limits
+    can be changed in place (update_limits) without losing the buckets'
+    state or the count of requests in flight.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, max_in_flight: int = 0):
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
+        self.max_in_flight = 0
+        self._requests: Optional[TokenBucket] = None
+        self._tokens: Optional[TokenBucket] = None
+        # Set whenever a request finishes; only the waiter holding the queue lock waits on it
+        self._slot_freed = asyncio.Event()
+        self._queue = asyncio.Lock()
+        self.update_limits(requests_per_minute, tokens_per_minute, max_in_flight)
+
+        # Stats
+        self.waiting = 0
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def update_limits(self, requests_per_minute: int, tokens_per_minute: int, max_in_flight: int):
+        """Apply new limits; 0 means unlimited"""
+        self._requests = self._resized(self._requests, requests_per_minute)
+        self._tokens = self._resized(self._tokens, tokens_per_minute)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_in_flight = max_in_flight
+        # A raised cap may let the head waiter through
+        self._slot_freed.set()
+
+    @staticmethod
+    def _resized(bucket: Optional[TokenBucket], per_minute: int) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute)
+        if bucket.capacity != per_minute:
+            bucket.resize(per_minute)
+        return bucket
+
+    def _has_slot(self) -> bool:
+        return self.max_in_flight <= 0 or self.in_flight < self.max_in_flight
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self._slot_freed.set()
+
+    def _time_until(self, tokens: int) -> float:
+        wait = 0.0
+        if self._requests:
+            wait = max(wait, self._requests.time_until(1))
+        if self._tokens:
+            wait = max(wait, self._tokens.time_until(tokens))
+        return wait
+
+    @asynccontextmanager
+    async def acquire(self, estimated_tokens: int = 0) -> AsyncIterator[RateLimitPermit]:
+        """Wait for capacity, then hold an in-flight slot for the duration of the block"""
+        start_time = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._queue:
+                while not self._has_slot():
+                    self._slot_freed.clear()
+                    await self._slot_freed.wait()
+                self.in_flight += 1
+                try:
+                    wait = self._time_until(estimated_tokens)
+                    while wait > 0:
+                        await asyncio.sleep(wait)
+                        wait = self._time_until(estimated_tokens)
+                except BaseException:
+                    self._release_slot()
+                    raise
+                if self._requests:
+                    self._requests.consume(1)
+                if self._tokens:
+                    self._tokens.consume(estimated_tokens)
+        finally:
+            self.waiting -= 1
+
+        wait_ms = (time.monotonic() - start_time) * 1000
+        self.total_requests += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+        permit = RateLimitPermit(self, estimated_tokens, wait_ms)
+        try:
+            yield permit
+        finally:
+            self._release_slot()
+            if self._tokens and permit.used_tokens is not None:
+                difference = permit.used_tokens - permit.reserved_tokens
+                if difference > 0:
+                    self._tokens.consume(difference)
+                elif difference < 0:
+                    self._tokens.refund(-difference)
+
+    def stats(self) -> dict:
+        return {
+            "requests_per_minute": self.requests_per_minute or None,
+            "tokens_per_minute": self.tokens_per_minute or None,
+            "max_in_flight": self.max_in_flight or None,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "total_requests": self.total_requests,
+            "avg_queue_wait_ms": self.total_wait_ms / self.total_requests if self.total_requests else 0.0,
+            "max_queue_wait_ms": self.max_wait_ms
+        }
+
+def _limits_from_config(config: Optional[dict]) -> tuple:
+    config = config or {}
+    return (
+        int(config.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE) or 0),
+        int(config.get("tokens_per_minute", DEFAULT_TOKENS_PER_MINUTE) or 0),
+        int(config.get("max_concurrency", DEFAULT_MAX_IN_FLIGHT) or 0),
+    )
+
+class RateLimiter:
+    """Shared limiters keyed by LLMProvider.id
+
+    Limits come from ``LLMProvider.config`` (``requests_per_minute``,
+    ``tokens_per_minute``, ``max_concurrency``). There is one limiter per
+    provider for the life of the process. The config passed to get() and
+    acquire() only seeds a new limiter, since running sessions hold a
+    snapshot that may be stale; limits change through update(), with the
+    config as stored.
+    """
+
+    def __init__(self):
+        self._limiters: Dict[int, ProviderLimiter] = {}
+
+    def get(self, provider_id: int, config: Optional[dict] = None) -> ProviderLimiter:
+        limiter = self._limiters.get(provider_id)
+        if limiter is None:
+            limiter = self._limiters[provider_id] = ProviderLimiter(*_limits_from_config(config))
+        return limiter
+
+    def update(self, provider_id: int, config: Optional[dict]):
+        """Apply a provider's stored config to its limiter in place"""
+        limits = _limits_from_config(config)
+        limiter = self._limiters.get(provider_id)
+        if limiter is None:
+            self._limiters[provider_id] = ProviderLimiter(*limits)
+        elif (limiter.requests_per_minute, limiter.tokens_per_minute, limiter.max_in_flight) != limits:
+            limiter.update_limits(*limits)
+
+    def acquire(self, provider_id: int, config: Optional[dict] = None, estimated_tokens: int = 0):
+        """Async context manager granting one request to a provider"""
+        return self.get(provider_id, config).acquire(estimated_tokens)
+
+    def remove(self, provider_id: int):
+        self._limiters.pop(provider_id, None)
+
+    def stats(self) -> Dict[int, dict]:
+        return {provider_id: limiter.stats() for provider_id, limiter in self._limiters.items()}
+
+# Global rate limiter instance
+rate_limiter = RateLimiter()
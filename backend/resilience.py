@@ -0,0 +1,425 @@
+"""
+Resilience layer for LLM providers - retries, hedged requests and circuit breakers
+"""
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from llm_providers import BaseLLMProvider, LLMResponse, LLMStreamChunk, QuotaInfo
+from context_builder import estimate_tokens
+from rate_limiter import ProviderLimiter
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+RETRYABLE_ERROR_TYPES = ("Timeout", "Connection", "ServiceUnavailable", "ResourceExhausted", "InternalServerError")
+
+def is_retryable(response: LLMResponse) -> bool:
+    """Whether a failed response is worth retrying (429, 5xx, timeouts, dropped connections)"""
+    if not response.error:
+        return False
+    if response.error_status is not None:
+        return response.error_status in RETRYABLE_STATUSES or response.error_status >= 500
+    error_type = response.error_type or ""
+    return any(name in error_type for name in RETRYABLE_ERROR_TYPES)
+
+def is_provider_failure(response: LLMResponse) -> bool:
+    """Whether a failed response counts against the provider's circuit breaker
+
+    Retryable failures and failures without an HTTP status (transport errors,
+    broken streams) do; other 4xx answers (bad request, bad key, unknown
+    model) come from one caller's request, and the provider answered them.
+    """
+    if not response.error:
+        return False
+    return response.error_status is None or is_retryable(response)
+
+@dataclass
+class RetryPolicy:
+    """Retry/hedging settings, read from LLMProvider.config"""
+    max_retries: int = 2
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    hedge: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "RetryPolicy":
+        config = config or {}
+        policy = cls()
+        for field in ("max_retries", "base_delay", "max_delay", "hedge", "hedge_percentile",
+                      "hedge_min_samples", "breaker_failure_threshold", "breaker_reset_seconds"):
+            if field in config:
+                setattr(policy, field, type(getattr(policy, field))(config[field]))
+        return policy
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+class CircuitState:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one provider
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    calls fail fast. After ``reset_seconds`` a single trial call is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, provider_id: int, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 on_state_change: Optional[Callable[[int, str], None]] = None):
+        self.provider_id = provider_id
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.on_state_change = on_state_change
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        logger.info(f"Circuit breaker for provider {self.provider_id} is now {state}")
+        if self.on_state_change:
+            self.on_state_change(self.provider_id, state)
+
+    def allow_request(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self._set_state(CircuitState.HALF_OPEN)
+        if self.state == CircuitState.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+        self._set_state(CircuitState.CLOSED)
+
+    def abandon(self):
+        """Forget a call that was cancelled before it finished"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == CircuitState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(CircuitState.OPEN)
+
+class LatencyTracker:
+    """Recent successful latencies, used to pick the hedging delay"""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def record(self, latency_ms: float):
+        self.samples.append(latency_ms)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+def _circuit_open_response() -> LLMResponse:
+    # error_status stays None and the type isn't retryable, so this never loops
+    return LLMResponse(content="", error="Circuit breaker open: provider is failing, request not sent",
+                       error_type="CircuitOpen")
+
+class ResilientProvider(BaseLLMProvider):
+    """Wraps a provider with retries, optional hedging and a circuit breaker
+
+    With a limiter, every request sent - each retry attempt and each hedge
+    leg - waits for its own rate limit permit, and gives it back before any
+    backoff sleep.
+    """
+
+    def __init__(self, inner: BaseLLMProvider, breaker: CircuitBreaker, latency: LatencyTracker,
+                 first_token_latency: LatencyTracker, policy: RetryPolicy,
+                 limiter: Optional[ProviderLimiter] = None):
+        super().__init__(inner.api_key, inner.model_name, inner.api_base)
+        self.inner = inner
+        self.breaker = breaker
+        self.latency = latency
+        self.first_token_latency = first_token_latency
+        self.policy = policy
+        self.limiter = limiter
+
+    def _hedge_delay(self, tracker: LatencyTracker) -> Optional[float]:
+        """Seconds to wait before sending a hedged second request, None if hedging is off"""
+        if not self.policy.hedge or len(tracker.samples) < self.policy.hedge_min_samples:
+            return None
+        threshold = tracker.percentile(self.policy.hedge_percentile)
+        return threshold / 1000 if threshold else None
+
+    def _record(self, response: LLMResponse):
+        if is_provider_failure(response):
+            self.breaker.record_failure()
+        elif response.error:
+            # The provider is up and rejected this request; that says nothing about the others
+            self.breaker.record_success()
+        else:
+            self.breaker.record_success()
+            self.latency.record(response.response_time_ms)
+            if response.time_to_first_token_ms is not None:
+                self.first_token_latency.record(response.time_to_first_token_ms)
+
+    @staticmethod
+    def _estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+        """Tokens to reserve for one request: the prompt plus the whole completion budget"""
+        return sum(estimate_tokens(m["content"]) for m in messages) + max_tokens
+
+    async def _limited_generate(self, messages, temperature, max_tokens) -> LLMResponse:
+        """One request to the inner provider, under its own permit"""
+        if self.limiter is None:
+            return await self.inner.generate_response(messages, temperature, max_tokens)
+        async with self.limiter.acquire(self._estimate_tokens(messages, max_tokens)) as permit:
+            response = await self.inner.generate_response(messages, temperature, max_tokens)
+            if response.tokens_used:
+                permit.record_usage(response.tokens_used)
+        response.queue_wait_ms = permit.wait_ms
+        return response
+
+    async def _limited_stream(self, messages, temperature, max_tokens) -> AsyncIterator[LLMStreamChunk]:
+        """One stream from the inner provider, holding its own permit until the stream ends"""
+        if self.limiter is None:
+            async for chunk in self.inner.stream_response(messages, temperature, max_tokens):
+                yield chunk
+            return
+        async with self.limiter.acquire(self._estimate_tokens(messages, max_tokens)) as permit:
+            async for chunk in self.inner.stream_response(messages, temperature, max_tokens):
+                if chunk.done and chunk.response is not None:
+                    chunk.response.queue_wait_ms = permit.wait_ms
+                    if chunk.response.tokens_used:
+                        permit.record_usage(chunk.response.tokens_used)
+                yield chunk
+
+    async def generate_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> LLMResponse:
+        response = None
+        for attempt in range(self.policy.max_retries + 1):
+            if not self.breaker.allow_request():
+                return response or _circuit_open_response()
+
+            try:
+                response = await self._hedged_generate(messages, temperature, max_tokens)
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            self._record(response)
+            if not is_retryable(response) or attempt == self.policy.max_retries:
+                return response
+
+            logger.info(f"Retrying {self.model_name} after {response.error_status or response.error_type} "
+                        f"(attempt {attempt + 1}/{self.policy.max_retries})")
+            await asyncio.sleep(self.policy.backoff(attempt))
+        return response
+
+    async def _hedged_generate(self, messages, temperature, max_tokens) -> LLMResponse:
+        hedge_delay = self._hedge_delay(self.latency)
+        primary = asyncio.create_task(self._limited_generate(messages, temperature, max_tokens))
+        if hedge_delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.create_task(self._limited_generate(messages, temperature, max_tokens))
+        pending = {primary, hedge}
+        response = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                response = task.result()
+                if not response.error:
+                    for other in pending:
+                        other.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    return response
+        return response
+
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> AsyncIterator[LLMStreamChunk]:
+        response = None
+        for attempt in range(self.policy.max_retries + 1):
+            if not self.breaker.allow_request():
+                response = response or _circuit_open_response()
+                break
+
+            streamed_any = False
+            response = None
+            try:
+                async for chunk in self._hedged_stream(messages, temperature, max_tokens):
+                    if chunk.done:
+                        response = chunk.response
+                    else:
+                        streamed_any = True
+                        yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.abandon()
+                raise
+
+            if response is None:
+                response = LLMResponse(content="", error="Provider stream ended without a final response")
+            self._record(response)
+
+            # Text already reached viewers, so a failed stream can't be replayed
+            if streamed_any or not is_retryable(response) or attempt == self.policy.max_retries:
+                break
+
+            logger.info(f"Retrying {self.model_name} stream after {response.error_status or response.error_type} "
+                        f"(attempt {attempt + 1}/{self.policy.max_retries})")
+            await asyncio.sleep(self.policy.backoff(attempt))
+
+        yield LLMStreamChunk(done=True, response=response)
+
+    async def _hedged_stream(self, messages, temperature, max_tokens) -> AsyncIterator[LLMStreamChunk]:
+        """Stream from the inner provider, racing a second stream if the first chunk is slow
+
+        Whichever stream produces a usable first chunk first wins; the other is
+        abandoned before anything from it is forwarded.
+        """
+        hedge_delay = self._hedge_delay(self.first_token_latency)
+        primary = self._limited_stream(messages, temperature, max_tokens)
+        if hedge_delay is None:
+            async for chunk in primary:
+                yield chunk
+            return
+
+        streams = {asyncio.ensure_future(primary.__anext__()): primary}
+        done, _ = await asyncio.wait(streams, timeout=hedge_delay)
+        if not done:
+            hedge = self._limited_stream(messages, temperature, max_tokens)
+            streams[asyncio.ensure_future(hedge.__anext__())] = hedge
+
+        winner = None
+        first_chunk = None
+        pending = set(streams)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    continue
+                failed = chunk.done and chunk.response and chunk.response.error
+                if winner is None and (not failed or not pending):
+                    winner, first_chunk = streams[task], chunk
+                elif first_chunk is None:
+                    first_chunk = chunk
+
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for stream in streams.values():
+            if stream is not winner:
+                await stream.aclose()
+
+        if first_chunk is not None:
+            yield first_chunk
+        if winner is not None and not first_chunk.done:
+            async for chunk in winner:
+                yield chunk
+
+    async def test_connection(self) -> tuple[bool, Optional[QuotaInfo], float]:
+        return await self.inner.test_connection()
+
+class ResilienceRegistry:
+    """Per-provider circuit breakers and latency trackers, keyed by LLMProvider.id"""
+
+    def __init__(self):
+        self._breakers: Dict[int, CircuitBreaker] = {}
+        self._latency: Dict[int, LatencyTracker] = {}
+        self._first_token_latency: Dict[int, LatencyTracker] = {}
+        self._status_tasks: set = set()
+
+    def breaker(self, provider_id: int, policy: Optional[RetryPolicy] = None) -> CircuitBreaker:
+        """A provider's breaker; its thresholds are only changed when a policy is passed"""
+        breaker = self._breakers.get(provider_id)
+        if breaker is None:
+            breaker = CircuitBreaker(provider_id, on_state_change=self._on_state_change)
+            self._breakers[provider_id] = breaker
+        if policy is not None:
+            breaker.failure_threshold = policy.breaker_failure_threshold
+            breaker.reset_seconds = policy.breaker_reset_seconds
+        return breaker
+
+    def wrap(self, provider_id: int, provider: BaseLLMProvider, config: Optional[dict] = None,
+             limiter: Optional[ProviderLimiter] = None) -> ResilientProvider:
+        """
+        Wrap a provider with the resilience policy from its config
+
+        Args:
+            provider_id: LLMProvider.id the breaker and latency stats belong to
+            provider: Provider to wrap
+            config: LLMProvider.config holding the retry policy
+            limiter: Rate limiter every attempt and hedge must get a permit from
+        """
+        policy = RetryPolicy.from_config(config)
+        return ResilientProvider(
+            provider,
+            self.breaker(provider_id, policy),
+            self._latency.setdefault(provider_id, LatencyTracker()),
+            self._first_token_latency.setdefault(provider_id, LatencyTracker()),
+            policy,
+            limiter
+        )
+
+    def remove(self, provider_id: int):
+        self._breakers.pop(provider_id, None)
+        self._latency.pop(provider_id, None)
+        self._first_token_latency.pop(provider_id, None)
+
+    def _on_state_change(self, provider_id: int, state: str):
+        # Reflect the breaker in LLMProvider.status right away instead of
+        # waiting for the next health check
+        if state == CircuitState.HALF_OPEN:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._persist_status(provider_id, state))
+        except RuntimeError:
+            return
+        self._status_tasks.add(task)
+        task.add_done_callback(self._status_tasks.discard)
+
+    async def _persist_status(self, provider_id: int, state: str):
+        from models import LLMProvider, LLMProviderStatus, async_session_maker
+
+        status = LLMProviderStatus.ERROR if state == CircuitState.OPEN else LLMProviderStatus.ONLINE
+        try:
+            async with async_session_maker() as db:
+                provider = await db.get(LLMProvider, provider_id)
+                if provider and provider.status != status:
+                    provider.status = status
+                    await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to update status of provider {provider_id}: {e}")
+
+# Global resilience registry instance
+resilience = ResilienceRegistry()
@@ -18,6 +18,10 @@ class MessageRole(str, Enum):
     ASSISTANT = "assistant"
     SYSTEM = "system"
 
+class RoundMode(str, Enum):
+    SEQUENTIAL = "sequential"
+    PARALLEL = "parallel"
+
 # LLM Provider Schemas
 class LLMProviderBase(BaseModel):
     name: str
@@ -92,6 +96,7 @@ class MessageResponse(MessageBase):
     thinking_content: Optional[str]
     tokens_used: Optional[int]
     response_time_ms: Optional[float]
+    time_to_first_token_ms: Optional[float] = None
     created_at: datetime
     
     class Config:
@@ -105,6 +110,8 @@ class SessionBase(BaseModel):
     max_rounds: int = 10
     temperature: float = 0.7
     max_tokens: int = 2000
+    round_mode: RoundMode = RoundMode.SEQUENTIAL
+    round_timeout_seconds: Optional[float] = Field(default=None, gt=0)
 
 class SessionCreate(SessionBase):
     llm_ids: List[int]
@@ -172,9 +179,12 @@ class WSMessageType(str, Enum):
     NEW_MESSAGE = "new_message"
     LLM_TYPING = "llm_typing"
     LLM_STOPPED_TYPING = "llm_stopped_typing"
+    LLM_TOKEN_DELTA = "llm_token_delta"
     CONSENSUS_UPDATE = "consensus_update"
     ROUND_UPDATE = "round_update"
     SESSION_COMPLETED = "session_completed"
+    RESYNC = "resync"
+    PARTICIPANTS = "participants"
     ERROR = "error"
 
 class WebSocketMessage(BaseModel):
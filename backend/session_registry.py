@@ -0,0 +1,60 @@
+"""
+Session registry - process-wide in-memory state of active brainstorm sessions
+"""
+from typing import Dict, Iterator, Optional
+
+class SessionRegistry:
+    """Shared session_id -> session state map
+
+    Every BrainstormEngine, the HTTP handlers and the WebSocket handler see the
+    same state, so a stop request reaches the engine that is driving the
+    session. All methods are synchronous and never await, which makes each of
+    them atomic on the event loop without a lock.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[int, dict] = {}
+
+    def get(self, session_id: int) -> Optional[dict]:
+        return self._sessions.get(session_id)
+
+    def setdefault(self, session_id: int, session_state: dict) -> dict:
+        """Register a session's state unless one exists; return the registered state"""
+        return self._sessions.setdefault(session_id, session_state)
+
+    def remove(self, session_id: int) -> Optional[dict]:
+        """Forget a session; return its state if it was registered"""
+        return self._sessions.pop(session_id, None)
+
+    def stop(self, session_id: int) -> bool:
+        """Mark a session as stopped so its engine ends it after the current turn
+
+        Returns:
+            True if the session was registered and running
+        """
+        session_state = self._sessions.get(session_id)
+        if not session_state or not session_state["is_running"]:
+            return False
+        session_state["is_running"] = False
+        return True
+
+    def __contains__(self, session_id: int) -> bool:
+        return session_id in self._sessions
+
+    def __getitem__(self, session_id: int) -> dict:
+        return self._sessions[session_id]
+
+    def __setitem__(self, session_id: int, session_state: dict):
+        self._sessions[session_id] = session_state
+
+    def __delitem__(self, session_id: int):
+        del self._sessions[session_id]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._sessions))
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+# Global session registry instance
+session_registry = SessionRegistry()
@@ -0,0 +1,204 @@
+"""
+Session scheduler - track, cap and control running brainstorm sessions
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+class SessionRunState:
+    QUEUED = "queued"  # Waiting for a free slot
+    RUNNING = "running"
+    PAUSED = "paused"
+    STOPPING = "stopping"  # Cancellation requested, finishing the current turn
+
+class SessionRun:
+    """Control handle for one running session
+
+    Cancellation and pausing are cooperative: the engine calls
+    ``checkpoint()`` between turns, which blocks while paused and tells the
+    engine whether to carry on.
+    """
+
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+        self.task: Optional[asyncio.Task] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self._started = False
+        self._cancelled = asyncio.Event()
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def is_paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    @property
+    def state(self) -> str:
+        if self.is_cancelled:
+            return SessionRunState.STOPPING
+        if not self._started:
+            return SessionRunState.QUEUED
+        if self.is_paused:
+            return SessionRunState.PAUSED
+        return SessionRunState.RUNNING
+
+    def cancel(self):
+        """Ask the session to stop after the current turn"""
+        self._cancelled.set()
+        # Wake up a paused session so it can notice the cancellation
+        self._resumed.set()
+
+    def pause(self):
+        """Hold the session before its next turn"""
+        if not self.is_cancelled:
+            self._resumed.clear()
+
+    def resume(self):
+        """Let a paused session continue"""
+        self._resumed.set()
+
+    async def checkpoint(self) -> bool:
+        """Wait while paused; return False once the session should stop"""
+        await self._resumed.wait()
+        return not self.is_cancelled
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "state": self.state,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None
+        }
+
+class SessionScheduler:
+    """Registry of running session tasks with a per-process concurrency cap"""
+
+    def __init__(self, max_concurrent_sessions: int = 20):
+        """
+        Initialize the scheduler
+
+        Args:
+            max_concurrent_sessions: Sessions allowed to run at once; further
+                sessions are queued until a slot frees up
+        """
+        self.max_concurrent_sessions = max_concurrent_sessions
+        self._slots = asyncio.Semaphore(max_concurrent_sessions)
+        self._runs: Dict[int, SessionRun] = {}
+
+    def start(self, session_id: int, runner: Callable[[SessionRun], Awaitable[None]]) -> SessionRun:
+        """
+        Schedule a session to run
+
+        Args:
+            session_id: Session to run
+            runner: Coroutine function that drives the session, given its SessionRun
+
+        Returns:
+            The SessionRun handle
+
+        Raises:
+            ValueError: If the session is already scheduled
+        """
+        if session_id in self._runs:
+            raise ValueError(f"Session {session_id} is already running")
+
+        run = SessionRun(session_id)
+        self._runs[session_id] = run
+        run.task = asyncio.create_task(self._run(run, runner))
+        return run
+
+    async def _run(self, run: SessionRun, runner: Callable[[SessionRun], Awaitable[None]]):
+        try:
+            async with self._slots:
+                if run.is_cancelled:
+                    return
+                run._started = True
+                run.started_at = datetime.utcnow()
+                await runner(run)
+        except asyncio.CancelledError:
+            logger.info(f"Session {run.session_id} task cancelled")
+            raise
+        except Exception as e:
+            logger.exception(f"Session {run.session_id} failed: {e}")
+        finally:
+            if self._runs.get(run.session_id) is run:
+                del self._runs[run.session_id]
+
+    def get(self, session_id: int) -> Optional[SessionRun]:
+        """Get the run handle for a session, if it is scheduled"""
+        return self._runs.get(session_id)
+
+    def list_runs(self) -> List[SessionRun]:
+        return list(self._runs.values())
+
+    def count_by_state(self) -> Dict[str, int]:
+        """Number of scheduled sessions in each SessionRunState"""
+        counts = dict.fromkeys(
+            (SessionRunState.QUEUED, SessionRunState.RUNNING, SessionRunState.PAUSED, SessionRunState.STOPPING), 0
+        )
+        for run in self._runs.values():
+            counts[run.state] += 1
+        return counts
+
+    def cancel(self, session_id: int) -> bool:
+        """Request a session to stop; returns False if it isn't scheduled"""
+        run = self._runs.get(session_id)
+        if not run:
+            return False
+        run.cancel()
+        return True
+
+    def pause(self, session_id: int) -> bool:
+        """Pause a session before its next turn; returns False if it isn't scheduled"""
+        run = self._runs.get(session_id)
+        if not run:
+            return False
+        run.pause()
+        return True
+
+    def resume(self, session_id: int) -> bool:
+        """Resume a paused session; returns False if it isn't scheduled"""
+        run = self._runs.get(session_id)
+        if not run:
+            return False
+        run.resume()
+        return True
+
+    async def shutdown(self, timeout: float = 10.0):
+        """Cancel all sessions, waiting up to ``timeout`` seconds for them to wind down"""
+        runs = list(self._runs.values())
+        if not runs:
+            return
+
+        for run in runs:
+            run.cancel()
+        tasks = [run.task for run in runs if run.task]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+
+        # Hard-cancel whatever is still stuck in a provider call
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+# Global session scheduler instance
+session_scheduler = SessionScheduler(
+    max_concurrent_sessions=int(os.getenv("MAX_CONCURRENT_SESSIONS", "20"))
+)
+
+Gauge(
+    "synapsemind_sessions",
+    "Scheduled brainstorm sessions by state",
+    ["state"],
+    callback=lambda: {(state,): count for state, count in session_scheduler.count_by_state().items()}
+)
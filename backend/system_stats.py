@@ -0,0 +1,108 @@
+"""
+System stats - dashboard counts from one query, cached in memory
+"""
+import os
+import time
+import asyncio
+from typing import Optional
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session as OrmSession
+
+from models import (
+    LLMProvider, LLMProviderStatus, Session, SystemCounter, async_session_maker
+)
+
+# SystemCounter row holding the number of messages written
+MESSAGES_COUNTER = "messages"
+
+class SystemStatsCache:
+    """Serves the numbers behind GET /api/stats
+
+    Sessions and providers are small tables, so they are counted directly;
+    the message total comes from a counter the message sink increments,
+    so polling never scans the messages table. All five numbers come from
+    a single query whose result is kept for ttl seconds, or until a commit
+    changes one of them. Invalidation is per process; other workers'
+    changes show up once the TTL expires.
+    """
+
+    def __init__(self, ttl: float = 5.0):
+        """
+        Initialize stats cache
+
+        Args:
+            ttl: Seconds a result is served before it is recomputed
+        """
+        self.ttl = ttl
+        self._stats: Optional[dict] = None
+        self._expires_at = 0.0
+        # Bumped on invalidation, so a query that started before it isn't cached
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """Drop the cached result; the next get() queries again"""
+        self._stats = None
+        self._generation += 1
+
+    async def get(self) -> dict:
+        if self._stats is not None and time.monotonic() < self._expires_at:
+            return self._stats
+
+        # One query at a time; concurrent pollers share its result
+        async with self._lock:
+            if self._stats is not None and time.monotonic() < self._expires_at:
+                return self._stats
+            generation = self._generation
+            stats = await self._query()
+            if generation == self._generation:
+                self._stats = stats
+                self._expires_at = time.monotonic() + self.ttl
+            return stats
+
+    async def _query(self) -> dict:
+        def count(model, *criteria):
+            return select(func.count(model.id)).where(*criteria).scalar_subquery()
+
+        query = select(
+            count(Session).label("total_sessions"),
+            count(Session, Session.is_active == True).label("active_sessions"),
+            func.coalesce(
+                select(SystemCounter.value)
+                .where(SystemCounter.name == MESSAGES_COUNTER)
+                .scalar_subquery(),
+                0
+            ).label("total_messages"),
+            count(LLMProvider).label("total_llms"),
+            count(LLMProvider, LLMProvider.status == LLMProviderStatus.ONLINE).label("online_llms")
+        )
+        async with async_session_maker() as db:
+            row = (await db.execute(query)).one()
+        return dict(row._mapping)
+
+# Global stats cache instance
+system_stats = SystemStatsCache(ttl=float(os.getenv("STATS_CACHE_TTL", "5")))
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_stats_changes(session, flush_context):
+    """Note ORM changes that move the counts; the cache is dropped on commit"""
+    for instance in session.new | session.deleted:
+        if isinstance(instance, (Session, LLMProvider)):
+            session.info["stats_changed"] = True
+            return
+    for instance in session.dirty:
+        if isinstance(instance, Session):
+            attribute = "is_active"
+        elif isinstance(instance, LLMProvider):
+            attribute = "status"
+        else:
+            continue
+        if getattr(inspect(instance).attrs, attribute).history.has_changes():
+            session.info["stats_changed"] = True
+            return
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("stats_changed", False):
+        system_stats.invalidate()
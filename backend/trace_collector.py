@@ -0,0 +1,76 @@
+"""
+Trace collector - a local stand-in for an OpenTelemetry collector
+
+Accepts OTLP/HTTP JSON at /v1/traces (what TRACE_EXPORTER=otlp sends),
+appends every span to a JSON lines file and prints a one-line summary per
+round, so exported traces can be checked without running a real collector.
+
+Usage:
+    python trace_collector.py [--port 4318] [--output collected_traces.jsonl]
+
+then start the backend with TRACE_EXPORTER=otlp (the default
+TRACE_OTLP_ENDPOINT, http://localhost:4318/v1/traces, points here).
+"""
+import json
+import argparse
+
+from fastapi import FastAPI, Request
+
+def _attribute_value(value: dict):
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+def create_app(output: str) -> FastAPI:
+    """Create the collector app, writing spans to the output file"""
+    app = FastAPI(title="Trace collector")
+
+    @app.post("/v1/traces")
+    async def receive_traces(request: Request):
+        payload = await request.json()
+        lines = []
+        for resource_spans in payload.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    attributes = {
+                        attribute["key"]: _attribute_value(attribute["value"])
+                        for attribute in span.get("attributes", [])
+                    }
+                    start_ns, end_ns = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+                    lines.append({
+                        "trace_id": span["traceId"],
+                        "span_id": span["spanId"],
+                        "parent_id": span.get("parentSpanId"),
+                        "name": span["name"],
+                        "start_ns": start_ns,
+                        "end_ns": end_ns,
+                        "attributes": attributes,
+                        "error": span.get("status", {}).get("message")
+                    })
+                    if not span.get("parentSpanId"):
+                        print(
+                            f"session {attributes.get('session.id')} round {attributes.get('round')}: "
+                            f"{(end_ns - start_ns) / 1e6:.0f} ms"
+                        )
+
+        with open(output, "a") as f:
+            for line in lines:
+                f.write(json.dumps(line) + "\n")
+        # An empty ExportTraceServiceResponse
+        return {}
+
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OTLP/HTTP JSON trace collector")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default="collected_traces.jsonl", help="JSON lines file spans are appended to")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.output), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,348 @@
+"""
+Tracing - span trees for brainstorm rounds, kept in memory and exported in batches
+
+Each sampled round of a session (5% by default, see TRACE_SAMPLE_RATE) is
+one trace: a root "round" span with child spans for every turn (context
+building, the provider call, queueing the message, broadcasts, the pause
+between speakers) and for the batched database flush. Spans nest through
+a context variable, so code under a span opens children with
+``tracer.span(name)`` without passing anything around, including tasks
+started inside it. Outside a sampled round ``span()`` returns a shared
+no-op, so unsampled rounds cost a context variable read per span.
+
+Finished traces are kept per session for GET /api/sessions/{id}/trace and,
+if an exporter is configured, written out every few seconds as JSON lines
+or OTLP/HTTP JSON.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value):
+        """Attach an attribute (ids, token counts, ...)"""
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": _known(self.attributes),
+            "error": self.error
+        }
+
+def _known(attributes: dict) -> dict:
+    """Attributes without the unset ones (e.g. no first token time on an error)"""
+    return {key: value for key, value in attributes.items() if value is not None}
+
+class Trace:
+    """Spans of one sampled round, in start order"""
+
+    __slots__ = ("trace_id", "session_id", "spans")
+
+    def __init__(self, session_id: int):
+        self.trace_id = os.urandom(16).hex()
+        self.session_id = session_id
+        self.spans: List[Span] = []
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def waterfall(self) -> dict:
+        """Spans with their depth and offsets from the start of the round"""
+        root = self.root
+        depths = {root.span_id: 0}
+        spans = []
+        for span in self.spans:
+            depth = depths[span.span_id] = depths.get(span.parent_id, -1) + 1
+            end_ns = span.end_ns if span.end_ns is not None else root.end_ns
+            spans.append({
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "depth": depth,
+                "offset_ms": round((span.start_ns - root.start_ns) / 1e6, 3),
+                "duration_ms": round((end_ns - span.start_ns) / 1e6, 3),
+                "attributes": span.attributes,
+                "error": span.error
+            })
+        return {
+            "trace_id": self.trace_id,
+            "round": root.attributes.get("round"),
+            "started_at": root.start_ns / 1e9,
+            "duration_ms": round(root.duration_ms, 3),
+            "spans": spans
+        }
+
+class _SpanScope:
+    """Makes a span current for the duration of a with block"""
+
+    __slots__ = ("span", "tracer", "_token")
+
+    def __init__(self, span: Span, tracer: "Tracer"):
+        self.span = span
+        self.tracer = tracer
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.end_ns = time.time_ns()
+        if exc_type is not None:
+            span.error = "cancelled" if exc_type is asyncio.CancelledError else f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        if span.parent_id is None:
+            self.tracer._finish(span.trace)
+        return False
+
+class _NoopSpan:
+    """Stands in for spans of unsampled rounds"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key: str, value):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class JSONLExporter:
+    """Appends one JSON object per span to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def export(self, traces: List[Trace]):
+        lines = "".join(
+            json.dumps({"session_id": trace.session_id, **span.to_dict()}, default=str) + "\n"
+            for trace in traces for span in trace.spans
+        )
+        await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: str):
+        with open(self.path, "a") as f:
+            f.write(lines)
+
+    async def close(self):
+        pass
+
+class OTLPExporter:
+    """Posts traces to an OpenTelemetry collector's OTLP/HTTP JSON endpoint"""
+
+    def __init__(self, endpoint: str, service_name: str = "synapsemind-backend"):
+        import httpx
+
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self._client = httpx.AsyncClient(timeout=10)
+
+    async def export(self, traces: List[Trace]):
+        response = await self._client.post(self.endpoint, json=self.encode(traces))
+        response.raise_for_status()
+
+    def encode(self, traces: List[Trace]) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "synapsemind.tracing"},
+                "spans": [
+                    self._encode_span(span, trace)
+                    for trace in traces for span in trace.spans
+                ]
+            }]
+        }]}
+
+    def _encode_span(self, span: Span, trace: Trace) -> dict:
+        attributes = {"session.id": trace.session_id, **_known(span.attributes)}
+        encoded = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    async def close(self):
+        await self._client.aclose()
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+def create_exporter(kind: str):
+    """Build the exporter named by TRACE_EXPORTER: "jsonl", "otlp" or "" for none"""
+    if kind == "jsonl":
+        return JSONLExporter(os.getenv("TRACE_JSONL_PATH", "traces.jsonl"))
+    if kind == "otlp":
+        return OTLPExporter(os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"))
+    if kind:
+        raise ValueError(f"Unknown TRACE_EXPORTER: {kind}")
+    return None
+
+class Tracer:
+    """Samples rounds, collects their spans and hands finished traces on"""
+
+    def __init__(self, sample_rate: float = 0.05, keep_traces: int = 20, max_sessions: int = 256,
+                 exporter=None, export_interval: float = 5.0, max_pending: int = 1000):
+        """
+        Initialize tracer
+
+        Args:
+            sample_rate: Fraction of rounds traced (0 disables tracing)
+            keep_traces: Recent traces kept in memory per session
+            max_sessions: Sessions whose traces are kept, least recently traced dropped first
+            exporter: JSONLExporter, OTLPExporter or None to keep traces in memory only
+            export_interval: Seconds between exports
+            max_pending: Traces buffered for export; older ones are dropped if the exporter falls behind
+        """
+        self.sample_rate = sample_rate
+        self.keep_traces = keep_traces
+        self.max_sessions = max_sessions
+        self.exporter = exporter
+        self.export_interval = export_interval
+        self._recent: "OrderedDict[int, Deque[Trace]]" = OrderedDict()
+        self._pending: Deque[Trace] = deque(maxlen=max_pending)
+        self.task: Optional[asyncio.Task] = None
+
+    def start_trace(self, name: str, session_id: int, **attributes):
+        """Open a root span, if this one is sampled"""
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return _NOOP_SPAN
+        trace = Trace(session_id)
+        span = Span(trace, name, None, attributes)
+        trace.spans.append(span)
+        return _SpanScope(span, self)
+
+    def span(self, name: str, **attributes):
+        """Open a child of the current span; a no-op outside a sampled trace"""
+        parent = _current_span.get()
+        if parent is None:
+            return _NOOP_SPAN
+        span = Span(parent.trace, name, parent.span_id, attributes)
+        parent.trace.spans.append(span)
+        return _SpanScope(span, self)
+
+    def current_span(self):
+        """The innermost open span, for attaching attributes (a no-op span if none)"""
+        return _current_span.get() or _NOOP_SPAN
+
+    def _finish(self, trace: Trace):
+        recent = self._recent.get(trace.session_id)
+        if recent is None:
+            recent = self._recent[trace.session_id] = deque(maxlen=self.keep_traces)
+            while len(self._recent) > self.max_sessions:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(trace.session_id)
+        recent.append(trace)
+        if self.exporter is not None:
+            self._pending.append(trace)
+
+    def recent(self, session_id: int, limit: int) -> List[Trace]:
+        """A session's most recent traces, oldest first"""
+        recent = self._recent.get(session_id)
+        if not recent:
+            return []
+        return list(recent)[-limit:]
+
+    async def flush(self):
+        """Export the traces finished since the last flush"""
+        if self.exporter is None or not self._pending:
+            return
+        traces = list(self._pending)
+        self._pending.clear()
+        await self.exporter.export(traces)
+
+    async def run(self):
+        """Periodically export finished traces"""
+        while True:
+            try:
+                await asyncio.sleep(self.export_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error exporting traces: {str(e)}")
+
+    def start(self):
+        """Start the periodic export as a background task"""
+        if self.exporter is not None and not self.task:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the periodic export and export what is left"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.exporter is not None:
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error exporting traces: {str(e)}")
+            await self.exporter.close()
+
+# Global tracer instance
+tracer = Tracer(
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.05")),
+    keep_traces=int(os.getenv("TRACE_KEEP_ROUNDS", "20")),
+    exporter=create_exporter(os.getenv("TRACE_EXPORTER", ""))
+)
@@ -1,24 +1,292 @@
 """
 WebSocket connection manager for real-time communication
 """
+import os
 import json
+import time
 import asyncio
-from typing import Dict, List, Set
-from datetime import datetime
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, List, Optional, Set, Tuple, Union
+from datetime import datetime, timezone
+import msgpack
 from fastapi import WebSocket, WebSocketDisconnect
 from schemas import WebSocketMessage, WSMessageType
+from broadcast_backend import BroadcastBackend, InProcessBroadcastBackend, create_broadcast_backend
+from metrics import Gauge, ws_evictions, ws_fanout_seconds
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds a single send may take before the socket is considered too slow and evicted
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Frames that may wait for one connection before it is disconnected
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "512"))
+# Recent events kept per session for replay on reconnect, and sessions kept
+EVENT_LOG_SIZE = int(os.getenv("WS_EVENT_LOG_SIZE", "1000"))
+EVENT_LOG_SESSIONS = int(os.getenv("WS_EVENT_LOG_SESSIONS", "256"))
+
+# Close code and reason for evicted connections; informational only, the client
+# catches up through last_seq replay (or a resync event) when it reconnects
+RESYNC_CLOSE_CODE = 4000
+RESYNC_REASON = "resync"
+
+# Wire encodings a client can ask for with ?encoding=
+ENCODINGS = ("json", "msgpack")
+
+def encode_message(message: dict) -> str:
+    """Serialize a message once so it can be sent to every recipient as text"""
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+def decode_message(text: str) -> dict:
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def _timestamp_ms(value: str) -> Optional[int]:
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() * 1000)
+
+def compact_message(message: dict, participants: Optional[Dict[int, dict]] = None) -> bytes:
+    """
+    Encode a message as a compact MessagePack frame
+    
+    The envelope uses short keys (t, d, s, ts) with one integer timestamp in
+    ms; the duplicate timestamp inside data is dropped, and so are
+    llm_name/llm_brand_color when they match the participant table the client
+    already holds.
+    
+    Args:
+        message: Message as sent to JSON clients
+        participants: llm_id -> {"name", "brand_color"} known to the client
+    """
+    data = message.get("data")
+    if isinstance(data, dict):
+        data = {key: value for key, value in data.items() if key != "timestamp"}
+        known = participants.get(data.get("llm_id")) if participants else None
+        if known and known == {"name": data.get("llm_name"), "brand_color": data.get("llm_brand_color")}:
+            del data["llm_name"]
+            del data["llm_brand_color"]
+    
+    frame = {"t": message["type"], "d": data}
+    if "seq" in message:
+        frame["s"] = message["seq"]
+    timestamp = _timestamp_ms(message.get("timestamp"))
+    if timestamp is not None:
+        frame["ts"] = timestamp
+    return msgpack.packb(frame)
+
+def stamp_seq(body: str, seq: int) -> str:
+    """Insert the sequence number into an encoded message object"""
+    return f'{{"seq":{seq},{body[1:]}'
+
+class SessionEventLog:
+    """Ring buffer of a session's recent events, in sequence order
+    
+    Sequence numbers come from the broadcast backend. They start from the
+    clock (in ms) rather than zero, so they keep increasing across restarts
+    and a client resuming against a fresh log finds its last_seq outside it
+    and is told to resync.
+    """
+    
+    def __init__(self, size: int):
+        self.last_seq = 0
+        # (seq, coalesce key, encoded frame)
+        self.events: Deque[Tuple[int, Optional[Hashable], str]] = deque(maxlen=size)
+        # Participant metadata interned for msgpack clients: llm_id -> {"name", "brand_color"}
+        self.participants: Dict[int, dict] = {}
+    
+    def learn_participant(self, message: dict):
+        data = message.get("data")
+        if message.get("type") == WSMessageType.NEW_MESSAGE and isinstance(data, dict) and data.get("llm_name"):
+            self.participants[data["llm_id"]] = {
+                "name": data["llm_name"],
+                "brand_color": data.get("llm_brand_color")
+            }
+    
+    def append(self, seq: int, coalesce_key: Optional[Hashable], text: str):
+        self.last_seq = max(self.last_seq, seq)
+        self.events.append((seq, coalesce_key, text))
+    
+    def since(self, last_seq: int) -> Optional[List[Tuple[int, Optional[Hashable], str]]]:
+        """Events after last_seq, oldest first; None if some have already been dropped"""
+        if last_seq > self.last_seq:
+            return None
+        if last_seq == self.last_seq:
+            return []
+        if not self.events or self.events[0][0] > last_seq + 1:
+            return None
+        
+        missed = []
+        for event in reversed(self.events):
+            if event[0] <= last_seq:
+                break
+            missed.append(event)
+        missed.reverse()
+        return missed
+
+class ConnectionWriter:
+    """Bounded outbound queue for one WebSocket, drained by its own writer task
+    
+    Frames sent with a coalesce key replace any still-queued frame with the
+    same key: only the latest value is delivered, at the position of the
+    latest update, so it can't overtake the events it follows.
+    """
+    
+    def __init__(self, websocket: WebSocket, max_queue: int, send_timeout: float, encoding: str = "json"):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.encoding = encoding
+        # (coalesce key, generation, frame); superseded entries are skipped when drained
+        self._queue: Deque[Tuple[Optional[Hashable], int, Union[str, bytes]]] = deque()
+        self._latest: Dict[Hashable, int] = {}
+        self._generation = 0
+        self._ready = asyncio.Event()
+        self._stopped = False
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def queue_depth(self) -> int:
+        """Frames waiting, including superseded ones not yet dropped"""
+        return len(self._queue)
+    
+    def start(self, on_failure):
+        self.task = asyncio.create_task(self._run(on_failure))
+    
+    def stop(self):
+        self._stopped = True
+        if self.task and self.task is not asyncio.current_task():
+            self.task.cancel()
+    
+    def put(self, frame: Union[str, bytes], coalesce_key: Optional[Hashable] = None) -> bool:
+        """Queue a frame; returns False if the queue is full"""
+        if len(self._queue) >= self.max_queue:
+            self._compact()
+            if len(self._queue) >= self.max_queue:
+                return False
+        
+        self._generation += 1
+        if coalesce_key is not None:
+            self._latest[coalesce_key] = self._generation
+        self._queue.append((coalesce_key, self._generation, frame))
+        self._ready.set()
+        return True
+    
+    def offer(self, frame: Union[str, bytes]) -> bool:
+        """Queue a frame that may be lost, only while half the queue is free for the rest"""
+        if len(self._queue) >= self.max_queue // 2:
+            return False
+        return self.put(frame)
+    
+    def _is_current(self, coalesce_key: Optional[Hashable], generation: int) -> bool:
+        return coalesce_key is None or self._latest.get(coalesce_key) == generation
+    
+    def _compact(self):
+        """Drop superseded entries"""
+        self._queue = deque(entry for entry in self._queue if self._is_current(entry[0], entry[1]))
+    
+    async def _run(self, on_failure):
+        """Send queued frames until stopped; ending any other way evicts the connection"""
+        try:
+            await self._drain()
+        except asyncio.CancelledError:
+            if self._stopped:
+                raise
+        except Exception:
+            pass
+        on_failure(self.websocket)
+    
+    async def _drain(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue:
+                coalesce_key, generation, frame = self._queue.popleft()
+                if not self._is_current(coalesce_key, generation):
+                    continue
+                if coalesce_key is not None:
+                    del self._latest[coalesce_key]
+                # A timer that cancels this task, rather than wait_for, which
+                # would wrap every send in a task of its own. Wherever its
+                # cancellation lands, _run treats it as a failed connection.
+                timer = asyncio.get_running_loop().call_later(self.send_timeout, self.task.cancel)
+                try:
+                    if isinstance(frame, bytes):
+                        await self.websocket.send_bytes(frame)
+                    else:
+                        await self.websocket.send_text(frame)
+                finally:
+                    timer.cancel()
 
 class ConnectionManager:
-    """Manage WebSocket connections"""
+    """Manage WebSocket connections
     
-    def __init__(self):
+    Broadcasts go through a BroadcastBackend, which numbers them and hands
+    them back to deliver() on every worker process that has viewers.
+    """
+    
+    def __init__(self, send_timeout: float = SEND_TIMEOUT, max_queue: int = SEND_QUEUE_SIZE,
+                 backend: Optional[BroadcastBackend] = None):
         # session_id -> set of WebSocket connections
         self.active_connections: Dict[int, Set[WebSocket]] = {}
         # websocket -> user_info
         self.user_info: Dict[WebSocket, dict] = {}
+        # websocket -> outbound queue and writer task
+        self.writers: Dict[WebSocket, ConnectionWriter] = {}
+        # session_id -> recent events, least recently active session first
+        self.event_logs: "OrderedDict[int, SessionEventLog]" = OrderedDict()
+        self.send_timeout = send_timeout
+        self.max_queue = max_queue
+        self.backend = backend or InProcessBroadcastBackend()
+        self._started = False
+    
+    async def start(self):
+        """Start receiving events from the broadcast backend"""
+        if not self._started:
+            await self.backend.start(self.deliver, on_reset=self.event_logs.clear)
+            self._started = True
     
-    async def connect(self, websocket: WebSocket, session_id: int):
-        """Accept and register a new connection"""
+    async def stop(self):
+        if self._started:
+            await self.backend.stop()
+            self._started = False
+    
+    def _event_log(self, session_id: int) -> SessionEventLog:
+        event_log = self.event_logs.get(session_id)
+        if event_log is None:
+            event_log = self.event_logs[session_id] = SessionEventLog(EVENT_LOG_SIZE)
+            while len(self.event_logs) > EVENT_LOG_SESSIONS:
+                self.event_logs.popitem(last=False)
+        else:
+            self.event_logs.move_to_end(session_id)
+        return event_log
+    
+    async def connect(self, websocket: WebSocket, session_id: int, last_seq: Optional[int] = None,
+                      encoding: str = "json"):
+        """
+        Accept and register a new connection
+        
+        Args:
+            websocket: Incoming connection
+            session_id: Session to subscribe to
+            last_seq: Sequence number of the last event the client saw before
+                reconnecting; missed events are replayed, or a resync event is
+                sent if they are no longer in the log
+            encoding: "json" text frames, or "msgpack" compact binary frames
+                (see compact_message) preceded by the participant table
+        """
         await websocket.accept()
         
         if session_id not in self.active_connections:
@@ -29,6 +297,19 @@ class ConnectionManager:
             "session_id": session_id,
             "connected_at": datetime.utcnow()
         }
+        writer = ConnectionWriter(websocket, self.max_queue, self.send_timeout, encoding)
+        self.writers[websocket] = writer
+        writer.start(self.evict)
+        
+        if encoding == "msgpack":
+            writer.put(compact_message({
+                "type": WSMessageType.PARTICIPANTS,
+                "data": {"participants": self._event_log(session_id).participants}
+            }))
+        
+        # Queued before anything else can be broadcast, so the replay is gapless
+        if last_seq is not None:
+            self._resume(writer, session_id, last_seq)
         
         # Notify others that a user joined
         await self.broadcast_to_session(
@@ -43,6 +324,36 @@ class ConnectionManager:
             }
         )
     
+    def _resume(self, writer: ConnectionWriter, session_id: int, last_seq: int):
+        """Replay the events a reconnecting client missed"""
+        event_log = self._event_log(session_id)
+        missed = event_log.since(last_seq)
+        
+        if missed is not None:
+            # Only the latest state event per key matters
+            latest = {key: seq for seq, key, _ in missed if key is not None}
+            missed = [event for event in missed if event[1] is None or latest[event[1]] == event[0]]
+        
+        if missed is None or len(missed) > self.max_queue:
+            writer.put(self._encode(writer, {
+                "type": WSMessageType.RESYNC,
+                "data": {"seq": event_log.last_seq},
+                "timestamp": datetime.utcnow().isoformat()
+            }))
+            return
+        
+        for _, coalesce_key, text in missed:
+            if writer.encoding == "msgpack":
+                writer.put(compact_message(decode_message(text), event_log.participants), coalesce_key)
+            else:
+                writer.put(text, coalesce_key)
+    
+    @staticmethod
+    def _encode(writer: ConnectionWriter, message: dict) -> Union[str, bytes]:
+        if writer.encoding == "msgpack":
+            return compact_message(message)
+        return encode_message(message)
+    
     def disconnect(self, websocket: WebSocket):
         """Remove a connection"""
         session_id = self.user_info.get(websocket, {}).get("session_id")
@@ -57,28 +368,112 @@ class ConnectionManager:
         if websocket in self.user_info:
             del self.user_info[websocket]
         
+        writer = self.writers.pop(websocket, None)
+        if writer:
+            writer.stop()
+        
         return session_id
     
-    async def broadcast_to_session(self, session_id: int, message: dict):
-        """Broadcast message to all connections in a session"""
-        if session_id not in self.active_connections:
+    async def broadcast_to_session(self, session_id: int, message: dict, coalesce_key: Optional[Hashable] = None):
+        """Broadcast message to all connections in a session
+        
+        The message is encoded once and published through the broadcast
+        backend, which numbers it and delivers it on every worker.
+        
+        Args:
+            session_id: Session to broadcast to
+            message: Message to send
+            coalesce_key: Frames with the same key supersede each other while
+                still queued (state events such as typing or round updates)
+        """
+        if not self._started:
+            await self.start()
+        await self.backend.publish(session_id, encode_message(message), coalesce_key)
+        
+        # Let the writers run before the caller produces the next event
+        await asyncio.sleep(0)
+    
+    async def broadcast_ephemeral(self, session_id: int, message: dict):
+        """Broadcast a high-rate message that later events make redundant (streamed tokens)
+        
+        It gets no sequence number and isn't kept for replay, so it can't push
+        durable events out of the log, and a connection with a backed-up queue
+        skips it instead of being evicted.
+        """
+        if not self._started:
+            await self.start()
+        await self.backend.publish_ephemeral(session_id, encode_message(message))
+        await asyncio.sleep(0)
+    
+    def deliver(self, session_id: int, seq: Optional[int], coalesce_key: Optional[Hashable], body: str):
+        """Record a numbered event in the session's log and queue it on local connections
+        
+        Connections whose queue is full are disconnected with a resync hint.
+        Ephemeral events (seq None) are only queued where there is room.
+        """
+        event_log = self._event_log(session_id)
+        if seq is None:
+            text = body
+        else:
+            text = stamp_seq(body, seq)
+            event_log.append(seq, coalesce_key, text)
+        
+        connections = self.active_connections.get(session_id)
+        if not connections:
             return
         
-        disconnected = []
-        for connection in self.active_connections[session_id]:
-            try:
-                await connection.send_json(message)
-            except Exception:
-                disconnected.append(connection)
+        start = time.perf_counter()
+        # Encoded at most once per encoding, not per recipient
+        packed = None
+        for conn in list(connections):
+            writer = self.writers.get(conn)
+            if writer is None:
+                continue
+            frame = text
+            if writer.encoding == "msgpack":
+                if packed is None:
+                    message = decode_message(text)
+                    packed = compact_message(message, event_log.participants)
+                    event_log.learn_participant(message)
+                frame = packed
+            if seq is None:
+                writer.offer(frame)
+            elif not writer.put(frame, coalesce_key):
+                logger.info(f"WebSocket send queue overflow in session {session_id}")
+                self.evict(conn)
+        ws_fanout_seconds.observe(time.perf_counter() - start)
+    
+    def evict(self, websocket: WebSocket):
+        """Drop a connection that can't keep up and close it in the background
         
-        # Clean up disconnected clients
-        for conn in disconnected:
-            self.active_connections[session_id].discard(conn)
+        The client reconnects with its last seq and gets the missed events
+        replayed, or a resync event if they are no longer in the log.
+        """
+        if websocket not in self.user_info:
+            return
+        session_id = self.disconnect(websocket)
+        ws_evictions.inc()
+        logger.info(f"Evicted slow or closed WebSocket from session {session_id}")
+        asyncio.create_task(self._close(websocket))
+    
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=RESYNC_CLOSE_CODE, reason=RESYNC_REASON),
+                self.send_timeout
+            )
+        except Exception:
+            pass
     
     async def send_to_websocket(self, websocket: WebSocket, message: dict):
         """Send message to a specific websocket"""
+        writer = self.writers.get(websocket)
+        if writer:
+            if not writer.put(self._encode(writer, message)):
+                self.evict(websocket)
+            return
         try:
-            await websocket.send_json(message)
+            await asyncio.wait_for(websocket.send_text(encode_message(message)), self.send_timeout)
         except Exception:
             pass
     
@@ -91,7 +486,24 @@ class ConnectionManager:
         return len(self.active_connections.get(session_id, set()))
 
 # Global connection manager instance
-manager = ConnectionManager()
+manager = ConnectionManager(backend=create_broadcast_backend())
+
+# Read at scrape time
+Gauge(
+    "synapsemind_ws_connections",
+    "Open WebSocket connections",
+    callback=lambda: len(manager.writers)
+)
+Gauge(
+    "synapsemind_ws_send_queue_frames",
+    "Frames waiting in WebSocket send queues, over all connections",
+    callback=lambda: sum(writer.queue_depth for writer in manager.writers.values())
+)
+Gauge(
+    "synapsemind_ws_send_queue_max_frames",
+    "Frames waiting in the longest WebSocket send queue",
+    callback=lambda: max((writer.queue_depth for writer in manager.writers.values()), default=0)
+)
 
 # Helper functions for common message types
 async def notify_new_message(session_id: int, message_data: dict):
@@ -111,7 +523,7 @@ async def notify_llm_typing(session_id: int, llm_id: int, llm_name: str):
             "llm_name": llm_name
         },
         "timestamp": datetime.utcnow().isoformat()
-    })
+    }, coalesce_key=("typing", llm_id))
 
 async def notify_llm_stopped_typing(session_id: int, llm_id: int):
     """Notify that an LLM stopped typing"""
@@ -121,6 +533,17 @@ async def notify_llm_stopped_typing(session_id: int, llm_id: int):
             "llm_id": llm_id
         },
         "timestamp": datetime.utcnow().isoformat()
+    }, coalesce_key=("typing", llm_id))
+
+async def notify_llm_token_delta(session_id: int, llm_id: int, delta: str):
+    """Notify about a streamed chunk of an LLM's in-progress response (best effort, not replayed)"""
+    await manager.broadcast_ephemeral(session_id, {
+        "type": WSMessageType.LLM_TOKEN_DELTA,
+        "data": {
+            "llm_id": llm_id,
+            "delta": delta
+        },
+        "timestamp": datetime.utcnow().isoformat()
     })
 
 async def notify_consensus_update(session_id: int, consensus_data: dict):
@@ -129,7 +552,7 @@ async def notify_consensus_update(session_id: int, consensus_data: dict):
         "type": WSMessageType.CONSENSUS_UPDATE,
         "data": consensus_data,
         "timestamp": datetime.utcnow().isoformat()
-    })
+    }, coalesce_key="consensus")
 
 async def notify_round_update(session_id: int, round_data: dict):
     """Notify about round update"""
@@ -137,7 +560,7 @@ async def notify_round_update(session_id: int, round_data: dict):
         "type": WSMessageType.ROUND_UPDATE,
         "data": round_data,
         "timestamp": datetime.utcnow().isoformat()
-    })
+    }, coalesce_key="round")
 
 async def notify_session_completed(session_id: int, result_data: dict):
     """Notify that session is completed"""